@@ -0,0 +1,88 @@
+"""
+Stream entry formats written by redis_forwarder.py.
+
+Version 1 (``ENTRY_FORMAT=json``, entries without a ``v`` field): the indexed
+fields plus the whole record again as a JSON string in ``payload``.
+
+Version 2 (``ENTRY_FORMAT=compact``): the indexed fields, ``v=2``, ``enc``
+(``msgpack``, ``msgpack+zlib`` or ``msgpack+zstd``), ``m`` and a binary
+``payload``: the record packed with msgpack, minus the indexed fields whose
+values are already stored as fields (``m`` is the bitmask of those, so
+decoding restores exactly the original record). Reading version 2 needs a
+Redis client with ``decode_responses=False``.
+"""
+import json
+import zlib
+
+# Optional: msgpack for the compact format, zstandard for its zstd variant
+try:
+    import msgpack  # pyright: ignore[reportMissingImports]
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard  # pyright: ignore[reportMissingImports]
+except ImportError:
+    zstandard = None
+
+INDEXED_FIELDS = ("event_id", "timestamp", "session_id", "source", "level")
+COMPACT_VERSION = "2"
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def encode_json(fields: dict, record: dict) -> dict:
+    """Version 1 entry"""
+    return dict(fields, payload=json.dumps(record, ensure_ascii=False))
+
+
+def encode_compact(fields: dict, record: dict, compression: str = "none") -> dict:
+    """Version 2 entry; ``compression`` is "none", "zlib" or "zstd" (per entry)"""
+    if msgpack is None:
+        raise ImportError("msgpack package is required for the compact entry format")
+    rest = dict(record)
+    mask = 0
+    for bit, key in enumerate(INDEXED_FIELDS):
+        if key in rest and rest[key] == fields[key]:
+            del rest[key]
+            mask |= 1 << bit
+    body = msgpack.packb(rest, use_bin_type=True)
+    enc = "msgpack"
+    if compression == "zlib":
+        body, enc = zlib.compress(body, 6), "msgpack+zlib"
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard package is required for zstd entry compression")
+        body, enc = zstandard.ZstdCompressor(level=3).compress(body), "msgpack+zstd"
+    return dict(fields, v=COMPACT_VERSION, enc=enc, m=str(mask), payload=body)
+
+
+def decode_entry(fields: dict) -> dict:
+    """Original record of an entry in either format (str or bytes keys/values)"""
+    fields = {_text(key): value for key, value in fields.items()}
+    if _text(fields.get("v", "1")) != COMPACT_VERSION:
+        return json.loads(_text(fields["payload"]))
+    body = fields["payload"]
+    enc = _text(fields["enc"])
+    if enc == "msgpack+zlib":
+        body = zlib.decompress(body)
+    elif enc == "msgpack+zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    record = msgpack.unpackb(body, raw=False)
+    mask = int(_text(fields.get("m", "0")))
+    for bit, key in enumerate(INDEXED_FIELDS):
+        if mask & (1 << bit):
+            record[key] = _text(fields[key])
+    return record
+
+
+def entry_size(fields: dict) -> int:
+    """Bytes of field names and values (what the stream's listpack stores, minus overhead)"""
+    return sum(
+        len(key if isinstance(key, bytes) else str(key).encode("utf-8"))
+        + len(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        for key, value in fields.items()
+    )
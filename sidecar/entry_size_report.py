@@ -0,0 +1,96 @@
+"""
+Bytes per event of the log stream in its current entry format and in each
+format the forwarder can write (see entry_codec.py), measured on a sample of
+the newest entries.
+
+    REDIS_URL=redis://localhost:6379 python entry_size_report.py [stream_key] [sample]
+"""
+import asyncio
+import os
+import sys
+
+import redis.asyncio as aioredis  # pyright: ignore[reportMissingImports]
+
+import entry_codec
+from stream_reader import discover_streams
+
+# field names that are entry metadata rather than indexed fields
+_ENTRY_META = ("payload", "v", "enc", "m")
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def candidate_formats() -> dict:
+    """``{label: encode(fields, record)}`` for every format available here"""
+    formats = {"json": entry_codec.encode_json}
+    if entry_codec.msgpack is not None:
+        for compression in entry_codec.COMPRESSIONS:
+            if compression == "zstd" and entry_codec.zstandard is None:
+                continue
+            label = "msgpack" if compression == "none" else f"msgpack+{compression}"
+            formats[label] = lambda fields, record, compression=compression: entry_codec.encode_compact(
+                fields, record, compression
+            )
+    return formats
+
+
+async def size_report(client, stream_keys: list, sample: int = 1000) -> dict:
+    """
+    Sample up to ``sample`` newest entries across ``stream_keys`` and return
+    average bytes/event (field names and values) as stored and re-encoded in
+    each candidate format, plus the stream length and MEMORY USAGE per key.
+    ``client`` must not decode responses (compact payloads are binary).
+    """
+    per_stream = max(1, sample // len(stream_keys))
+    entries = []
+    streams = []
+    for stream_key in stream_keys:
+        entries.extend(fields for _, fields in await client.xrevrange(stream_key, count=per_stream))
+        try:
+            memory = await client.memory_usage(stream_key)
+        except aioredis.ResponseError:  # MEMORY not available (e.g. restricted command)
+            memory = None
+        streams.append({"stream": stream_key, "length": await client.xlen(stream_key), "memory_bytes": memory})
+
+    formats = candidate_formats()
+    totals = dict.fromkeys(["stored"] + list(formats), 0)
+    for stored in entries:
+        stored = {_text(key): value for key, value in stored.items()}
+        record = entry_codec.decode_entry(stored)
+        fields = {key: _text(value) for key, value in stored.items() if key not in _ENTRY_META}
+        totals["stored"] += entry_codec.entry_size(stored)
+        for label, encode in formats.items():
+            totals[label] += entry_codec.entry_size(encode(fields, record))
+
+    length = sum(stream["length"] for stream in streams)
+    memory = [stream["memory_bytes"] for stream in streams]
+    return {
+        "sampled": len(entries),
+        "bytes_per_event": {label: total / len(entries) if entries else 0 for label, total in totals.items()},
+        "length": length,
+        "memory_bytes_per_event": sum(memory) / length if length and None not in memory else None,
+        "streams": streams,
+    }
+
+
+async def main(stream_key: str, sample: int):
+    client = aioredis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    try:
+        report = await size_report(client, await discover_streams(client, stream_key), sample)
+    finally:
+        await client.close()
+    print(f"{report['sampled']} of {report['length']} entries sampled from {stream_key}")
+    if report["memory_bytes_per_event"] is not None:
+        print(f"{'MEMORY USAGE':<16} {report['memory_bytes_per_event']:>10,.1f} bytes/event (incl. stream overhead)")
+    stored = report["bytes_per_event"]["stored"]
+    for label, size in report["bytes_per_event"].items():
+        change = f"{(size - stored) / stored:+.0%}" if stored else ""
+        print(f"{label:<16} {size:>10,.1f} bytes/event {change:>6}")
+
+
+if __name__ == "__main__":
+    stream_key = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("STREAM_KEY", "logs:stream")
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    asyncio.run(main(stream_key, sample))
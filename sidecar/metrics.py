@@ -0,0 +1,171 @@
+"""
+Prometheus metrics for the sidecar in the text exposition format (0.0.4),
+without a client library: counters, gauges and histograms with labels,
+rendered by ``Registry.render()`` for ``GET /metrics``.
+
+Metrics are per process and updated from the event loop only, so there is no
+locking. Gauges describing Redis are filled in at scrape time. A worker of a
+multi-worker sidecar tells its series apart with ``Registry.labels`` (e.g.
+``worker``) and serves them on a port of its own with ``serve_metrics``.
+"""
+import asyncio
+import bisect
+import math
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic count per label set; ``inc(amount, **labels)``"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def lines(self, extra=()):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key, extra)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Current value per label set; ``clear()`` drops label sets that went away"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def clear(self):
+        self._values.clear()
+
+
+class Histogram:
+    """Observations in cumulative ``buckets`` (upper bounds) per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = sorted(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+ overflow), sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labels))
+        return series[2] if series else 0
+
+    def lines(self, extra=()):
+        extra = tuple(extra)
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + [math.inf], counts):
+                cumulative += bucket
+                le = extra + (("le", _format_value(float(bound))),)
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key, extra)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key, extra)} {count}"
+
+
+class Registry:
+    """``labels`` are added to every series, e.g. ``{"worker": "1"}``"""
+
+    def __init__(self):
+        self.metrics = []
+        self.labels = {}
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets, labels: tuple = ()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labels))
+
+    def render(self) -> str:
+        out = []
+        extra = tuple(self.labels.items())
+        for metric in self.metrics:
+            help_text = metric.help.replace("\\", "\\\\").replace("\n", "\\n")
+            out.append(f"# HELP {metric.name} {help_text}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines(extra))
+        return "\n".join(out) + "\n"
+
+
+async def serve_metrics(render, host: str, ports):
+    """
+    Listen on the first of ``ports`` that is free and answer every HTTP
+    request with ``await render()`` in the text format. Returns
+    ``(server, slot)``, slot being the position of that port in ``ports``, or
+    ``(None, None)`` when none is free. Binding is the claim: a port goes
+    free again when its worker exits, so a replacement takes it over.
+    """
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")  # request line and headers; any request gets the metrics
+            body = (await render()).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    for slot, port in enumerate(ports):
+        try:
+            return await asyncio.start_server(handle, host, port), slot
+        except OSError:
+            continue
+    return None, None
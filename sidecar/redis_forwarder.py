@@ -1,10 +1,19 @@
-from fastapi import FastAPI, Request, HTTPException # pyright: ignore[reportMissingImports]
+from fastapi import FastAPI, Request, HTTPException, Response # pyright: ignore[reportMissingImports]
 import redis.asyncio as aioredis  # pyright: ignore[reportMissingImports] # Top import - no duplicate
 import os
 import uuid
 import json
+import zlib
+import time
+import asyncio
 import datetime
+import importlib.util
 from typing import Optional
+import entry_codec
+from wal import SegmentedWal, WalFull, adopt_orphans, claim_directory, decode_records
+from metrics import CONTENT_TYPE, Registry, serve_metrics
+from dedupe import RedisBloomFilter, RotatingBloomFilter
+from stream_index import StreamIndex, parse_cursor
 import uvicorn  # pyright: ignore[reportMissingImports] # Moved to top - fixes lint warning!
 
 # For type checking only
@@ -16,76 +25,995 @@ else:
 
 app = FastAPI()
 
+
+class MetricsMiddleware:
+    """Counts and times every request by route (pure ASGI, so no per-request task or body copy)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # unknown paths share one label so scanners can't blow up the series count
+        endpoint = scope["path"] if scope["path"] in _ROUTES else "other"
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_total.inc(endpoint=endpoint, status=str(status))
+
+app.add_middleware(MetricsMiddleware)
+
 # Environment variables
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
 STREAM_KEY = os.environ.get("STREAM_KEY", "logs:stream")
 SECRET = os.environ.get("REPLAY_SHARED_TOKEN", "mysecret")
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+# Serving (python redis_forwarder.py): SIDECAR_WORKERS processes share the port
+# through uvicorn's process manager, each with its own Redis connection pool;
+# "auto" picks uvloop and httptools when they are installed
+SIDECAR_HOST = os.environ.get("SIDECAR_HOST", "0.0.0.0")
+SIDECAR_PORT = int(os.environ.get("SIDECAR_PORT", "8200"))
+SIDECAR_WORKERS = max(1, int(os.environ.get("SIDECAR_WORKERS", "1")))
+SIDECAR_LOOP = os.environ.get("SIDECAR_LOOP", "auto")
+SIDECAR_HTTP = os.environ.get("SIDECAR_HTTP", "auto")
+# With several workers each one also serves /metrics, labelled worker="<n>", on
+# port SIDECAR_METRICS_PORT + n (n < SIDECAR_WORKERS); 0 disables
+SIDECAR_METRICS_PORT = int(os.environ.get("SIDECAR_METRICS_PORT", str(SIDECAR_PORT + 1 if SIDECAR_WORKERS > 1 else 0)))
+# Per-worker Redis pool: at most REDIS_MAX_CONNECTIONS connections; a command
+# waits up to REDIS_POOL_TIMEOUT seconds for a free one. Socket timeouts in
+# seconds (0 = none)
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "2"))
+# Server-side micro-batching: XADDs from concurrent requests are collected for
+# up to XADD_LINGER_MS (or XADD_MAX_BATCH entries) and sent as one pipeline
+XADD_LINGER_MS = float(os.environ.get("XADD_LINGER_MS", "1"))
+XADD_MAX_BATCH = int(os.environ.get("XADD_MAX_BATCH", "500"))
+# Retention: approximate MAXLEN on every XADD, plus a background trimmer that
+# drops entries older than STREAM_RETENTION_SECONDS (0 disables either)
+STREAM_MAXLEN = int(os.environ.get("STREAM_MAXLEN", "1000000"))
+STREAM_RETENTION_SECONDS = float(os.environ.get("STREAM_RETENTION_SECONDS", str(7 * 24 * 3600)))
+TRIM_INTERVAL_SECONDS = float(os.environ.get("TRIM_INTERVAL_SECONDS", "60"))
+# Sharding: STREAM_SHARDS > 1 spreads entries over STREAM_KEY:0..N-1, routed by
+# a stable hash of SHARD_BY (session_id or source) so a session stays in order
+STREAM_SHARDS = int(os.environ.get("STREAM_SHARDS", "1"))
+SHARD_BY = os.environ.get("SHARD_BY", "session_id")
+# Entry format: "json" (v1, payload is the record as JSON) or "compact" (v2,
+# msgpack payload without the indexed fields, optionally zlib/zstd per entry;
+# see entry_codec.py). Readers decode both with entry_codec.decode_entry
+ENTRY_FORMAT = os.environ.get("ENTRY_FORMAT", "json")
+ENTRY_COMPRESSION = os.environ.get("ENTRY_COMPRESSION", "none")
+# Passthrough: /forward stores the request body bytes as the json payload
+# instead of re-serializing the parsed record (json format only)
+PAYLOAD_PASSTHROUGH = os.environ.get("PAYLOAD_PASSTHROUGH", "1").lower() not in ("0", "false", "no")
+# Backpressure: 429 once INGEST_HIGH_WATER entries are queued or in flight to
+# Redis, 503 when Redis is down and the WAL is off or full; both with Retry-After
+INGEST_HIGH_WATER = int(os.environ.get("INGEST_HIGH_WATER", "10000"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "5"))
+# Write-ahead spill: entries Redis can't take go to segments in WAL_DIR ("" disables)
+# and are replayed in order once it answers again
+WAL_DIR = os.environ.get("WAL_DIR", "/var/lib/replay-sidecar/wal")
+WAL_SEGMENT_BYTES = int(os.environ.get("WAL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+WAL_MAX_BYTES = int(os.environ.get("WAL_MAX_BYTES", str(1024 * 1024 * 1024)))
+WAL_DRAIN_INTERVAL_SECONDS = float(os.environ.get("WAL_DRAIN_INTERVAL_SECONDS", "1"))
+# De-duplication of client-supplied event_ids (retried chunks): "memory"
+# (per process), "redis" (bitmaps shared by all replicas and workers) or "off";
+# see dedupe.py
+DEDUPE = os.environ.get("DEDUPE", "redis" if SIDECAR_WORKERS > 1 else "memory")
+DEDUPE_CAPACITY = int(os.environ.get("DEDUPE_CAPACITY", "1000000"))
+DEDUPE_ERROR_RATE = float(os.environ.get("DEDUPE_ERROR_RATE", "1e-6"))
+DEDUPE_TTL_SECONDS = float(os.environ.get("DEDUPE_TTL_SECONDS", "600"))
+# Secondary indexes for GET /query: hourly per-level and per-source sorted sets
+# of stream IDs (see stream_index.py), kept as long as the stream by default
+STREAM_INDEX = os.environ.get("STREAM_INDEX", "1").lower() not in ("0", "false", "no")
+INDEX_RETENTION_SECONDS = float(os.environ.get("INDEX_RETENTION_SECONDS", str(STREAM_RETENTION_SECONDS)))
+QUERY_MAX_LIMIT = int(os.environ.get("QUERY_MAX_LIMIT", "1000"))
+
+# Optional zstd support for compressed request bodies
+try:
+    import zstandard  # pyright: ignore[reportMissingImports]
+except ImportError:
+    zstandard = None
+
+_DECODE_ERRORS = (zlib.error, ValueError) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Optional orjson: parses request bodies several times faster than json
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+
+def parse_json(body: bytes):
+    """Parsed body; raises ValueError unless it is valid UTF-8 JSON (as stored)"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body.decode("utf-8"))
 
 redis_client: Optional[Redis] = None  # Now Redis is defined at runtime
 
-@app.on_event("startup")
-async def startup():
-    global redis_client
-    # from_url is SYNCHRONOUS - DO NOT AWAIT
-    redis_client = aioredis.from_url(
+def connect_redis(decode_responses: bool = True) -> Redis:
+    """
+    This process's client. The pool blocks when all REDIS_MAX_CONNECTIONS
+    are busy rather than failing the command, which would spill it to the WAL.
+    """
+    pool = aioredis.BlockingConnectionPool.from_url(
         REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT or None,
+        socket_timeout=REDIS_SOCKET_TIMEOUT or None,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT or None,
         encoding="utf-8",
-        decode_responses=True
+        decode_responses=decode_responses,
     )
+    return aioredis.Redis(connection_pool=pool)
+
+# Pipeline-level failures: Redis down or unreachable, as opposed to one bad entry
+_UNAVAILABLE = (aioredis.ConnectionError, aioredis.TimeoutError, OSError)
+# ... and with nowhere to spill them: the client should come back later
+_RETRY_LATER = _UNAVAILABLE + (WalFull,)
+
+# store_entries result for an entry that went to the WAL
+SPOOLED = "spooled"
+
+# Prometheus series for GET /metrics
+metrics = Registry()
+requests_total = metrics.counter("sidecar_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status"))
+request_seconds = metrics.histogram(
+    "sidecar_request_duration_seconds", "Time from request start to response start",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), ("endpoint",)
+)
+request_bytes = metrics.histogram(
+    "sidecar_request_body_bytes", "Request body size after Content-Encoding is undone",
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216), ("endpoint",)
+)
+request_wire_bytes = metrics.counter("sidecar_request_wire_bytes_total", "Request body bytes as received", ("endpoint",))
+records_total = metrics.counter(
+    "sidecar_records_total", "Log records by endpoint and outcome (accepted, spooled, duplicate, failed)",
+    ("endpoint", "outcome"),
+)
+xadd_seconds = metrics.histogram(
+    "sidecar_xadd_pipeline_seconds", "Round trip of one XADD pipeline",
+    (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+xadd_batch_size = metrics.histogram(
+    "sidecar_xadd_pipeline_entries", "XADDs per pipeline", (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+errors_total = metrics.counter("sidecar_errors_total", "Failed writes by exception type", ("type",))
+wal_entries_total = metrics.counter("sidecar_wal_entries_total", "WAL entries replayed or dropped on replay", ("outcome",))
+queue_depth_gauge = metrics.gauge("sidecar_ingest_queue_depth", "Entries queued or in flight to Redis")
+wal_pending_gauge = metrics.gauge("sidecar_wal_pending_bytes", "Bytes waiting in the write-ahead log")
+redis_up_gauge = metrics.gauge("sidecar_redis_up", "1 if Redis answered the scrape")
+stream_length_gauge = metrics.gauge("sidecar_stream_length", "XLEN per stream", ("stream",))
+stream_memory_gauge = metrics.gauge("sidecar_stream_memory_bytes", "MEMORY USAGE per stream", ("stream",))
+trimmed_total = metrics.counter("sidecar_stream_trimmed_total", "Entries removed by retention trimming", ("stream",))
+group_lag_gauge = metrics.gauge(
+    "sidecar_stream_group_lag", "Entries not yet delivered to the consumer group (Redis >= 7)", ("stream", "group")
+)
+group_pending_gauge = metrics.gauge("sidecar_stream_group_pending", "Delivered but unacknowledged entries", ("stream", "group"))
+
+
+class XaddBatcher:
+    """
+    Coalesces XADDs from concurrent requests into non-transactional pipelines.
+
+    ``add(fields, stream_key)`` queues one entry (for ``stream_key``, by default
+    the batcher's own) and resolves to its stream ID (or raises the entry's
+    error). Pending entries are flushed ``linger`` seconds after
+    the first one arrives, or as soon as ``max_batch`` are waiting; with
+    ``linger=0`` only entries queued in the same event-loop turn share a
+    pipeline. Flushes run concurrently over the client's connection pool.
+    ``depth`` counts entries queued or in flight (for backpressure). With an
+    ``index`` (StreamIndex) the added entries are indexed in one more
+    pipeline right after their requests are resolved.
+    """
+
+    def __init__(self, client, stream_key: str, linger: float = 0.001, max_batch: int = 500, maxlen: int = None,
+                 index: StreamIndex = None):
+        self.client = client
+        self.index = index
+        self.stream_key = stream_key
+        self.linger = linger
+        self.max_batch = max(1, max_batch)
+        self.maxlen = maxlen or None
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+        self.depth = 0
+
+    def add(self, fields: dict, stream_key: str = None) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((stream_key or self.stream_key, fields, future))
+        self.depth += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush) if self.linger > 0 else loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._execute(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _execute(self, batch):
+        pipe = self.client.pipeline(transaction=False)
+        for stream_key, fields, _ in batch:
+            # "~" lets Redis trim whole radix-tree nodes, which is nearly free
+            pipe.xadd(stream_key, fields, maxlen=self.maxlen, approximate=True)
+        started = time.perf_counter()
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except _UNAVAILABLE as ex:
+            results = [ex] * len(batch)
+        except Exception:
+            # redis-py encodes the whole pipeline before sending any of it, so
+            # one entry it can't encode (DataError) fails them all: send them
+            # one by one so only that entry fails
+            results = await asyncio.gather(*(
+                self.client.xadd(stream_key, fields, maxlen=self.maxlen, approximate=True)
+                for stream_key, fields, _ in batch
+            ), return_exceptions=True)
+        finally:
+            self.depth -= len(batch)
+        xadd_seconds.observe(time.perf_counter() - started)
+        xadd_batch_size.observe(len(batch))
+        for (_, _, future), result in zip(batch, results):
+            if future.done():  # request went away
+                continue
+            if isinstance(result, Exception):
+                errors_total.inc(type=type(result).__name__)
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        if self.index is not None:
+            await index_added(self.index, batch, results)
+
+    async def close(self):
+        """Flush whatever is pending and wait for in-flight pipelines"""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+async def index_added(index: StreamIndex, batch: list, results: list):
+    """Index the entries of ``[(stream_key, fields, ...), ...]`` that Redis added"""
+    added = [
+        (stream_key, _text(result), fields)
+        for (stream_key, fields, *_), result in zip(batch, results) if not isinstance(result, Exception)
+    ]
+    if not added:
+        return
+    try:
+        await index.add_many(added)
+    except Exception as ex:
+        errors_total.inc(type=f"index:{type(ex).__name__}")
+
+
+def shard_keys(stream_key: str = None, shards: int = None) -> list:
+    """Stream keys entries are written to: the key itself, or key:0..N-1"""
+    stream_key = stream_key or STREAM_KEY
+    shards = STREAM_SHARDS if shards is None else shards
+    if shards <= 1:
+        return [stream_key]
+    return [f"{stream_key}:{i}" for i in range(shards)]
+
+def shard_for(fields: dict) -> str:
+    """Stream key for one entry; crc32 is stable across processes and restarts"""
+    if STREAM_SHARDS <= 1:
+        return STREAM_KEY
+    route = fields.get(SHARD_BY) or fields.get("source") or ""
+    return f"{STREAM_KEY}:{zlib.crc32(route.encode('utf-8')) % STREAM_SHARDS}"
+
+async def publish_shard_map(client):
+    """Record the shard layout in STREAM_KEY:shards for readers (see stream_reader.py)"""
+    await client.hset(f"{STREAM_KEY}:shards", mapping={
+        "count": STREAM_SHARDS,
+        "keys": json.dumps(shard_keys()),
+        "route_by": SHARD_BY,
+        "hash": "crc32",
+    })
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def stream_id_at(epoch_seconds: float) -> str:
+    """Smallest stream ID Redis would generate at that time (IDs are ms-seq)"""
+    return f"{max(0, int(epoch_seconds * 1000))}-0"
+
+
+class StreamRetention:
+    """
+    Background time-based trimming of the log stream(s).
+
+    Every ``interval`` seconds it runs ``XTRIM <key> MINID ~ <id>`` on each of
+    ``stream_keys`` with the ID of ``now - retention`` (see stream_id_at) and
+    counts what Redis removed in ``trimmed``. With ``~`` Redis only drops whole
+    radix-tree nodes (about 100 entries), so a few entries past retention may
+    linger. With an ``index`` (StreamIndex) it then drops the index members
+    of everything older than each stream's first entry, whether MINID or
+    MAXLEN removed it, so the indexes stay as long as the streams; it runs
+    for that even when ``retention`` is 0. ``stats()`` reports length and
+    memory per stream and in total.
+    """
+
+    def __init__(self, client, stream_keys: list, retention: float, interval: float = 60.0, approximate: bool = True,
+                 index: StreamIndex = None):
+        self.client = client
+        self.index = index
+        self.stream_keys = list(stream_keys)
+        self.retention = retention
+        self.interval = interval
+        self.approximate = approximate
+        self.trimmed = 0
+        self.last_trim_at = None
+        self._task = None
+
+    async def trim_once(self) -> int:
+        minid = stream_id_at(time.time() - self.retention)
+        removed = 0
+        for stream_key in self.stream_keys:
+            if self.retention > 0:
+                count = await self.client.xtrim(stream_key, minid=minid, approximate=self.approximate)
+                trimmed_total.inc(count, stream=stream_key)
+                removed += count
+            if self.index is not None:
+                first = await self.client.xrange(stream_key, count=1)
+                if first:
+                    await self.index.trim(stream_key, _text(first[0][0]))
+        self.trimmed += removed
+        self.last_trim_at = time.time()
+        return removed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.trim_once()
+            except Exception as ex:
+                print(f"Stream trim failed: {ex}")
+
+    def start(self):
+        if (self.retention > 0 or self.index is not None) and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _stream_stats(self, stream_key) -> dict:
+        try:
+            info = await self.client.xinfo_stream(stream_key)
+        except aioredis.ResponseError:  # stream doesn't exist yet
+            info = {}
+        stats = {
+            "stream": stream_key,
+            "length": info.get("length", 0),
+            "first_entry_id": _text(info["first-entry"][0]) if info.get("first-entry") else None,
+            "last_entry_id": _text(info["last-entry"][0]) if info.get("last-entry") else None,
+        }
+        # Redis >= 7: everything ever added minus what is left = trimmed (MAXLEN and MINID) + XDELs
+        if "entries-added" in info:
+            stats["entries_added"] = info["entries-added"]
+            stats["entries_removed"] = info["entries-added"] - stats["length"]
+        try:
+            stats["memory_bytes"] = await self.client.memory_usage(stream_key)
+        except aioredis.ResponseError:  # MEMORY not available (e.g. restricted command)
+            stats["memory_bytes"] = None
+        return stats
+
+    async def stats(self) -> dict:
+        shards = [await self._stream_stats(stream_key) for stream_key in self.stream_keys]
+        stats = {"trimmed_by_retention": self.trimmed, "last_trim_at": self.last_trim_at}
+        if len(shards) == 1:
+            stats.update(shards[0])
+            return stats
+        stats["shards"] = shards
+        for field in ("length", "entries_added", "entries_removed", "memory_bytes"):
+            values = [shard.get(field) for shard in shards]
+            stats[field] = sum(values) if None not in values else None
+        return stats
+
+
+class WalDrainer:
+    """
+    Replays the write-ahead log into the stream(s) once Redis answers again.
+
+    Every ``interval`` seconds while the WAL is active it pings Redis and
+    then XADDs the sealed segments oldest first, in pipelines of ``chunk``
+    entries, deleting each segment once it is through. Reaching the open
+    segment seals it; when nothing is left the WAL goes inactive and new
+    entries take the direct path again. A failed pipeline is retried from
+    the last completed chunk; entries Redis rejects one by one are counted
+    in ``dropped``.
+    """
+
+    def __init__(self, client, wal: SegmentedWal, maxlen: int = None, interval: float = 1.0, chunk: int = 500,
+                 index: StreamIndex = None):
+        self.client = client
+        self.wal = wal
+        self.index = index
+        self.maxlen = maxlen or None
+        self.interval = interval
+        self.chunk = chunk
+        self.drained = 0
+        self.dropped = 0
+        self._position = (None, 0)  # (segment path, offset drained up to)
+        self._task = None
+
+    async def drain_once(self) -> bool:
+        """Replay everything spilled so far; True once the WAL is empty"""
+        await self.client.ping()
+        while True:
+            segments = self.wal.sealed()
+            if segments:
+                await self._drain_segment(segments[0])
+            elif self.wal.pending_bytes:
+                self.wal.seal()
+            else:
+                # no await since the check: nothing can have been appended in between
+                self.wal.active = False
+                return True
+
+    async def _drain_segment(self, path):
+        data = self.wal.read(path)
+        offset = self._position[1] if self._position[0] == path else 0
+        batch = []
+        for next_offset, stream_key, fields in decode_records(data, offset):
+            batch.append((stream_key, fields))
+            if len(batch) >= self.chunk:
+                await self._write(batch)
+                self._position = (path, next_offset)
+                offset, batch = next_offset, []
+            else:
+                offset = next_offset
+        if batch:
+            await self._write(batch)
+        if offset < len(data):
+            print(f"WAL segment {path}: dropped {len(data) - offset} damaged bytes at the end")
+        self.wal.remove(path)
+        self._position = (None, 0)
+
+    async def _write(self, batch):
+        pipe = self.client.pipeline(transaction=False)
+        for stream_key, fields in batch:
+            pipe.xadd(stream_key, fields, maxlen=self.maxlen, approximate=True)
+        results = await pipe.execute(raise_on_error=False)
+        for result in results:
+            if isinstance(result, _UNAVAILABLE):
+                raise result
+            if isinstance(result, Exception):
+                self.dropped += 1
+                wal_entries_total.inc(outcome="dropped")
+                print(f"WAL entry rejected by Redis: {result}")
+            else:
+                self.drained += 1
+                wal_entries_total.inc(outcome="drained")
+        if self.index is not None:
+            await index_added(self.index, batch, results)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.wal.active:
+                continue
+            try:
+                if await self.drain_once():
+                    print(f"WAL drained: {self.drained} entries replayed so far")
+            except _UNAVAILABLE:
+                pass  # still down, try again next interval
+            except Exception as ex:
+                print(f"WAL drain failed: {ex}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+xadd_batcher: Optional[XaddBatcher] = None
+stream_retention: Optional[StreamRetention] = None
+wal: Optional[SegmentedWal] = None
+wal_drainer: Optional[WalDrainer] = None
+wal_lock = None  # flock on this worker's WAL directory (see wal.claim_directory)
+metrics_server = None  # this worker's own /metrics listener (SIDECAR_METRICS_PORT)
+deduper = None  # RotatingBloomFilter, RedisBloomFilter or None
+stream_index: Optional[StreamIndex] = None
+
+@app.on_event("startup")
+async def startup():
+    global redis_client, ENTRY_FORMAT, ENTRY_COMPRESSION
+    if ENTRY_FORMAT == "compact" and entry_codec.msgpack is None:
+        print("ENTRY_FORMAT=compact needs msgpack; writing json entries")
+        ENTRY_FORMAT = "json"
+    if ENTRY_COMPRESSION == "zstd" and entry_codec.zstandard is None:
+        print("ENTRY_COMPRESSION=zstd needs zstandard; using zlib")
+        ENTRY_COMPRESSION = "zlib"
+    # compact entries hold binary payloads, which XINFO STREAM returns too
+    redis_client = connect_redis(decode_responses=ENTRY_FORMAT != "compact")
     # Ping is async - await it
     try:
         await redis_client.ping()
         print(f"Connected to Redis: {REDIS_URL}")
     except Exception as e:
         print(f"Redis ping failed on startup: {e}")
-    print(f"Forwarding to stream: {STREAM_KEY}")
+    print(f"Forwarding to stream: {STREAM_KEY}" + (f" ({STREAM_SHARDS} shards by {SHARD_BY})" if STREAM_SHARDS > 1 else ""))
+    global xadd_batcher, stream_retention, stream_index
+    stream_index = StreamIndex(redis_client, INDEX_RETENTION_SECONDS) if STREAM_INDEX else None
+    xadd_batcher = XaddBatcher(
+        redis_client, STREAM_KEY, XADD_LINGER_MS / 1000.0, XADD_MAX_BATCH, STREAM_MAXLEN, stream_index
+    )
+    stream_retention = StreamRetention(
+        redis_client, shard_keys(), STREAM_RETENTION_SECONDS, TRIM_INTERVAL_SECONDS, index=stream_index
+    )
+    try:
+        await publish_shard_map(redis_client)
+    except Exception as e:
+        print(f"Publishing shard map failed: {e}")
+    stream_retention.start()
+    global wal, wal_drainer, wal_lock
+    wal = wal_drainer = wal_lock = None
+    if WAL_DIR:
+        try:
+            # twice the slots: a restarted worker may start before the old one is gone
+            directory, wal_lock = claim_directory(WAL_DIR, 2 * SIDECAR_WORKERS if SIDECAR_WORKERS > 1 else 1)
+            # e.g. the directories of workers a smaller SIDECAR_WORKERS no longer starts
+            adopted = adopt_orphans(WAL_DIR, directory)
+            if adopted:
+                print(f"WAL: adopted {adopted} segment(s) of exited workers")
+            wal = SegmentedWal(directory, WAL_SEGMENT_BYTES, WAL_MAX_BYTES)
+        except OSError as e:
+            print(f"WAL disabled, cannot use {WAL_DIR}: {e}")
+    global deduper
+    deduper = None
+    if DEDUPE == "memory":
+        deduper = RotatingBloomFilter(DEDUPE_CAPACITY, DEDUPE_ERROR_RATE, DEDUPE_TTL_SECONDS)
+    elif DEDUPE == "redis":
+        deduper = RedisBloomFilter(redis_client, f"{STREAM_KEY}:dedupe", DEDUPE_CAPACITY, DEDUPE_ERROR_RATE, DEDUPE_TTL_SECONDS)
+    if deduper:
+        print(f"De-duplicating event_ids ({DEDUPE}, {deduper.bits // 8 // 1024} KiB per generation, {DEDUPE_TTL_SECONDS:g}s window)")
+    global metrics_server
+    metrics_server = None
+    metrics.labels = {}
+    if SIDECAR_METRICS_PORT:
+        ports = range(SIDECAR_METRICS_PORT, SIDECAR_METRICS_PORT + SIDECAR_WORKERS)
+        metrics_server, slot = await serve_metrics(render_metrics, SIDECAR_HOST, ports)
+        if metrics_server is None:
+            print(f"No free metrics port in {ports.start}-{ports.stop - 1}; scrape through {SIDECAR_PORT} only")
+        else:
+            metrics.labels = {"worker": str(slot)}
+            print(f"Worker {slot}: metrics on port {ports[slot]}")
+    if wal:
+        if wal.active:
+            print(f"WAL: {wal.pending_bytes} bytes left from a previous run, replaying")
+        wal_drainer = WalDrainer(redis_client, wal, STREAM_MAXLEN, WAL_DRAIN_INTERVAL_SECONDS, index=stream_index)
+        wal_drainer.start()
 
 @app.on_event("shutdown")
 async def shutdown():
     global redis_client
+    if stream_retention:
+        await stream_retention.stop()
+    if wal_drainer:
+        await wal_drainer.stop()
+    if xadd_batcher:
+        await xadd_batcher.close()
+    if wal:
+        wal.close()
+    if wal_lock:
+        wal_lock.close()
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
     if redis_client:
         await redis_client.close()
+        await redis_client.connection_pool.disconnect()
+
+async def read_body(request: Request) -> bytes:
+    """Request body, decompressed according to Content-Encoding (gzip, deflate, zstd)"""
+    body = await request.body()
+    endpoint = request.url.path
+    request_wire_bytes.inc(len(body), endpoint=endpoint)
+    data = _decode_body(body, request.headers.get("content-encoding", "identity").strip().lower())
+    request_bytes.observe(len(data), endpoint=endpoint)
+    return data
+
+def _decode_body(body: bytes, encoding: str) -> bytes:
+    if encoding in ("", "identity"):
+        return body
+    try:
+        if encoding in ("gzip", "deflate"):
+            # wbits 47 auto-detects gzip/zlib headers; max_length caps decompression bombs
+            decompressor = zlib.decompressobj(47 if encoding == "gzip" else zlib.MAX_WBITS)
+            data = decompressor.decompress(body, MAX_BODY_BYTES)
+            if decompressor.unconsumed_tail:
+                raise HTTPException(status_code=413, detail="Decompressed body too large")
+            return data
+        if encoding == "zstd" and zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            data = reader.read(MAX_BODY_BYTES + 1)
+            if len(data) > MAX_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Decompressed body too large")
+            return data
+    except _DECODE_ERRORS as ex:
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} body: {ex}")
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+def stream_entry(log_data: dict, raw: bytes = None):
+    """
+    ``(event_id, fields)`` of the stream entry for one log record. ``raw`` is
+    the record's original JSON; with PAYLOAD_PASSTHROUGH it is stored as the
+    payload as is, saving a json.dumps per event.
+    """
+    # indexed fields are stream field values: str, with the default for null
+    event_id = str(log_data.get("event_id") or uuid.uuid4())
+    timestamp = str(log_data.get("timestamp") or datetime.datetime.utcnow().isoformat())
+    session_id = str(log_data.get("session_id") or log_data.get("request_id") or "")
+    source = str(log_data.get("source") or "unknown")
+    level = str(log_data.get("level") or "INFO")
+    fields = {
+        "event_id": event_id,
+        "timestamp": timestamp,
+        "session_id": session_id,
+        "source": source,
+        "level": level,
+    }
+    if ENTRY_FORMAT == "compact":
+        return event_id, entry_codec.encode_compact(fields, log_data, ENTRY_COMPRESSION)
+    if raw is not None and PAYLOAD_PASSTHROUGH:
+        fields["payload"] = raw
+        return event_id, fields
+    return event_id, entry_codec.encode_json(fields, log_data)
+
+def retry_later(status_code: int, detail) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+def check_ingest():
+    """429 while the XADD queue is past its high-water mark"""
+    if INGEST_HIGH_WATER > 0 and xadd_batcher.depth >= INGEST_HIGH_WATER:
+        raise retry_later(429, f"Ingest queue full ({xadd_batcher.depth} entries pending)")
+
+def spool(entries: list) -> list:
+    try:
+        wal.append(entries)
+    except (WalFull, OSError) as ex:
+        errors_total.inc(len(entries), type=type(ex).__name__)
+        return [ex] * len(entries)
+    return [SPOOLED] * len(entries)
+
+async def store_entries(entries: list) -> list:
+    """
+    Write ``[(stream_key, fields), ...]``. Returns per entry its stream ID,
+    SPOOLED if it went to the WAL, or the exception. Entries Redis can't take
+    for being unavailable are spooled, and so is everything while the WAL
+    still holds older entries, so that nothing overtakes them.
+    """
+    if wal is not None and wal.active:
+        return spool(entries)
+    results = await asyncio.gather(
+        *(xadd_batcher.add(fields, stream_key) for stream_key, fields in entries), return_exceptions=True
+    )
+    failed = [index for index, result in enumerate(results) if isinstance(result, _UNAVAILABLE)]
+    if failed and wal is not None:
+        for index, result in zip(failed, spool([entries[index] for index in failed])):
+            results[index] = result
+    return results
+
+async def find_duplicates(event_ids: list) -> list:
+    """
+    Per ID whether it was stored within the dedupe window (None never was).
+    Fails open: if the Redis-backed filter can't be reached, nothing is a
+    duplicate.
+    """
+    if deduper is None or not any(event_ids):
+        return [False] * len(event_ids)
+    known = [str(event_id) for event_id in event_ids if event_id]
+    try:
+        found = iter(await deduper.contains_many(known))
+    except _UNAVAILABLE:
+        return [False] * len(event_ids)
+    return [next(found) if event_id else False for event_id in event_ids]
+
+async def remember(event_ids: list):
+    """Record stored IDs in the dedupe filter"""
+    known = [str(event_id) for event_id in event_ids if event_id]
+    if deduper is None or not known:
+        return
+    try:
+        await deduper.add_many(known)
+    except _UNAVAILABLE:
+        pass
+
+def parse_records(body: bytes):
+    """
+    Records of a batch body: a JSON array, or NDJSON (one object per line).
+    Returns ``(records, errors)``; records that can't be used are None and
+    reported in errors by index.
+    """
+    if body.lstrip()[:1] == b"[":
+        try:
+            records = parse_json(body)
+        except ValueError:  # JSONDecodeError (json and orjson) or not UTF-8
+            raise HTTPException(status_code=400, detail="Invalid JSON array")
+    else:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(parse_json(line))
+            except ValueError as e:
+                records.append(e)
+    errors = []
+    for index, record in enumerate(records):
+        if isinstance(record, ValueError):
+            # JSONDecodeError has msg; UnicodeDecodeError (stdlib path) doesn't
+            errors.append({"index": index, "error": f"Invalid JSON: {getattr(record, 'msg', 'not UTF-8')}"})
+            records[index] = None
+        elif not isinstance(record, dict):
+            errors.append({"index": index, "error": "Record is not a JSON object"})
+            records[index] = None
+    return records, errors
 
 @app.post("/forward")
 async def forward(request: Request):
+    check_ingest()
+    body = await read_body(request)
     try:
-        log_data = await request.json()
-    except json.JSONDecodeError as e:
+        log_data = parse_json(body)
+    except ValueError:  # JSONDecodeError (json and orjson) or not UTF-8
         raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(log_data, dict):
+        raise HTTPException(status_code=400, detail="Body is not a JSON object")
    
     # COMMENTED OUT - No auth needed for internal Docker network
     # token = request.headers.get("x-replay-token") or request.headers.get("authorization")
     # if token != SECRET:
     #     raise HTTPException(status_code=401, detail="Unauthorized")
    
-    event_id = log_data.get("event_id") or str(uuid.uuid4())
-    
     try:
-        timestamp = log_data.get("timestamp") or datetime.datetime.utcnow().isoformat()
-        session_id = log_data.get("session_id", "") or log_data.get("request_id", "")
-        source = log_data.get("source", "unknown")
-        level = log_data.get("level", "INFO")
-        payload = log_data
+        event_id, fields = stream_entry(log_data, body)
+        # only IDs from the client can come again; generated ones are unique
+        supplied_id = log_data.get("event_id")
+        if supplied_id and (await find_duplicates([supplied_id]))[0]:
+            records_total.inc(endpoint="/forward", outcome="duplicate")
+            return {"status": "duplicate", "event_id": event_id}
+        result, = await store_entries([(shard_for(fields), fields)])
+        if isinstance(result, Exception):
+            raise result
+        await remember([supplied_id])
         
-        await redis_client.xadd(
-            STREAM_KEY,
-            {
-                "event_id": event_id,
-                "timestamp": timestamp,
-                "session_id": session_id,
-                "source": source,
-                "level": level,
-                "payload": json.dumps(payload, ensure_ascii=False)
-            }
-        )
-        
-        print(f"Forwarded: {event_id} from {source} - Keys: {list(payload.keys())[:3]}")
+        if result == SPOOLED:
+            records_total.inc(endpoint="/forward", outcome="spooled")
+            return {"status": "accepted", "event_id": event_id, "spooled": True}
+        records_total.inc(endpoint="/forward", outcome="accepted")
         return {"status": "accepted", "event_id": event_id}
         
+    except _RETRY_LATER as ex:
+        records_total.inc(endpoint="/forward", outcome="failed")
+        print(f"Error forwarding: {ex}")
+        raise retry_later(503, f"Redis unavailable: {ex}")
     except Exception as ex:
+        records_total.inc(endpoint="/forward", outcome="failed")
         print(f"Error forwarding: {ex}")
         raise HTTPException(status_code=500, detail=str(ex))
 
+@app.post("/forward/batch")
+async def forward_batch(request: Request):
+    """
+    Many records per request (JSON array or NDJSON), written through the
+    XADD batcher (one pipeline per XADD_MAX_BATCH records). Responds with an event_id per record (None for
+    records that were not stored) and the errors by record index; a batch is
+    only rejected as a whole if the sidecar is over its high-water marks
+    (429/503 with Retry-After, so Fluentd retries) or no record in it is
+    usable (400). Records spilled to the WAL count as accepted, and so do
+    duplicates of recently stored event_ids, which are skipped.
+    """
+    check_ingest()
+    records, errors = parse_records(await read_body(request))
+    event_ids = [None] * len(records)
+
+    # as stored (see stream_entry); also makes ids like [1] hashable
+    supplied = [
+        str(record["event_id"]) if record is not None and record.get("event_id") else None for record in records
+    ]
+    seen = await find_duplicates(supplied)
+    in_batch = set()
+    duplicates = 0
+    pending = []
+    for index, record in enumerate(records):
+        if record is None:
+            continue
+        if supplied[index]:
+            if seen[index] or supplied[index] in in_batch:
+                event_ids[index] = supplied[index]
+                duplicates += 1
+                continue
+            in_batch.add(supplied[index])
+        event_id, fields = stream_entry(record)
+        pending.append((index, event_id, (shard_for(fields), fields)))
+
+    spooled = 0
+    if pending:
+        results = await store_entries([entry for _, _, entry in pending])
+        if all(isinstance(result, _RETRY_LATER) for result in results):
+            records_total.inc(len(records), endpoint="/forward/batch", outcome="failed")
+            print(f"Error forwarding batch of {len(pending)}: {results[0]}")
+            raise retry_later(503, f"Redis unavailable: {results[0]}")
+        for (index, event_id, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                errors.append({"index": index, "error": str(result)})
+            else:
+                event_ids[index] = event_id
+                spooled += result == SPOOLED
+        await remember([supplied[index] for index, _, _ in pending if event_ids[index] is not None])
+    elif records and not duplicates:
+        records_total.inc(len(records), endpoint="/forward/batch", outcome="failed")
+        raise HTTPException(status_code=400, detail={"errors": errors})
+
+    accepted = len(records) - len(errors)
+    records_total.inc(len(errors), endpoint="/forward/batch", outcome="failed")
+    records_total.inc(accepted - spooled - duplicates, endpoint="/forward/batch", outcome="accepted")
+    records_total.inc(spooled, endpoint="/forward/batch", outcome="spooled")
+    records_total.inc(duplicates, endpoint="/forward/batch", outcome="duplicate")
+    response = {
+        "status": "accepted" if not errors else "partial",
+        "accepted": accepted,
+        "failed": len(errors),
+        "event_ids": event_ids,
+        "errors": sorted(errors, key=lambda error: error["index"]),
+    }
+    if spooled:
+        response["spooled"] = spooled
+    if duplicates:
+        response["duplicates"] = duplicates
+    return response
+
+@app.get("/stats/stream")
+async def stream_stats():
+    """Stream length, memory and how much retention has trimmed"""
+    try:
+        return await stream_retention.stats()
+    except Exception as ex:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {ex}")
+
+@app.get("/stats/ingest")
+async def ingest_stats():
+    """Backpressure and WAL state; answers while Redis is down"""
+    stats = {
+        "queue_depth": xadd_batcher.depth,
+        "high_water": INGEST_HIGH_WATER,
+        "wal_enabled": wal is not None,
+    }
+    if wal is not None:
+        stats.update({
+            "wal_active": wal.active,
+            "wal_pending_bytes": wal.pending_bytes,
+            "wal_max_bytes": wal.max_bytes,
+            "wal_appended": wal.appended,
+            "wal_drained": wal_drainer.drained,
+            "wal_dropped": wal_drainer.dropped,
+        })
+    if deduper is not None:
+        stats["dedupe"] = dict(deduper.stats(), duplicates=sum(
+            records_total.value(endpoint=endpoint, outcome="duplicate") for endpoint in ("/forward", "/forward/batch")
+        ))
+    return stats
+
+def parse_time(value: str, name: str) -> float:
+    """Epoch seconds from a number or an ISO-8601 time (UTC unless it says otherwise)"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+@app.get("/query")
+async def query(level: str = None, source: str = None, start: str = None, end: str = None, limit: int = 100,
+                cursor: str = None):
+    """
+    Entries in a time range (by stream ID, i.e. arrival time), optionally of
+    one level and/or source, oldest first. Pass ``next_cursor`` back as
+    ``cursor`` for the next page.
+    """
+    filters = {field: value for field, value in (("level", level), ("source", source)) if value}
+    if filters and stream_index is None:
+        raise HTTPException(status_code=400, detail="Filtering needs STREAM_INDEX=1")
+    if not 1 <= limit <= QUERY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {QUERY_MAX_LIMIT}")
+    end_s = parse_time(end, "end") if end else time.time()
+    # default window: as far back as the indexes go
+    start_s = parse_time(start, "start") if start else end_s - (INDEX_RETENTION_SECONDS or 24 * 3600)
+    if cursor:
+        try:
+            parse_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor!r}")
+    index = stream_index or StreamIndex(redis_client)
+    try:
+        entries, next_cursor = await index.query(
+            shard_keys(), filters, int(start_s * 1000), int(end_s * 1000), cursor, limit
+        )
+    except _UNAVAILABLE as ex:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {ex}")
+    return {
+        "entries": [
+            {"stream": stream_key, "id": entry_id, "record": entry_codec.decode_entry(fields)}
+            for stream_key, entry_id, fields in entries
+        ],
+        "next_cursor": next_cursor,
+    }
+
+async def collect_stream_metrics():
+    """Refresh the scrape-time gauges: ingest state, then stream length and memory and consumer groups"""
+    queue_depth_gauge.set(xadd_batcher.depth)
+    wal_pending_gauge.set(wal.pending_bytes if wal is not None else 0)
+    stream_length_gauge.clear()
+    stream_memory_gauge.clear()
+    group_lag_gauge.clear()
+    group_pending_gauge.clear()
+    try:
+        for stream_key in shard_keys():
+            stream_length_gauge.set(await redis_client.xlen(stream_key), stream=stream_key)
+            try:
+                memory = await redis_client.memory_usage(stream_key)
+            except aioredis.ResponseError:  # MEMORY not available (e.g. restricted command)
+                memory = None
+            if memory is not None:  # None: stream doesn't exist yet
+                stream_memory_gauge.set(memory, stream=stream_key)
+            try:
+                groups = await redis_client.xinfo_groups(stream_key)
+            except aioredis.ResponseError:  # stream doesn't exist yet
+                groups = []
+            for group in groups:
+                name = _text(group["name"])
+                group_pending_gauge.set(group["pending"], stream=stream_key, group=name)
+                if group.get("lag") is not None:  # Redis 7+, None when it can't tell
+                    group_lag_gauge.set(group["lag"], stream=stream_key, group=name)
+        redis_up_gauge.set(1)
+    except _UNAVAILABLE:
+        redis_up_gauge.set(0)
+
+async def render_metrics() -> str:
+    await collect_stream_metrics()
+    return metrics.render()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format; see the ``metrics`` registry above for the series"""
+    return Response(content=await render_metrics(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health():
     try:
@@ -94,5 +1022,27 @@ async def health():
     except Exception as ex:
         raise HTTPException(status_code=503, detail=f"Redis unavailable: {ex}")
 
+# paths MetricsMiddleware labels by name (everything registered above)
+_ROUTES = {route.path for route in app.routes}
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def serve():
+    """Run the sidecar with the SIDECAR_* settings (one process, or a uvicorn-managed group)"""
+    loop = SIDECAR_LOOP if SIDECAR_LOOP != "auto" else ("uvloop" if _installed("uvloop") else "asyncio")
+    http = SIDECAR_HTTP if SIDECAR_HTTP != "auto" else ("httptools" if _installed("httptools") else "h11")
+    print(f"Serving on {SIDECAR_HOST}:{SIDECAR_PORT}: {SIDECAR_WORKERS} worker(s), {loop} loop, {http} parser")
+    uvicorn.run(
+        # workers are separate processes that import the app by name
+        "redis_forwarder:app" if SIDECAR_WORKERS > 1 else app,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=SIDECAR_HOST,
+        port=SIDECAR_PORT,
+        workers=SIDECAR_WORKERS,
+        loop=loop,
+        http=http,
+    )
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8200)
\ No newline at end of file
+    serve()
\ No newline at end of file
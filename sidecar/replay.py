@@ -0,0 +1,331 @@
+"""
+Replay engine: reads the log stream(s) back with a consumer group and
+re-issues the recorded HTTP requests against a target.
+
+Records that describe a request (``method`` and ``path``, as the nginx
+``json_combined`` format writes them) are replayed; everything else is
+acknowledged and counted as skipped. Several replayer processes with the same
+group share the work; entries a dead consumer left pending are taken over
+with XAUTOCLAIM.
+
+    REPLAY_TARGET=http://juice-shop:3000 REPLAY_MODE=timed REPLAY_SPEED=10 python replay.py
+
+Settings (env): REDIS_URL, STREAM_KEY, REPLAY_TARGET, REPLAY_MODE (``max`` or
+``timed``), REPLAY_SPEED, REPLAY_CONCURRENCY, REPLAY_ORDER_BY (``session`` or
+``none``), REPLAY_GROUP, REPLAY_CONSUMER, REPLAY_START_ID (``0`` for the whole
+stream, ``$`` for new entries only), REPLAY_CLAIM_IDLE_MS, REPLAY_UNTIL_IDLE.
+"""
+import asyncio
+import datetime
+import json
+import os
+import socket
+import time
+
+import httpx  # pyright: ignore[reportMissingImports]
+import redis.asyncio as aioredis  # pyright: ignore[reportMissingImports]
+
+import entry_codec
+from stream_reader import discover_streams, parse_id
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
+STREAM_KEY = os.environ.get("STREAM_KEY", "logs:stream")
+SECRET = os.environ.get("REPLAY_SHARED_TOKEN", "")
+REPLAY_TARGET = os.environ.get("REPLAY_TARGET", "")
+REPLAY_MODE = os.environ.get("REPLAY_MODE", "max")
+REPLAY_SPEED = float(os.environ.get("REPLAY_SPEED", "1"))
+REPLAY_CONCURRENCY = int(os.environ.get("REPLAY_CONCURRENCY", "32"))
+REPLAY_ORDER_BY = os.environ.get("REPLAY_ORDER_BY", "session")
+REPLAY_GROUP = os.environ.get("REPLAY_GROUP", "replay")
+REPLAY_CONSUMER = os.environ.get("REPLAY_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+REPLAY_START_ID = os.environ.get("REPLAY_START_ID", "0")
+REPLAY_CLAIM_IDLE_MS = int(os.environ.get("REPLAY_CLAIM_IDLE_MS", "60000"))
+REPLAY_UNTIL_IDLE = os.environ.get("REPLAY_UNTIL_IDLE", "0").lower() in ("1", "true", "yes")
+
+MODES = ("max", "timed")
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def http_request(record: dict):
+    """``(method, path, headers, body)`` of a recorded request, or None if the record isn't one"""
+    method = record.get("method")
+    path = record.get("path") or record.get("uri")
+    if not method or not path or not str(path).startswith("/"):
+        return None
+    headers = {}
+    if record.get("user_agent"):
+        headers["User-Agent"] = record["user_agent"]
+    body = record.get("request_body") or None
+    if body is not None:
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode("utf-8")
+        if body[:1] in (b"{", b"["):
+            headers["Content-Type"] = "application/json"
+    return str(method).upper(), str(path), headers, body
+
+
+def record_time(record: dict, entry_id) -> float:
+    """When the request happened: its ``timestamp``, else the stream ID's arrival time"""
+    timestamp = record.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            return parsed.timestamp()
+        except ValueError:
+            pass
+    return parse_id(entry_id)[0] / 1000.0
+
+
+class Replayer:
+    """
+    Replays ``stream_keys`` into ``target_url`` as consumer ``consumer`` of
+    ``group`` (created at ``start_id`` if missing).
+
+    ``mode="max"`` sends as fast as ``concurrency`` allows; ``mode="timed"``
+    keeps the recorded gaps between requests, divided by ``speed``. With
+    ``order_by="session"`` requests of one session (``session_id``, else the
+    client ``ip``) are sent one after another in stream order, other sessions
+    in parallel. An entry is acknowledged once the target answered, whatever
+    the status; transport errors leave it pending, to be picked up again by
+    XAUTOCLAIM after ``claim_idle_ms``, until it has failed ``max_attempts``
+    times here and is acknowledged as abandoned. ``client`` must not decode
+    responses (compact entries are binary).
+    """
+
+    def __init__(self, client, target_url: str, stream_keys: list, group: str = "replay", consumer: str = "replayer",
+                 mode: str = "max", speed: float = 1.0, concurrency: int = 32, order_by: str = "session",
+                 start_id: str = "0", batch_size: int = 100, block_ms: int = 1000, claim_idle_ms: int = 60000,
+                 timeout: float = 10.0, max_attempts: int = 3, http_client=None):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}; expected one of {MODES}")
+        self.client = client
+        self.target_url = target_url.rstrip("/")
+        self.stream_keys = list(stream_keys)
+        self.group = group
+        self.consumer = consumer
+        self.mode = mode
+        self.speed = speed
+        self.concurrency = concurrency
+        self.order_by = order_by
+        self.start_id = start_id
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.http = http_client
+        self.stats = {
+            "read": 0, "claimed": 0, "replayed": 0, "skipped": 0, "failed": 0, "abandoned": 0,
+            "status_mismatch": 0, "max_lateness_ms": 0.0,
+        }
+        self._stopping = False
+        self._semaphore = None
+        self._tasks = set()
+        self._in_flight = set()
+        self._session_tails = {}
+        self._acks = {}
+        self._failures = {}
+        self._origin = None  # (loop time, record time) of the first timed request
+
+    async def ensure_groups(self):
+        for stream_key in self.stream_keys:
+            try:
+                await self.client.xgroup_create(stream_key, self.group, id=self.start_id, mkstream=True)
+            except aioredis.ResponseError as ex:
+                if "BUSYGROUP" not in str(ex):
+                    raise
+
+    def stop(self):
+        self._stopping = True
+
+    async def run(self, until_idle: bool = False) -> dict:
+        """Replay until ``stop()`` (or, with ``until_idle``, until nothing is left); returns the stats"""
+        own_http = self.http is None
+        if own_http:
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self.http = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            await self.ensure_groups()
+            # what this consumer was given before a restart and never acknowledged
+            for stream_key in self.stream_keys:
+                last_id = "0"
+                while True:
+                    response = await self.client.xreadgroup(
+                        self.group, self.consumer, {stream_key: last_id}, count=self.batch_size
+                    )
+                    entries = response[0][1] if response else []
+                    if not entries:
+                        break
+                    for entry_id, fields in entries:
+                        await self._dispatch(stream_key, _text(entry_id), fields)
+                    last_id = _text(entries[-1][0])
+
+            next_claim = time.monotonic() + self.claim_idle_ms / 2000.0
+            while not self._stopping:
+                response = await self.client.xreadgroup(
+                    self.group, self.consumer, {key: ">" for key in self.stream_keys},
+                    count=self.batch_size, block=self.block_ms,
+                )
+                received = 0
+                for stream_key, entries in response or []:
+                    for entry_id, fields in entries:
+                        received += 1
+                        await self._dispatch(_text(stream_key), _text(entry_id), fields)
+                if time.monotonic() >= next_claim or (until_idle and not received and not self._tasks):
+                    received += await self.claim_stuck()
+                    next_claim = time.monotonic() + self.claim_idle_ms / 2000.0
+                await self._flush_acks()
+                if until_idle and not received and not self._tasks:
+                    break
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._flush_acks()
+        finally:
+            if own_http:
+                await self.http.aclose()
+                self.http = None
+        return dict(self.stats)
+
+    async def claim_stuck(self) -> int:
+        """Take over entries pending for longer than ``claim_idle_ms`` (a consumer died mid-request)"""
+        claimed = 0
+        for stream_key in self.stream_keys:
+            start = "0-0"
+            while True:
+                response = await self.client.xautoclaim(
+                    stream_key, self.group, self.consumer, self.claim_idle_ms, start_id=start, count=self.batch_size
+                )
+                start, entries = _text(response[0]), response[1]
+                for entry_id, fields in entries:
+                    entry_id = _text(entry_id)
+                    if (stream_key, entry_id) in self._in_flight:  # our own, still waiting for its turn
+                        continue
+                    claimed += 1
+                    await self._dispatch(stream_key, entry_id, fields)
+                if start == "0-0":
+                    break
+        self.stats["claimed"] += claimed
+        return claimed
+
+    async def _dispatch(self, stream_key: str, entry_id: str, fields):
+        self.stats["read"] += 1
+        if not fields:  # deleted (trimmed) while pending
+            self._ack(stream_key, entry_id)
+            return
+        fields = {_text(key): value for key, value in fields.items()}
+        record = entry_codec.decode_entry(fields)
+        request = http_request(record)
+        if request is None:
+            self.stats["skipped"] += 1
+            self._ack(stream_key, entry_id)
+            return
+        # bound the entries read ahead (timed mode sleeps in the tasks)
+        while len(self._tasks) >= self.concurrency * 4:
+            await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        due = None
+        if self.mode == "timed":
+            happened = record_time(record, entry_id)
+            loop_now = asyncio.get_running_loop().time()
+            if self._origin is None:
+                self._origin = (loop_now, happened)
+            due = self._origin[0] + (happened - self._origin[1]) / self.speed
+
+        session = None
+        if self.order_by == "session":
+            session = _text(fields.get("session_id", "")) or record.get("ip") or None
+        previous = self._session_tails.get(session) if session else None
+        task = asyncio.get_running_loop().create_task(
+            self._replay(stream_key, entry_id, record, request, due, previous)
+        )
+        self._in_flight.add((stream_key, entry_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if session:
+            self._session_tails[session] = task
+            task.add_done_callback(lambda done, session=session: self._forget_session(session, done))
+
+    def _forget_session(self, session, task):
+        if self._session_tails.get(session) is task:
+            del self._session_tails[session]
+
+    async def _replay(self, stream_key, entry_id, record, request, due, previous):
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            loop = asyncio.get_running_loop()
+            if due is not None and due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            method, path, headers, body = request
+            headers = dict(headers, **{"X-Replay-Event-Id": _text(record.get("event_id") or entry_id)})
+            if SECRET:
+                headers["X-Replay-Token"] = SECRET
+            async with self._semaphore:
+                if due is not None:
+                    lateness = max(0.0, (loop.time() - due) * 1000)
+                    self.stats["max_lateness_ms"] = max(self.stats["max_lateness_ms"], round(lateness, 3))
+                try:
+                    response = await self.http.request(method, self.target_url + path, headers=headers, content=body)
+                except httpx.HTTPError as ex:
+                    self.stats["failed"] += 1
+                    failures = self._failures[(stream_key, entry_id)] = self._failures.get((stream_key, entry_id), 0) + 1
+                    if failures >= self.max_attempts:
+                        self.stats["abandoned"] += 1
+                        self._failures.pop((stream_key, entry_id))
+                        self._ack(stream_key, entry_id)
+                        print(f"Replay of {entry_id} abandoned after {failures} attempts: {ex!r}")
+                    return  # otherwise stays pending; XAUTOCLAIM hands it out again
+            self.stats["replayed"] += 1
+            self._failures.pop((stream_key, entry_id), None)
+            if isinstance(record.get("status"), int) and response.status_code != record["status"]:
+                self.stats["status_mismatch"] += 1
+            self._ack(stream_key, entry_id)
+        finally:
+            self._in_flight.discard((stream_key, entry_id))
+
+    def _ack(self, stream_key: str, entry_id: str):
+        self._acks.setdefault(stream_key, []).append(entry_id)
+
+    async def _flush_acks(self):
+        acks, self._acks = self._acks, {}
+        for stream_key, ids in acks.items():
+            await self.client.xack(stream_key, self.group, *ids)
+
+
+async def main():
+    if not REPLAY_TARGET:
+        raise SystemExit("REPLAY_TARGET is required, e.g. REPLAY_TARGET=http://juice-shop:3000")
+    client = aioredis.from_url(REDIS_URL)
+    replayer = Replayer(
+        client, REPLAY_TARGET, await discover_streams(client, STREAM_KEY), group=REPLAY_GROUP,
+        consumer=REPLAY_CONSUMER, mode=REPLAY_MODE, speed=REPLAY_SPEED, concurrency=REPLAY_CONCURRENCY,
+        order_by=REPLAY_ORDER_BY, start_id=REPLAY_START_ID, claim_idle_ms=REPLAY_CLAIM_IDLE_MS,
+    )
+    print(f"Replaying {replayer.stream_keys} into {REPLAY_TARGET} ({REPLAY_MODE}, group {REPLAY_GROUP}, consumer {REPLAY_CONSUMER})")
+
+    async def report():
+        while True:
+            await asyncio.sleep(10)
+            print(f"Replay: {replayer.stats}")
+
+    reporter = asyncio.get_running_loop().create_task(report())
+    try:
+        stats = await replayer.run(until_idle=REPLAY_UNTIL_IDLE)
+    finally:
+        reporter.cancel()
+        await client.close()
+    print(f"Replay finished: {stats}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nReplay stopped")
@@ -0,0 +1,227 @@
+"""
+Secondary indexes over the log stream(s) written by redis_forwarder.py.
+
+For every entry the forwarder adds its stream ID to one sorted set per
+indexed field value and hour of the ID:
+
+    <stream_key>:idx:<field>:<value>:<hour>     (hour = ms // 3600000)
+
+Members all score 0 and are the ID zero-padded (see pad_id), so ZRANGEBYLEX
+walks a bucket in stream order and a time range is a lex range. The bucket
+keys of a stream are listed in ``<stream_key>:idx:buckets`` (scored by
+hour), so that ``trim`` can drop the members of entries the stream no
+longer holds, however they were trimmed. As a backstop, buckets also expire
+``retention`` seconds after their hour ends.
+
+``StreamIndex.query`` walks the smallest index in range bucket by bucket,
+checks candidates against the other indexes with ZMSCORE and fetches the
+hits by ID, so its cost follows the result size (and the smallest index in
+the time range), not the stream length. Without filters it is an XRANGE.
+"""
+from stream_reader import parse_id
+
+INDEX_FIELDS = ("level", "source")
+HOUR_MS = 3600 * 1000
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def pad_id(entry_id) -> str:
+    """Index member for a stream ID: lex order of members is ID order"""
+    ms, seq = parse_id(entry_id)
+    return f"{ms:015d}-{seq:010d}"
+
+
+def unpad_id(member) -> str:
+    ms, seq = parse_id(member)
+    return f"{ms}-{seq}"
+
+
+def index_key(stream_key: str, field: str, value: str, hour: int) -> str:
+    return f"{stream_key}:idx:{field}:{value}:{hour}"
+
+
+def buckets_key(stream_key: str) -> str:
+    return f"{stream_key}:idx:buckets"
+
+
+def format_cursor(entry_id: str, shard: int) -> str:
+    return f"{entry_id}:{shard}"
+
+
+def parse_cursor(cursor: str):
+    """``(entry_id, shard)`` of a cursor; ValueError if it is not one"""
+    entry_id, _, shard = cursor.rpartition(":")
+    parse_id(entry_id)
+    return entry_id, int(shard)
+
+
+def _field(fields: dict, name: str):
+    value = fields.get(name)
+    if value is None:
+        value = fields.get(name.encode("utf-8"))
+    return _text(value)
+
+
+class StreamIndex:
+    """
+    ``add_many`` indexes entries after they were XADDed; ``query`` reads
+    them back. ``page_size`` is how many index members one ZRANGEBYLEX
+    fetches while filtering.
+    """
+
+    def __init__(self, client, retention: float = 7 * 24 * 3600, fields: tuple = INDEX_FIELDS, page_size: int = 500):
+        self.client = client
+        self.retention = retention
+        self.fields = tuple(fields)
+        self.page_size = page_size
+        self.indexed = 0
+
+    async def add_many(self, entries: list):
+        """Index ``[(stream_key, entry_id, fields), ...]`` in one pipeline"""
+        pipe = self.client.pipeline(transaction=False)
+        buckets = {}  # key -> (stream_key, hour)
+        for stream_key, entry_id, fields in entries:
+            hour = parse_id(entry_id)[0] // HOUR_MS
+            member = pad_id(entry_id)
+            for field in self.fields:
+                value = _field(fields, field)
+                if value:
+                    key = index_key(stream_key, field, value, hour)
+                    pipe.zadd(key, {member: 0})
+                    buckets[key] = (stream_key, hour)
+        if not buckets:
+            return
+        registries = {}  # registry key -> latest hour in it
+        for key, (stream_key, hour) in buckets.items():
+            pipe.zadd(buckets_key(stream_key), {key: hour})
+            registries[buckets_key(stream_key)] = max(hour, registries.get(buckets_key(stream_key), hour))
+            if self.retention > 0:
+                pipe.expireat(key, self._expire_at(hour))
+        if self.retention > 0:
+            for registry, hour in registries.items():
+                pipe.expireat(registry, self._expire_at(hour))
+        await pipe.execute()
+        self.indexed += len(entries)
+
+    def _expire_at(self, hour: int) -> int:
+        return int((hour + 1) * HOUR_MS / 1000 + self.retention)
+
+    async def trim(self, stream_key: str, first_id: str) -> int:
+        """
+        Drop the members of entries older than ``first_id``, the stream's
+        first entry: whole buckets of earlier hours, and the start of the
+        bucket of that hour. Returns the number of buckets dropped.
+        """
+        floor_hour = parse_id(first_id)[0] // HOUR_MS
+        registry = buckets_key(stream_key)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrangebyscore(registry, "-inf", f"({floor_hour}")
+        pipe.zrangebyscore(registry, floor_hour, floor_hour)
+        old, current = await pipe.execute()
+        pipe = self.client.pipeline(transaction=False)
+        if old:
+            pipe.delete(*old)
+            pipe.zrem(registry, *old)
+        for key in current:
+            # newer entries sort above first_id, so this can't race with add_many
+            pipe.zremrangebylex(key, "-", "(" + pad_id(first_id))
+        await pipe.execute()
+        return len(old)
+
+    async def query(self, stream_keys: list, filters: dict, start_ms: int, end_ms: int, cursor: str = None,
+                    limit: int = 100):
+        """
+        Entries ``(stream_key, entry_id, fields)`` whose IDs fall in
+        ``[start_ms, end_ms]`` and that match every ``field: value`` of
+        ``filters``, at most ``limit`` in ID order across all
+        ``stream_keys`` (equal IDs in shard order), plus the cursor of the
+        next page or None. Indexed entries that were trimmed from the stream
+        are left out, so a page can come back short.
+        """
+        low, high = pad_id(f"{start_ms}-0"), pad_id(f"{end_ms + 1}-0")
+        after_member, after_shard = None, -1
+        if cursor:
+            after_id, after_shard = parse_cursor(cursor)
+            after_member = pad_id(after_id)
+        candidates = []  # (member, shard, fields or None)
+        for shard, stream_key in enumerate(stream_keys):
+            start = "[" + low
+            if after_member is not None and after_member >= low:
+                # past the cursor: same ID only on later shards
+                start = ("[" if shard > after_shard else "(") + after_member
+            if filters:
+                members = await self._matching(stream_key, filters, start, "(" + high, limit + 1)
+                candidates.extend((member, shard, None) for member in members)
+            else:
+                # XRANGE takes the same bounds as IDs, "(" exclusive (Redis >= 6.2)
+                min_id = ("(" if start[0] == "(" else "") + unpad_id(start[1:])
+                entries = await self.client.xrange(stream_key, min=min_id, max="(" + unpad_id(high), count=limit + 1)
+                candidates.extend((pad_id(entry_id), shard, fields) for entry_id, fields in entries)
+        candidates.sort(key=lambda candidate: candidate[:2])
+        page = candidates[:limit]
+        next_cursor = format_cursor(unpad_id(page[-1][0]), page[-1][1]) if len(candidates) > limit else None
+        if filters:
+            page = await self._fetch(stream_keys, page)
+        return [(stream_keys[shard], unpad_id(member), fields) for member, shard, fields in page], next_cursor
+
+    async def _matching(self, stream_key: str, filters: dict, start: str, end: str, limit: int) -> list:
+        """Up to ``limit`` members in ``start..end`` (lex bounds) present in every filter's index"""
+        # only the hours the stream still spans can have buckets
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xrange(stream_key, count=1)
+        pipe.xrevrange(stream_key, count=1)
+        first, last = await pipe.execute()
+        if not first:
+            return []
+        first_hour = max(parse_id(start[1:])[0], parse_id(first[0][0])[0]) // HOUR_MS
+        last_hour = min(parse_id(end[1:])[0], parse_id(last[0][0])[0]) // HOUR_MS
+        buckets = [
+            [index_key(stream_key, field, value, hour) for field, value in filters.items()]
+            for hour in range(first_hour, last_hour + 1)
+        ]
+        pipe = self.client.pipeline(transaction=False)
+        for keys in buckets:
+            for key in keys:
+                pipe.zlexcount(key, start, end)
+        counts = await pipe.execute()
+
+        members = []
+        for number, keys in enumerate(buckets):
+            sizes = counts[number * len(keys):(number + 1) * len(keys)]
+            if not all(sizes):
+                continue
+            # walk the smallest index, look the candidates up in the others
+            driver = keys[sizes.index(min(sizes))]
+            others = [key for key in keys if key != driver]
+            position = start
+            while len(members) < limit:
+                batch = [_text(member) for member in await self.client.zrangebylex(
+                    driver, position, end, start=0, num=self.page_size
+                )]
+                if not batch:
+                    break
+                position = "(" + batch[-1]
+                found = batch
+                if others:
+                    pipe = self.client.pipeline(transaction=False)
+                    for key in others:
+                        pipe.zmscore(key, batch)
+                    scores = await pipe.execute()
+                    found = [member for i, member in enumerate(batch) if all(s[i] is not None for s in scores)]
+                members.extend(found)
+                if len(batch) < self.page_size:
+                    break
+            if len(members) >= limit:
+                break
+        return members[:limit]
+
+    async def _fetch(self, stream_keys: list, page: list) -> list:
+        pipe = self.client.pipeline(transaction=False)
+        for member, shard, _ in page:
+            entry_id = unpad_id(member)
+            pipe.xrange(stream_keys[shard], min=entry_id, max=entry_id, count=1)
+        results = await pipe.execute()
+        return [(member, shard, found[0][1]) for (member, shard, _), found in zip(page, results) if found]
@@ -0,0 +1,64 @@
+"""
+Readers for the log stream(s) written by redis_forwarder.py.
+
+With STREAM_SHARDS > 1 the forwarder spreads entries over several stream keys
+and publishes the layout in ``<STREAM_KEY>:shards``. These helpers find the
+shards and read them back as one stream, ordered by entry ID (arrival time).
+"""
+import heapq
+import json
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def parse_id(entry_id):
+    """``(ms, seq)`` of a stream entry ID, for ordering"""
+    ms, _, seq = _text(entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+async def discover_streams(client, stream_key: str = "logs:stream") -> list:
+    """Stream keys to read: the published shard keys, else ``stream_key`` itself"""
+    shard_map = {_text(k): _text(v) for k, v in (await client.hgetall(f"{stream_key}:shards")).items()}
+    if int(shard_map.get("count", 1)) > 1:
+        return json.loads(shard_map["keys"])
+    return [stream_key]
+
+
+async def merged_range(client, stream_keys: list, start: str = "-", end: str = "+", page_size: int = 500):
+    """
+    Async iterator of ``(stream_key, entry_id, fields)`` across all
+    ``stream_keys`` in global ID order.
+
+    Each stream is read forward with XRANGE in pages of ``page_size`` and the
+    pages are k-way merged, so memory stays at one page per stream. Entries
+    with equal IDs on different shards come out in shard order.
+    """
+    buffers = {}
+    heap = []
+
+    async def fill(index, page_start):
+        entries = await client.xrange(stream_keys[index], min=page_start, max=end, count=page_size)
+        buffers[index] = (list(reversed(entries)), len(entries) == page_size)
+
+    def push_next(index):
+        entries, more = buffers[index]
+        if entries:
+            entry_id, fields = entries.pop()
+            heapq.heappush(heap, (parse_id(entry_id), index, _text(entry_id), fields))
+            return True
+        return False
+
+    for index in range(len(stream_keys)):
+        await fill(index, start)
+        push_next(index)
+
+    while heap:
+        _, index, entry_id, fields = heapq.heappop(heap)
+        yield stream_keys[index], entry_id, fields
+        if not push_next(index) and buffers[index][1]:
+            # page used up: continue after the last ID (exclusive range, Redis >= 6.2)
+            await fill(index, f"({entry_id}")
+            push_next(index)
@@ -0,0 +1,204 @@
+"""
+Local segmented write-ahead log for stream entries the sidecar could not
+XADD (Redis down). redis_forwarder.py appends here while Redis is
+unavailable and a drainer replays the segments into the stream, oldest
+first, once it is back.
+
+Segments are ``<seq>.wal`` files of records::
+
+    >I length  >I crc32(body)  body = (>I len + bytes) for stream_key, k1, v1, k2, v2, ...
+
+A record cut short by a crash fails its length or CRC check and ends the
+segment. Values come back as bytes, which XADD stores the same as str.
+"""
+import os
+import re
+import struct
+import zlib
+
+# Optional (POSIX): flock to give every sidecar worker its own WAL directory
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_HEADER = struct.Struct(">II")
+_LEN = struct.Struct(">I")
+_WORKER_DIR = re.compile(r"worker-(\d+)")
+
+
+class WalFull(Exception):
+    """The log holds ``max_bytes`` already"""
+
+
+def _as_bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def encode_record(stream_key: str, fields: dict) -> bytes:
+    parts = [_as_bytes(stream_key)]
+    for key, value in fields.items():
+        parts.append(_as_bytes(key))
+        parts.append(_as_bytes(value))
+    body = b"".join(_LEN.pack(len(part)) + part for part in parts)
+    return _HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def decode_records(data: bytes, offset: int = 0):
+    """Yields ``(next_offset, stream_key, fields)`` from ``offset`` up to the end or the first damaged record"""
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        start, end = offset + _HEADER.size, offset + _HEADER.size + length
+        if end > len(data) or zlib.crc32(data[start:end]) != crc:
+            return
+        parts = []
+        position = start
+        while position < end:
+            (size,) = _LEN.unpack_from(data, position)
+            parts.append(data[position + _LEN.size:position + _LEN.size + size])
+            position += _LEN.size + size
+        offset = end
+        yield offset, parts[0].decode("utf-8"), dict(zip(parts[1::2], parts[2::2]))
+
+
+def claim_directory(base: str, slots: int = 1):
+    """
+    ``(directory, lock)``: the first WAL directory no other process holds,
+    ``base`` itself for slot 0 and ``base/worker-<n>`` after it. Each worker
+    of a multi-worker sidecar needs a directory of its own; the lock (an
+    open file with an flock) goes away with the process, so a restarted
+    worker picks up the segments its predecessor left. Raises OSError when
+    all ``slots`` are taken.
+    """
+    os.makedirs(base, exist_ok=True)
+    if fcntl is None:
+        if slots > 1:
+            raise OSError("a WAL per worker needs fcntl.flock")
+        return base, None
+    for slot in range(slots):
+        lock = open(os.path.join(base, f"worker-{slot}.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        return (base if slot == 0 else os.path.join(base, f"worker-{slot}")), lock
+    raise OSError(f"all {slots} WAL directories in {base} are in use")
+
+
+def adopt_orphans(base: str, directory: str) -> int:
+    """
+    Move the segments of every ``base/worker-<n>`` directory no process holds
+    (left behind by a worker that exited, e.g. when the sidecar was restarted
+    with fewer workers) into ``directory``, after its own segments, so the
+    caller replays them. Called after claim_directory, before the caller
+    opens ``directory``. Returns the number of segments moved.
+    """
+    if fcntl is None:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    names = [name for name in os.listdir(directory) if name.endswith(".wal")]
+    next_seq = max((int(name.split(".")[0]) for name in names), default=-1) + 1
+    moved = 0
+    workers = sorted(int(match.group(1)) for match in map(_WORKER_DIR.fullmatch, os.listdir(base)) if match)
+    for worker in workers:
+        orphan = os.path.join(base, f"worker-{worker}")
+        if os.path.abspath(orphan) == os.path.abspath(directory):
+            continue
+        with open(os.path.join(base, f"worker-{worker}.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue  # a live worker's
+            if not os.path.isdir(orphan):  # adopted by another worker meanwhile
+                continue
+            for name in sorted(name for name in os.listdir(orphan) if name.endswith(".wal")):
+                os.replace(os.path.join(orphan, name), os.path.join(directory, f"{next_seq:012d}.wal"))
+                next_seq += 1
+                moved += 1
+            try:
+                os.rmdir(orphan)
+            except OSError:  # something else in there: leave it
+                pass
+    return moved
+
+
+class SegmentedWal:
+    """
+    Append-only spill of ``(stream_key, fields)`` records in ``directory``.
+
+    ``append`` writes to the open segment and starts a new one past
+    ``segment_bytes``; it raises WalFull once ``max_bytes`` are on disk. The
+    reading side works on sealed segments only: ``seal()`` closes the open
+    one, ``sealed()`` lists them oldest first, ``read(path)`` returns its
+    bytes for decode_records and ``remove(path)`` deletes a drained one.
+    ``active`` is set while records are waiting, so that new entries are
+    appended behind them rather than overtaking them in the stream.
+    Segments left over from a previous run are picked up on construction.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._segments = {name: os.path.getsize(os.path.join(directory, name)) for name in self._names()}
+        self._next_seq = max((int(name.split(".")[0]) for name in self._segments), default=-1) + 1
+        self._file = None
+        self._file_name = None
+        self.appended = 0
+        self.active = bool(self._segments)
+
+    def _names(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".wal"))
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(self._segments.values())
+
+    @property
+    def full(self) -> bool:
+        return self.pending_bytes >= self.max_bytes
+
+    def append(self, entries: list):
+        """Spill ``[(stream_key, fields), ...]`` in order and mark the log active"""
+        if self.full:
+            raise WalFull(f"WAL full ({self.pending_bytes} bytes in {self.directory})")
+        if self._file is None:
+            self._file_name = f"{self._next_seq:012d}.wal"
+            self._next_seq += 1
+            self._file = open(os.path.join(self.directory, self._file_name), "ab")
+            self._segments[self._file_name] = 0
+        for stream_key, fields in entries:
+            record = encode_record(stream_key, fields)
+            self._file.write(record)
+            self._segments[self._file_name] += len(record)
+        # into the OS page cache: survives a sidecar crash, not a host crash
+        self._file.flush()
+        self.appended += len(entries)
+        self.active = True
+        if self._segments[self._file_name] >= self.segment_bytes:
+            self.seal()
+
+    def seal(self):
+        """Close the open segment so the drainer can take it"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_name = None
+
+    def sealed(self) -> list:
+        return [os.path.join(self.directory, name) for name in sorted(self._segments) if name != self._file_name]
+
+    def read(self, path: str) -> bytes:
+        with open(path, "rb") as segment:
+            return segment.read()
+
+    def remove(self, path: str):
+        os.remove(path)
+        self._segments.pop(os.path.basename(path), None)
+
+    def close(self):
+        self.seal()
@@ -5,6 +5,29 @@ Python client library for the Universal Logging Microservice.
 This module provides the UniversalLogger class for sending logs to the microservice API.
 """
 
-from .universal_logger import UniversalLogger
+import importlib
 
-__all__ = ['UniversalLogger']    
\ No newline at end of file
+# Submodules are imported on first attribute access, so ``import`` of the
+# package doesn't pay for asyncio, multiprocessing or optional dependencies
+_EXPORTS = {
+    'UniversalLogger': 'universal_logger',
+    'AsyncUniversalLogger': 'async_logger',
+    'UniversalLogHandler': 'logging_handler',
+    'Transport': 'transports',
+    'HttpBatchTransport': 'transports',
+    'ForwardTransport': 'transports',
+    'SharedRingBuffer': 'shm_ring',
+    'RingBufferTransport': 'shm_ring',
+    'RingShipper': 'shm_ring',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+
+_log = logging.getLogger("universal_logger")
+
+# Optional dependency for the asyncio client, imported by AsyncUniversalLogger
+httpx = None
+
+try:
+    from .universal_logger import BaseUniversalLogger
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from universal_logger import BaseUniversalLogger
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = asyncio.Event()
+
+
+_CLOSE = object()
+
+
+class AsyncUniversalLogger(BaseUniversalLogger):
+    """
+    asyncio-native UniversalLogger for FastAPI and other event-loop services.
+
+    Events get the same enrichment as UniversalLogger, then go onto an
+    asyncio queue. A flusher task on the running loop sends them to Fluentd's
+    in_http as JSON-array batches, using a pooled keep-alive httpx client.
+    ``await log()`` waits for queue space; ``log_nowait()`` never waits and
+    drops the event when the queue is full.
+
+    Start it and close it from the app's lifespan hooks::
+
+        @asynccontextmanager
+        async def lifespan(app):
+            await logger.start()
+            yield
+            await logger.close()
+    """
+
+    def __init__(
+        self,
+        fluentd_url: str = "http://localhost:9880",
+        auth_token: str = None,
+        service_name: str = None,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        max_connections: int = 4,
+        timeout: float = 5,
+        include_metrics: bool = True,
+        metrics_levels=None,
+        metrics_interval: float = 5.0,
+        compression: str = None,
+        compression_level: int = None,
+        compression_threshold: int = 1024,
+    ):
+        global httpx
+        if httpx is None:
+            try:
+                import httpx
+            except ImportError:
+                raise ImportError("httpx package is required for AsyncUniversalLogger") from None
+        super().__init__(
+            fluentd_url, auth_token, service_name, include_metrics, metrics_levels, metrics_interval,
+            compression, compression_level, compression_threshold,
+        )
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.dropped = 0
+
+        self._queue = None
+        self._client = None
+        self._flusher = None
+        self._in_flight = set()
+        self._send_slots = None
+
+    def _after_fork(self):
+        # The queue, client and flusher task belong to the parent's event loop;
+        # the child binds new ones on first use
+        super()._after_fork()
+        self._queue = None
+        self._client = None
+        self._flusher = None
+        self._in_flight = set()
+        self._send_slots = None
+
+    async def start(self):
+        """Bind the queue, connection pool and flusher task to the running loop"""
+        self._ensure_started()
+        return self
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _ensure_started(self):
+        if self._flusher is None:
+            # Also called lazily on first log(); needs a running loop
+            loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._send_slots = asyncio.Semaphore(self.max_connections)
+            headers = {"Content-Type": "application/json"}
+            headers.update(self._auth_headers())
+            self._client = httpx.AsyncClient(
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._flusher = loop.create_task(self._run())
+
+    async def log(self, level, message, source, metadata=None, request_id=None):
+        """Enrich and queue a log, waiting for queue space if it is full"""
+        self._ensure_started()
+        await self._queue.put(self._build_payload(level, message, source, metadata, request_id))
+        return True
+
+    def log_nowait(self, level, message, source, metadata=None, request_id=None):
+        """Fire-and-forget variant of log(); returns False if the event was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(self._build_payload(level, message, source, metadata, request_id))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._stats.record_dropped()
+            return False
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+    async def log_with_trace(self, level, message, source, trace_data=None, metadata=None):
+        """Log with distributed tracing context (see UniversalLogger.log_with_trace)"""
+        return await self.log(level, message, source, self._with_trace(metadata, trace_data))
+
+    async def flush(self, timeout: float = None) -> bool:
+        """Wait until every event queued so far has been sent (or failed)"""
+        if self._flusher is None or self._flusher.done():
+            return True
+        marker = _FlushMarker()
+        try:
+            await asyncio.wait_for(self._queue.put(marker), timeout)
+            await asyncio.wait_for(marker.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, timeout: float = None) -> bool:
+        """Drain the queue, stop the flusher task and close the connection pool"""
+        if self._flusher is None:
+            return True
+        drained = True
+        if not self._flusher.done():
+            try:
+                await asyncio.wait_for(self._queue.put(_CLOSE), timeout)
+                await asyncio.wait_for(asyncio.shield(self._flusher), timeout)
+            except asyncio.TimeoutError:
+                drained = False
+                self._flusher.cancel()
+        await self._client.aclose()
+        self._flusher = None
+        return drained
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = None
+        while True:
+            try:
+                if batch:
+                    item = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time()))
+                else:
+                    item = await self._queue.get()
+            except asyncio.TimeoutError:
+                # flush_interval elapsed with a partial batch
+                await self._dispatch(batch)
+                batch = []
+                continue
+
+            if item is _CLOSE:
+                await self._dispatch(batch)
+                await self._wait_in_flight()
+                return
+
+            if isinstance(item, _FlushMarker):
+                await self._dispatch(batch)
+                batch = []
+                await self._wait_in_flight()
+                item.done.set()
+                continue
+
+            if not batch:
+                deadline = loop.time() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._dispatch(batch)
+                batch = []
+
+    async def _dispatch(self, batch):
+        if not batch:
+            return
+        # Up to max_connections batches go out concurrently over the pool; past
+        # that the flusher waits, and the queue absorbs the backlog
+        await self._send_slots.acquire()
+        task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _wait_in_flight(self):
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _send_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            body, headers = self._encode_batch(batch)
+            response = await self._client.post(self.fluentd_url, content=body, headers=headers)
+        except Exception as e:
+            _log.error(f"Logging batch send error ({len(batch)} events): {e}")
+            self._stats.record_send(len(batch), False, time.perf_counter() - started)
+            return False
+        finally:
+            self._send_slots.release()
+        ok = 200 <= response.status_code < 300
+        self._stats.record_send(len(batch), ok, time.perf_counter() - started)
+        if not ok:
+            _log.error(
+                f"Logging batch rejected ({len(batch)} events): "
+                f"{response.status_code} - {response.text}"
+            )
+        return ok
@@ -0,0 +1,130 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from .encoder import UtcTimestamps
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from encoder import UtcTimestamps
+
+_log = logging.getLogger("universal_logger")
+
+# Parts of a message that are clearly variable (uuids, hex ids of 12+ digits,
+# the number in key=value) don't make it a new message. Other numbers do:
+# "HTTP 500" and "HTTP 404" are different messages
+_VARIABLE_RE = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|\b0x[0-9a-fA-F]+|\b[0-9a-fA-F]{12,}\b|(?<==)-?\d+(?:\.\d+)?"
+)
+
+
+def message_template(message) -> str:
+    return _VARIABLE_RE.sub("<*>", str(message))
+
+
+class _Entry:
+    __slots__ = ("payload", "count", "last_timestamp", "samples", "deadline")
+
+    def __init__(self, payload, deadline):
+        self.payload = payload
+        self.count = 1
+        self.last_timestamp = payload["timestamp"]
+        self.samples = [payload["metadata"]]
+        self.deadline = deadline
+
+
+class Coalescer:
+    """
+    Folds repeated events into one.
+
+    Events with the same (level, source, message template) seen within
+    ``window`` seconds of the first one are emitted once, with
+    ``repeat_count``, ``first_timestamp``/``last_timestamp`` and up to
+    ``max_samples`` distinct metadata dicts in ``metadata_samples``. Only the
+    first event of a window is enriched; repeats just bump the counter.
+
+    Open windows live in an LRU table of at most ``max_keys`` entries; when it
+    is full the least recently repeated entry is emitted early. A daemon
+    thread emits entries whose window has closed via ``emit(payload)``.
+    """
+
+    def __init__(self, emit, window: float = 1.0, max_keys: int = 1024, max_samples: int = 5):
+        self.emit = emit
+        self.window = window
+        self.max_keys = max_keys
+        self.max_samples = max_samples
+        self.coalesced = 0
+        self._timestamps = UtcTimestamps()
+        self._start()
+
+    def _start(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="universal-logger-coalescer", daemon=True
+        )
+        self._thread.start()
+
+    def _after_fork(self):
+        # Open windows belong to the parent, which will emit them
+        if not self._stop.is_set():
+            self._start()
+
+    def offer(self, level, source, message, metadata, build_payload) -> bool:
+        """Record one event; ``build_payload()`` is only called for the first of a window"""
+        key = (level, source, message_template(message))
+        evicted = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.count += 1
+                entry.last_timestamp = self._timestamps.now()
+                if metadata and len(entry.samples) < self.max_samples and metadata not in entry.samples:
+                    entry.samples.append(metadata)
+                self._entries.move_to_end(key)
+                self.coalesced += 1
+                return True
+            self._entries[key] = _Entry(build_payload(), time.monotonic() + self.window)
+            if len(self._entries) > self.max_keys:
+                _, evicted = self._entries.popitem(last=False)
+        if evicted is not None:
+            self._emit(evicted)
+        return True
+
+    def flush(self):
+        """Emit every open entry now"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._emit(entry)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self.flush()
+
+    def _emit(self, entry):
+        payload = entry.payload
+        if entry.count > 1:
+            payload["repeat_count"] = entry.count
+            payload["first_timestamp"] = payload["timestamp"]
+            payload["last_timestamp"] = entry.last_timestamp
+            if len(entry.samples) > 1:
+                payload["metadata_samples"] = entry.samples
+        try:
+            self.emit(payload)
+        except Exception as e:
+            _log.error(f"Coalesced log emit error: {e}")
+
+    def _run(self):
+        while not self._stop.wait(min(self.window / 2, 0.5)):
+            now = time.monotonic()
+            with self._lock:
+                expired = [key for key, entry in self._entries.items() if entry.deadline <= now]
+                entries = [self._entries.pop(key) for key in expired]
+            for entry in entries:
+                self._emit(entry)
@@ -0,0 +1,160 @@
+import gzip
+import itertools
+import json
+import logging
+import os
+import time
+
+_log = logging.getLogger("universal_logger")
+
+# Optional fast JSON encoder, imported by the first EnvelopeEncoder (None if
+# it isn't installed)
+_NOT_LOADED = object()
+orjson = _NOT_LOADED
+
+# Optional zstd compression, imported by BodyCompressor when asked for
+zstandard = None
+
+
+def uuid4_string() -> str:
+    """Random RFC 4122 version-4 UUID string, without importing ``uuid``"""
+    raw = bytearray(os.urandom(16))
+    raw[6] = (raw[6] & 0x0F) | 0x40
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class MonotonicIds:
+    """
+    Cheap unique ids: a random per-instance prefix plus a counter.
+
+    Replaces ``uuid.uuid4()`` per event (several microseconds, plus an
+    ``os.urandom`` call) with one string format.
+    """
+
+    def __init__(self):
+        self._prefix = os.urandom(8).hex()
+        self._counter = itertools.count(1)
+
+    def next(self):
+        return f"{self._prefix}-{next(self._counter):012x}"
+
+
+class UtcTimestamps:
+    """
+    ISO-8601 UTC timestamps built from a cached per-second prefix.
+
+    Matches ``datetime.now(UTC).isoformat()`` output (always with
+    microseconds) without creating a datetime per event.
+    """
+
+    def __init__(self):
+        self._cache = (None, "")
+
+    def now(self):
+        t = time.time()
+        second = int(t)
+        cached_second, prefix = self._cache
+        if second != cached_second:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            # single assignment keeps (second, prefix) consistent across threads
+            self._cache = (second, prefix)
+        return f"{prefix}.{int((t - second) * 1e6):06d}+00:00"
+
+
+class EnvelopeEncoder:
+    """
+    Serializes event dicts to JSON bytes, keys in the event's order.
+
+    Uses orjson when it is installed, set up to give the same bytes as the
+    stdlib encoder: datetimes, dataclasses and other unknown types become
+    ``str(value)`` either way, and ints past 64 bits fall back to the stdlib.
+    Only floats in exponent notation (``1e16`` against ``1e+16``), NaN and
+    infinity (``null``) and Enum members (their value) come out differently.
+    Otherwise the per-logger constant fields (``static_fields``) are
+    serialized once up front and spliced onto the encoding of the per-event
+    fields, as long as the event ends with them and still carries the
+    logger's own values.
+    """
+
+    def __init__(self, static_fields: dict = None):
+        global orjson
+        if orjson is _NOT_LOADED:
+            try:
+                import orjson
+            except ImportError:
+                orjson = None
+        self._static = dict(static_fields or {})
+        self._static_keys = list(self._static)
+        self._encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str).encode
+        if orjson is not None:
+            self._options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self._static:
+            self._suffix = "," + self._encode(self._static)[1:]
+        else:
+            self._suffix = "}"
+
+    def _matches_static(self, event):
+        if list(event)[-len(self._static_keys):] != self._static_keys:
+            return False
+        for key, value in self._static.items():
+            if event.get(key) != value:
+                return False
+        return True
+
+    def encode(self, event) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(event, default=str, option=self._options)
+            except orjson.JSONEncodeError:  # e.g. an int past 64 bits
+                pass
+        elif self._static and self._matches_static(event):
+            dynamic = {k: v for k, v in event.items() if k not in self._static}
+            head = self._encode(dynamic)[:-1]
+            return (head + self._suffix if len(head) > 1 else "{" + self._suffix[1:]).encode("utf-8")
+        return self._encode(event).encode("utf-8")
+
+    def encode_batch(self, events) -> bytes:
+        """JSON array body for Fluentd in_http"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(events, default=str, option=self._options)
+            except orjson.JSONEncodeError:
+                pass
+        return b"[" + b",".join(self.encode(event) for event in events) + b"]"
+
+
+class BodyCompressor:
+    """
+    Compresses request bodies of at least ``threshold`` bytes.
+
+    ``compress(body)`` returns ``(body, content_encoding)``, where the encoding
+    is None for bodies sent as-is. ``"zstd"`` needs the zstandard package and
+    falls back to gzip without it. Fluentd's in_http understands gzip; the
+    replay sidecar accepts gzip, deflate and zstd.
+    """
+
+    def __init__(self, algorithm: str = "gzip", level: int = None, threshold: int = 1024):
+        if algorithm not in ("gzip", "zstd"):
+            raise ValueError(f"unsupported compression {algorithm!r}; expected 'gzip' or 'zstd'")
+        global zstandard
+        if algorithm == "zstd" and zstandard is None:
+            try:
+                import zstandard
+            except ImportError:
+                _log.warning("zstandard package not installed; compressing with gzip instead")
+                algorithm = "gzip"
+        self.algorithm = algorithm
+        self.threshold = threshold
+        if algorithm == "zstd":
+            self._zstd = zstandard.ZstdCompressor(level=level if level is not None else 3)
+        else:
+            self.level = level if level is not None else 6
+
+    def compress(self, body: bytes):
+        if len(body) < self.threshold:
+            return body, None
+        if self.algorithm == "zstd":
+            return self._zstd.compress(body), "zstd"
+        return gzip.compress(body, compresslevel=self.level, mtime=0), "gzip"
@@ -0,0 +1,95 @@
+import importlib.util
+import threading
+from urllib.parse import urlsplit
+
+
+class KeepAliveConnection:
+    """
+    Stdlib-only HTTP POST client with one persistent ``http.client``
+    connection per thread.
+
+    A request on a reused connection that fails (the server closed it while
+    idle) is retried once on a fresh connection. ``http.client`` is imported
+    on construction, so it costs nothing until a logger first sends.
+    """
+
+    def __init__(self, url: str, timeout: float = 5):
+        import http.client
+
+        parts = urlsplit(url)
+        self._errors = (http.client.HTTPException, OSError)
+        self._factory = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.netloc
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._all = []
+        self._all_lock = threading.Lock()
+
+    def post(self, body: bytes, headers: dict):
+        """``(status, text)`` of one POST; raises on connection errors"""
+        conn = getattr(self._local, "conn", None)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._factory(self._host, timeout=self.timeout)
+                self._local.conn = conn
+                with self._all_lock:
+                    self._all.append(conn)
+            try:
+                conn.request("POST", self._path, body=body, headers=headers)
+                response = conn.getresponse()
+                text = response.read().decode("utf-8", "replace")
+                if response.will_close:
+                    self._drop(conn)
+                return response.status, text
+            except self._errors:
+                self._drop(conn)
+                if not reused:
+                    raise
+                conn, reused = None, False
+
+    def _drop(self, conn):
+        conn.close()
+        self._local.conn = None
+        with self._all_lock:
+            if conn in self._all:
+                self._all.remove(conn)
+
+    def close(self):
+        with self._all_lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+
+
+class RequestsConnection:
+    """Same interface as KeepAliveConnection over a ``requests.Session`` (honours proxy env vars)"""
+
+    def __init__(self, url: str, timeout: float = 5):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def post(self, body: bytes, headers: dict):
+        response = self._session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        return response.status_code, response.text
+
+    def close(self):
+        self._session.close()
+
+
+def connect(url: str, http_client: str = None, timeout: float = 5):
+    """
+    POST client for ``url``: ``"requests"``, ``"stdlib"``, or None for
+    requests when it is installed and the stdlib client otherwise
+    """
+    if http_client is None:
+        http_client = "requests" if importlib.util.find_spec("requests") else "stdlib"
+    if http_client == "requests":
+        return RequestsConnection(url, timeout)
+    if http_client == "stdlib":
+        return KeepAliveConnection(url, timeout)
+    raise ValueError(f"unknown http_client {http_client!r}; expected 'requests' or 'stdlib'")
@@ -0,0 +1,157 @@
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import weakref
+from datetime import datetime, timezone
+
+try:
+    from .universal_logger import UniversalLogger
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from universal_logger import UniversalLogger
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+_TRACE_KEYS = ("trace_id", "span_id", "parent_span_id")
+_LEVELS = {"WARNING": "WARN", "CRITICAL": "FATAL"}
+# The client library's own logger (see universal_logger._log)
+_INTERNAL_LOGGER = "universal_logger"
+
+
+def _not_internal(record):
+    # Shipping the library's own errors would feed them back into the pipeline
+    # that is failing (a root handler with Fluentd down never goes quiet)
+    return record.name != _INTERNAL_LOGGER and not record.name.startswith(_INTERNAL_LOGGER + ".")
+
+
+class _ShipHandler(logging.Handler):
+    """Runs on the QueueListener thread: LogRecord -> UniversalLogger payload"""
+
+    def __init__(self, logger, source=None):
+        super().__init__()
+        self.logger = logger
+        self.source = source
+
+    def emit(self, record):
+        metadata = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        extra = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith("_")}
+        request_id = extra.pop("request_id", None)
+        trace = extra.pop("trace", None) or {}
+        for key in _TRACE_KEYS:
+            if key in extra:
+                trace[key] = extra.pop(key)
+        metadata.update(extra)
+        if trace:
+            metadata["trace"] = trace
+
+        if record.exc_info:
+            exc_type, exc_value, _ = record.exc_info
+            metadata["exception"] = {
+                "type": exc_type.__name__ if exc_type else None,
+                "message": str(exc_value),
+                "traceback": record.exc_text or logging.Formatter().formatException(record.exc_info),
+            }
+        elif record.exc_text:
+            metadata["exception"] = {"traceback": record.exc_text}
+        if record.stack_info:
+            metadata["stack_info"] = record.stack_info
+
+        self.logger.log(
+            _LEVELS.get(record.levelname, record.levelname),
+            record.getMessage(),
+            self.source or record.name,
+            metadata,
+            request_id,
+        )
+
+
+class UniversalLogHandler(logging.handlers.QueueHandler):
+    """
+    stdlib ``logging.Handler`` that feeds existing ``logging.getLogger()`` call
+    sites into the UniversalLogger pipeline.
+
+    ``emit()`` only copies the record onto a bounded queue (dropping it and
+    counting ``dropped`` if the queue is full), so the emitting thread never
+    blocks. A ``QueueListener`` thread turns records into UniversalLogger
+    payloads, keeping ``exc_info``, ``extra`` fields and trace ids, and hands
+    them to the logger's batching transport. Records from the library's own
+    ``universal_logger`` logger are never shipped; they still propagate to
+    any other handlers.
+
+    Usage::
+
+        handler = UniversalLogHandler(service_name="checkout", fluentd_url="http://fluentd:9880/app.logs")
+        logging.getLogger().addHandler(handler)
+    """
+
+    def __init__(self, logger: UniversalLogger = None, source: str = None, max_queue_size: int = 10000, **logger_kwargs):
+        super().__init__(queue.Queue(maxsize=max_queue_size))
+        if logger is None:
+            logger_kwargs.setdefault("background", True)
+            logger = UniversalLogger(**logger_kwargs)
+        self.logger = logger
+        self.dropped = 0
+        self.addFilter(_not_internal)
+        self.listener = logging.handlers.QueueListener(self.queue, _ShipHandler(logger, source))
+        self.listener.start()
+        _live_handlers.add(self)
+
+    def _after_fork(self):
+        # The listener thread is gone in the child; the logger itself is
+        # re-initialized by universal_logger's own fork hook
+        if self.listener._thread is None:
+            return
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, *self.listener.handlers)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Resolve the message on the emitting thread (args may be mutated later)
+        # but leave formatting, exc_info and payload building to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = None):
+        """Wait until queued records reach the logger and its transport has sent them"""
+        if self.listener._thread is None:  # already closed
+            return
+        self.listener.stop()
+        self.listener.start()
+        self.logger.flush(timeout)
+
+    def close(self):
+        try:
+            if self.listener._thread is not None:
+                self.listener.stop()
+            self.logger.close()
+        finally:
+            super().close()
+
+
+_live_handlers = weakref.WeakSet()
+
+
+def _reinit_handlers_after_fork():
+    for handler in list(_live_handlers):
+        handler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_handlers_after_fork)
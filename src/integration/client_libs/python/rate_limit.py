@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens/s, holding at most ``burst``"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token; returns 0.0 on success, else seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class RatePolicy:
+    """
+    What to do with one level's events.
+
+    mode:
+        ``"drop"``   keep events up to ``rate``/s (bursts up to ``burst``),
+                     drop the rest
+        ``"sample"`` keep a ``sample_rate`` fraction of events; with ``rate``
+                     set, only events over the rate are sampled
+        ``"block"``  wait for a token, for at most ``max_wait`` seconds, then
+                     drop
+    A level without a policy keeps every event.
+    """
+
+    MODES = ("drop", "sample", "block")
+
+    def __init__(self, mode="drop", rate=None, burst=None, sample_rate=1.0, max_wait=1.0):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown rate limit mode {mode!r}; expected one of {self.MODES}")
+        if mode in ("drop", "block") and rate is None:
+            raise ValueError(f"rate limit mode {mode!r} needs a rate")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+
+
+class LevelRateLimiter:
+    """
+    Per-level admission control for UniversalLogger.
+
+    ``policies`` maps a level name to a RatePolicy or to its keyword
+    arguments, e.g.::
+
+        {"DEBUG": {"mode": "sample", "sample_rate": 0.01},
+         "INFO": {"mode": "drop", "rate": 500, "burst": 1000}}
+
+    ``"*"`` sets the policy for levels not listed. Dropped and sampled-out
+    events are counted per level until ``drain_counts()`` is called.
+    """
+
+    def __init__(self, policies: dict):
+        self._policies = {}
+        for level, policy in policies.items():
+            if isinstance(policy, dict):
+                policy = RatePolicy(**policy)
+            self._policies[level.upper()] = policy
+        self._default = self._policies.pop("*", None)
+        self._counts_lock = threading.Lock()
+        self._dropped = {}
+        self._sampled = {}
+
+    def _count(self, counts, level):
+        with self._counts_lock:
+            counts[level] = counts.get(level, 0) + 1
+
+    def admit(self, level: str) -> bool:
+        """True if an event at ``level`` should be sent (may wait in block mode)"""
+        policy = self._policies.get(level, self._default)
+        if policy is None:
+            return True
+
+        if policy.mode == "sample":
+            if policy.bucket is not None and policy.bucket.try_acquire() == 0.0:
+                return True
+            if random.random() < policy.sample_rate:
+                return True
+            self._count(self._sampled, level)
+            return False
+
+        wait = policy.bucket.try_acquire()
+        if wait and policy.mode == "block":
+            deadline = time.monotonic() + policy.max_wait
+            while wait and time.monotonic() + wait <= deadline:
+                time.sleep(wait)
+                wait = policy.bucket.try_acquire()
+        if wait:
+            self._count(self._dropped, level)
+            return False
+        return True
+
+    def _after_fork(self):
+        # Locks may have been held by another thread at fork time
+        for policy in list(self._policies.values()) + [self._default]:
+            if policy is not None and policy.bucket is not None:
+                policy.bucket._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._dropped, self._sampled = {}, {}
+
+    def drain_counts(self):
+        """``(dropped, sampled)`` per level since the last call, then reset"""
+        with self._counts_lock:
+            dropped, sampled = self._dropped, self._sampled
+            self._dropped, self._sampled = {}, {}
+        return dropped, sampled
@@ -13,6 +13,13 @@ setup(
     install_requires=[
         'requests>=2.25.1',
     ],
+    extras_require={
+        'metrics': ['psutil>=5.8'],
+        'forward': ['msgpack>=1.0'],
+        'async': ['httpx>=0.23'],
+        'fast': ['orjson>=3.6'],
+        'zstd': ['zstandard>=0.20'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
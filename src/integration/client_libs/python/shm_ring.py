@@ -0,0 +1,403 @@
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Optional (POSIX): a ring lock the kernel releases when its holder dies
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from .encoder import BodyCompressor, EnvelopeEncoder
+    from .http_client import connect
+    from .stats import ClientStats
+    from .transports import Transport
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from encoder import BodyCompressor, EnvelopeEncoder
+    from http_client import connect
+    from stats import ClientStats
+    from transports import Transport
+
+_log = logging.getLogger("universal_logger")
+
+# head, tail (monotonic byte counters) and the dropped-record count
+_HEADER = struct.Struct("=QQQ")
+_DATA_OFFSET = 64
+_LENGTH = struct.Struct(">I")
+_WRAP = 0xFFFFFFFF
+
+
+class _RingLock:
+    """
+    Cross-process lock that doesn't outlive its holder: an fcntl record lock
+    on an unlinked temporary file, which the kernel drops when the process
+    holding it dies, plus a thread lock because record locks are per
+    process. Forked and spawned processes share it through the inherited
+    ``fd``. Without fcntl it is a plain ``multiprocessing.Lock``.
+    """
+
+    def __init__(self, fd: int = None):
+        if fcntl is None:
+            self.fd = None
+            self._lock = multiprocessing.Lock()
+            return
+        if fd is None:
+            fd, path = tempfile.mkstemp(prefix="universal-logger-ring-")
+            os.unlink(path)
+        self.fd = fd
+        self._pid = os.getpid()
+        self._threads = threading.Lock()
+
+    def __enter__(self):
+        if self.fd is None:
+            self._lock.acquire()
+            return self
+        if self._pid != os.getpid():
+            # forked: a thread of the parent may have held it at fork time
+            self._pid = os.getpid()
+            self._threads = threading.Lock()
+        self._threads.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._threads.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.fd is None:
+            self._lock.release()
+            return
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self._threads.release()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SharedRingBuffer:
+    """
+    Multi-producer, single-consumer ring of byte records in shared memory.
+
+    Every record is a 4-byte length followed by the data. A record never
+    straddles the end of the buffer: the writer skips the remainder (leaving a
+    wrap marker when there is room for one) and starts again at offset 0.
+    ``put()`` never waits for the reader and drops the record (counted in
+    ``dropped``) when it doesn't fit.
+
+    Writers serialize on a lock the kernel releases if its holder dies (see
+    _RingLock), so a worker killed in the middle of ``put()`` doesn't block
+    the others. The header is only updated once a record is complete, so a
+    record it was writing is never seen.
+
+    Create the ring before forking so every worker inherits the mapping and
+    the lock. The consumer reads with ``read_batch(n)`` and only frees the
+    space with ``commit(token)`` once the batch has been delivered.
+    """
+
+    def __init__(self, size: int = 64 * 1024 * 1024, name: str = None):
+        self.capacity = int(size)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=_DATA_OFFSET + self.capacity)
+        self._buf = self._shm.buf
+        self._lock = _RingLock()
+        self._owner_pid = os.getpid()
+        _HEADER.pack_into(self._buf, 0, 0, 0, 0)
+
+    @classmethod
+    def _attach(cls, name: str, capacity: int, lock_fd: int):
+        """The ring ``name`` created by another process, e.g. in the shipper"""
+        ring = cls.__new__(cls)
+        ring.capacity = capacity
+        try:
+            ring._shm = shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+        except TypeError:
+            ring._shm = shared_memory.SharedMemory(name=name)
+            # or the resource tracker unlinks it when this process exits
+            resource_tracker.unregister(ring._shm._name, "shared_memory")
+        ring._buf = ring._shm.buf
+        ring._lock = _RingLock(lock_fd)
+        ring._owner_pid = None
+        return ring
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def put(self, data: bytes) -> bool:
+        """Append one record; returns False (and counts it) if the ring is full"""
+        need = _LENGTH.size + len(data)
+        cap = self.capacity
+        with self._lock:
+            head, tail, dropped = _HEADER.unpack_from(self._buf, 0)
+            pos = head % cap
+            pad = cap - pos if cap - pos < need else 0
+            if need > cap or head + pad + need - tail > cap:
+                _HEADER.pack_into(self._buf, 0, head, tail, dropped + 1)
+                return False
+            if pad:
+                if pad >= _LENGTH.size:
+                    _LENGTH.pack_into(self._buf, _DATA_OFFSET + pos, _WRAP)
+                head += pad
+                pos = 0
+            start = _DATA_OFFSET + pos
+            _LENGTH.pack_into(self._buf, start, len(data))
+            self._buf[start + _LENGTH.size:start + need] = data
+            _HEADER.pack_into(self._buf, 0, head + need, tail, dropped)
+        return True
+
+    def read_batch(self, max_events: int = 500):
+        """``(records, token)`` for up to ``max_events`` of the oldest records"""
+        cap = self.capacity
+        with self._lock:
+            head, tail, _ = _HEADER.unpack_from(self._buf, 0)
+        # [tail, head) is never touched by writers until commit() moves tail
+        records = []
+        while tail < head and len(records) < max_events:
+            pos = tail % cap
+            if cap - pos < _LENGTH.size:
+                tail += cap - pos
+                continue
+            (length,) = _LENGTH.unpack_from(self._buf, _DATA_OFFSET + pos)
+            if length == _WRAP:
+                tail += cap - pos
+                continue
+            start = _DATA_OFFSET + pos + _LENGTH.size
+            records.append(bytes(self._buf[start:start + length]))
+            tail += _LENGTH.size + length
+        return records, tail
+
+    def commit(self, token):
+        """Release the space of the records returned with ``token``"""
+        with self._lock:
+            head, _, dropped = _HEADER.unpack_from(self._buf, 0)
+            _HEADER.pack_into(self._buf, 0, head, token, dropped)
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            head, tail, _ = _HEADER.unpack_from(self._buf, 0)
+        return head - tail
+
+    @property
+    def dropped(self) -> int:
+        with self._lock:
+            return _HEADER.unpack_from(self._buf, 0)[2]
+
+    def close(self):
+        """Unmap the ring in this process; the creator also removes it"""
+        self._buf = None
+        self._shm.close()
+        self._lock.close()
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+
+
+class RingBufferTransport(Transport):
+    """
+    Transport that encodes events and appends them to a SharedRingBuffer.
+
+    Meant for pre-fork servers: workers only pay for encoding and a memcpy,
+    and a single RingShipper process does the network I/O for all of them.
+    """
+
+    def __init__(self, ring: SharedRingBuffer, encoder: EnvelopeEncoder = None):
+        self.ring = ring
+        self.encoder = encoder or EnvelopeEncoder()
+        self.on_batch_result = None
+        self.stats = ClientStats()
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def submit(self, event) -> bool:
+        if self.ring.put(self.encoder.encode(event)):
+            return True
+        self.stats.record_dropped()
+        return False
+
+    def send_batch(self, events) -> bool:
+        return all([self.submit(event) for event in events])
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until the shipper has drained the ring"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.ring.pending_bytes():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+# Runs in the shipper process: settings come on stdin (not argv, which ps shows)
+_SHIPPER_MAIN = (
+    "import importlib, json, sys; config = json.load(sys.stdin); sys.path[:0] = config.pop('path'); "
+    "importlib.import_module(config.pop('module'))._serve_shipper(config)"
+)
+
+
+class RingShipper:
+    """
+    Child process that drains a SharedRingBuffer to Fluentd's in_http.
+
+    Records go out as JSON-array batches of up to ``batch_size``, compressed
+    if ``compression`` is set. A failed batch is retried up to ``max_retries``
+    times with backoff and then dropped; meanwhile writers drop (and count)
+    whatever no longer fits in the ring.
+
+    The process is a fresh interpreter (``subprocess``, like the spawn start
+    method) rather than a fork: it doesn't inherit the master's threads, locks
+    or loggers, and doesn't run their ``register_at_fork`` hooks. Nor is it a
+    ``multiprocessing`` child, which workers forked later by the server would
+    treat as their own (and try to join at exit). It attaches to the ring by
+    name and gets the ring's lock as an inherited file descriptor. Start it
+    in the master before the workers, and ``stop()`` it there: SIGTERM makes
+    it ship what is left and exit.
+    """
+
+    def __init__(
+        self,
+        ring: SharedRingBuffer,
+        fluentd_url: str = "http://localhost:9880",
+        auth_token: str = None,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        compression: str = None,
+        compression_level: int = None,
+        compression_threshold: int = 1024,
+        timeout: float = 5,
+        max_retries: int = 3,
+        http_client: str = None,
+    ):
+        self.ring = ring
+        self.fluentd_url = fluentd_url
+        self.headers = {"Content-Type": "application/json"}
+        if auth_token:
+            self.headers["Authorization"] = f"Bearer {auth_token}"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compressor = (
+            BodyCompressor(compression, compression_level, compression_threshold)
+            if compression else None
+        )
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.http_client = http_client
+        # the constructor arguments again, for the shipper process
+        self._settings = {
+            "fluentd_url": fluentd_url, "auth_token": auth_token, "batch_size": batch_size,
+            "flush_interval": flush_interval, "compression": compression, "compression_level": compression_level,
+            "compression_threshold": compression_threshold, "timeout": timeout, "max_retries": max_retries,
+            "http_client": http_client,
+        }
+        self.pid = None
+        self._process = None
+        self._owner_pid = os.getpid()
+        self._stop = threading.Event()
+
+    def start(self):
+        lock_fd = self.ring._lock.fd
+        if lock_fd is None:
+            raise RuntimeError("RingShipper needs fcntl (POSIX) to share the ring's lock")
+        ready, ready_w = os.pipe()
+        config = dict(
+            self._settings, ring=self.ring.name, capacity=self.ring.capacity, lock_fd=lock_fd, ready_fd=ready_w,
+            module=__name__, path=sys.path,
+        )
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, "-c", _SHIPPER_MAIN], stdin=subprocess.PIPE, pass_fds=(lock_fd, ready_w)
+            )
+            os.close(ready_w)
+            self._process.stdin.write(json.dumps(config).encode("utf-8"))
+            self._process.stdin.close()
+            # until it handles SIGTERM, stop() would lose what is in the ring
+            started = os.read(ready, 1)
+        finally:
+            os.close(ready)
+        self.pid = self._process.pid
+        if not started:
+            self._process.wait()
+            self._process = None
+            raise RuntimeError("Ring shipper process exited on start")
+        return self
+
+    def stop(self, timeout: float = 5.0) -> bool:
+        """Ship what is left in the ring, then end the shipper process"""
+        if self._process is None or os.getpid() != self._owner_pid:
+            return True
+        self._process.terminate()
+        try:
+            self._process.wait(timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+            return False
+        finally:
+            self._process = None
+            self.pid = None
+
+    def _post(self, http, records):
+        body = b"[" + b",".join(records) + b"]"
+        headers = self.headers
+        if self.compressor is not None:
+            body, encoding = self.compressor.compress(body)
+            if encoding:
+                headers = dict(headers, **{"Content-Encoding": encoding})
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, _ = http.post(body, headers)
+                if 200 <= status < 300:
+                    return True
+                error = f"HTTP {status}"
+            except Exception as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+        _log.error(f"Ring shipper dropped {len(records)} events: {error}")
+        return False
+
+    def _run(self):
+        http = connect(self.fluentd_url, self.http_client, self.timeout)
+        while True:
+            stopping = self._stop.is_set()
+            records, token = self.ring.read_batch(self.batch_size)
+            if records:
+                self._post(http, records)
+                self.ring.commit(token)
+            elif stopping:
+                break
+            else:
+                self._stop.wait(self.flush_interval)
+        http.close()
+
+
+def _serve_shipper(config: dict):
+    """Main of the shipper process started by RingShipper.start()"""
+    # the master stops it (SIGTERM), also after a Ctrl-C to the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = SharedRingBuffer._attach(config.pop("ring"), config.pop("capacity"), config.pop("lock_fd"))
+    ready = config.pop("ready_fd")
+    shipper = RingShipper(ring, **config)
+    signal.signal(signal.SIGTERM, lambda signum, frame: shipper._stop.set())
+    os.write(ready, b"1")
+    os.close(ready)
+    try:
+        shipper._run()
+    except BaseException as e:
+        _log.error(f"Ring shipper crashed: {e}")
+        sys.exit(1)
+    finally:
+        ring.close()
@@ -0,0 +1,263 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+_log = logging.getLogger("universal_logger")
+
+_HEADER = struct.Struct(">Q")  # committed read offset of the segment
+_RECORD = struct.Struct(">I")  # length prefix of each record; 0 marks the end
+
+
+class _Segment:
+    """One fixed-size, memory-mapped spill file"""
+
+    def __init__(self, path, size):
+        self.path = path
+        exists = os.path.exists(path)
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), self.size)
+        if not exists:
+            _HEADER.pack_into(self.map, 0, _HEADER.size)
+
+        self.read_offset = _HEADER.unpack_from(self.map, 0)[0]
+        self.write_offset = _HEADER.size
+        self.pending = 0
+        # Recover the write position (and pending count) after a restart
+        while self.write_offset + _RECORD.size <= self.size:
+            length = _RECORD.unpack_from(self.map, self.write_offset)[0]
+            if length == 0 or self.write_offset + _RECORD.size + length > self.size:
+                break
+            if self.write_offset >= self.read_offset:
+                self.pending += 1
+            self.write_offset += _RECORD.size + length
+
+    def room(self):
+        return self.size - self.write_offset - _RECORD.size
+
+    def append(self, data):
+        offset = self.write_offset
+        # Body first, then the length, so a torn write never looks complete
+        self.map[offset + _RECORD.size:offset + _RECORD.size + len(data)] = data
+        _RECORD.pack_into(self.map, offset, len(data))
+        self.write_offset = offset + _RECORD.size + len(data)
+        self.pending += 1
+
+    def read(self, max_events):
+        records = []
+        offset = self.read_offset
+        while len(records) < max_events and offset < self.write_offset:
+            length = _RECORD.unpack_from(self.map, offset)[0]
+            start = offset + _RECORD.size
+            records.append(bytes(self.map[start:start + length]))
+            offset = start + length
+        return records, offset
+
+    def commit(self, offset, count):
+        self.read_offset = offset
+        self.pending -= count
+        _HEADER.pack_into(self.map, 0, offset)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self._file.close()
+
+
+class SpillQueue:
+    """
+    Append-only, segmented on-disk queue for events that could not be sent.
+
+    Events are stored as length-prefixed JSON in fixed-size memory-mapped
+    segment files under ``directory``. Readers take batches from the oldest
+    segment and ``commit()`` them once delivered; fully consumed segments are
+    deleted. Spilled events survive a process restart. Once ``max_bytes`` worth
+    of segments exist, new events are dropped (counted in ``dropped``).
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_bytes // segment_bytes)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".spill"):
+                self._segments.append((int(name.split(".")[0]), _Segment(os.path.join(directory, name), segment_bytes)))
+        self._next_id = self._segments[-1][0] + 1 if self._segments else 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(segment.pending for _, segment in self._segments)
+
+    def _roll(self):
+        # Segments fully consumed while they were still being written to
+        for sid, segment in [s for s in self._segments if s[1].pending == 0]:
+            segment.close()
+            os.remove(segment.path)
+            self._segments.remove((sid, segment))
+        if len(self._segments) >= self.max_segments:
+            return None
+        path = os.path.join(self.directory, f"{self._next_id:020d}.spill")
+        segment = _Segment(path, self.segment_bytes)
+        self._segments.append((self._next_id, segment))
+        self._next_id += 1
+        return segment
+
+    def append(self, event) -> bool:
+        """Persist one event; returns False if it was dropped"""
+        data = json.dumps(event, ensure_ascii=False, default=str).encode("utf-8")
+        with self._lock:
+            segment = self._segments[-1][1] if self._segments else None
+            if segment is None or segment.room() < len(data):
+                if len(data) > self.segment_bytes - _HEADER.size - _RECORD.size:
+                    segment = None
+                else:
+                    segment = self._roll()
+            if segment is None:
+                self.dropped += 1
+                return False
+            segment.append(data)
+            return True
+
+    def read_batch(self, max_events=100):
+        """
+        Oldest spilled events, in order, without removing them.
+
+        Returns ``(events, token)``; pass the token to ``commit()`` after the
+        events have been delivered.
+        """
+        with self._lock:
+            for segment_id, segment in self._segments:
+                records, offset = segment.read(max_events)
+                if records:
+                    return [json.loads(r) for r in records], (segment_id, offset, len(records))
+            return [], None
+
+    def commit(self, token):
+        """Mark a batch from ``read_batch()`` as delivered"""
+        if token is None:
+            return
+        segment_id, offset, count = token
+        with self._lock:
+            for i, (sid, segment) in enumerate(self._segments):
+                if sid != segment_id:
+                    continue
+                segment.commit(offset, count)
+                # A consumed segment that is no longer written to can go
+                if segment.pending == 0 and i < len(self._segments) - 1:
+                    segment.close()
+                    os.remove(segment.path)
+                    del self._segments[i]
+                return
+
+    def close(self):
+        with self._lock:
+            for _, segment in self._segments:
+                segment.close()
+            self._segments = []
+
+
+class CircuitBreaker:
+    """
+    Stops callers from waiting on an endpoint that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``allow()`` returns False. Once ``reset_timeout`` seconds have passed, a
+    single probe is allowed through (half-open); its outcome closes the
+    breaker again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    _log.warning("Logging endpoint unavailable; spilling events to disk")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class SpillReplayer:
+    """
+    Daemon thread that drains a SpillQueue once the endpoint is reachable.
+
+    Every ``interval`` seconds it asks the breaker for permission and sends the
+    oldest spilled events with ``send_batch(events) -> bool``, in order, until
+    the queue is empty or a send fails.
+    """
+
+    def __init__(self, spill, breaker, send_batch, batch_size=100, interval=1.0):
+        self.spill = spill
+        self.breaker = breaker
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="universal-logger-spill-replay", daemon=True
+        )
+        self._thread.start()
+
+    def replay(self) -> int:
+        """Send spilled batches until empty or a failure; returns events sent"""
+        sent = 0
+        while not self._stop.is_set():
+            if not self.breaker.allow():
+                break
+            events, token = self.spill.read_batch(self.batch_size)
+            if not events:
+                break
+            if not self.send_batch(events):
+                self.breaker.record_failure()
+                break
+            self.breaker.record_success()
+            self.spill.commit(token)
+            sent += len(events)
+        return sent
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.replay()
+            except Exception as e:
+                _log.error(f"Spill replay error: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
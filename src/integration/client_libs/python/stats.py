@@ -0,0 +1,96 @@
+import bisect
+import threading
+
+# Latency bucket upper bounds in ms: 0.05 ms .. ~100 s, four buckets per doubling
+_LATENCY_BOUNDS_MS = [0.05 * 2 ** (i / 4) for i in range(84)]
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced buckets (about 19% wide), so recording is one bisect and
+    percentiles are read from bucket bounds rather than stored samples.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(_LATENCY_BOUNDS_MS) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect.bisect_left(_LATENCY_BOUNDS_MS, ms)] += 1
+        self.total += 1
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q: float):
+        """Upper bound of the bucket holding the q-th percentile (None if empty)"""
+        if not self.total:
+            return None
+        rank = q / 100.0 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                bound = _LATENCY_BOUNDS_MS[i] if i < len(_LATENCY_BOUNDS_MS) else self.max
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+
+class ClientStats:
+    """
+    Counters kept by a logger instead of printing per event.
+
+    ``sent``/``failed`` count events, ``batches`` and the batch size figures
+    count send attempts, and every attempt's duration goes into a latency
+    histogram. Updated from the caller and flusher threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.latency = LatencyHistogram()
+
+    def record_send(self, events: int, ok: bool, seconds: float):
+        with self._lock:
+            if ok:
+                self.sent += events
+            else:
+                self.failed += events
+            self.batches += 1
+            if events > self.max_batch:
+                self.max_batch = events
+            self.latency.record(seconds * 1000.0)
+
+    def record_dropped(self, events: int = 1):
+        with self._lock:
+            self.dropped += events
+
+    def record_rate_limited(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = self.latency
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "rate_limited": self.rate_limited,
+                "batches": self.batches,
+                "batch_size": {
+                    "mean": round((self.sent + self.failed) / self.batches, 2) if self.batches else 0,
+                    "max": self.max_batch,
+                },
+                "latency_ms": {
+                    "count": latency.total,
+                    "p50": latency.percentile(50),
+                    "p99": latency.percentile(99),
+                    "max": round(latency.max, 3),
+                },
+            }
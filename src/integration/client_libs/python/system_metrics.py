@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+# psutil is slow to import; loaded when the first sampler is created
+psutil = None
+
+
+class SystemMetricsSampler:
+    """
+    Samples process/host metrics on a daemon thread.
+
+    ``snapshot()`` only returns the most recent cached sample, so callers never
+    pay for ``psutil`` (or the 100 ms ``cpu_percent`` interval) on their own
+    thread. CPU usage is measured over the time between two samples.
+    ``set_interval()`` applies at once: the thread wakes up and samples as
+    soon as the new interval has passed since the last sample. ``clock`` is
+    the time source for those intervals; ``sampled`` is set after every
+    sample.
+    """
+
+    def __init__(self, interval: float = 5.0, clock=time.monotonic):
+        global psutil
+        if psutil is None:
+            import psutil
+        self.interval = interval
+        self._clock = clock
+        self._process = psutil.Process(os.getpid())
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.sampled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            # Prime cpu_percent() so the next call measures a real interval
+            psutil.cpu_percent(interval=None)
+            self._latest = self._sample()
+            self._sampled_at = self._clock()
+            self._thread = threading.Thread(
+                target=self._run, name="universal-logger-metrics", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def _after_fork(self):
+        running = self._thread is not None and self._thread.is_alive()
+        self._process = psutil.Process(os.getpid())
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.sampled = threading.Event()
+        self._thread = None
+        if running:
+            self.start()
+
+    def set_interval(self, interval: float):
+        self.interval = interval
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def snapshot(self):
+        """Latest sampled metrics (a copy; empty before the first sample)"""
+        return dict(self._latest)
+
+    def _run(self):
+        while not self._stop.is_set():
+            due = self._sampled_at + self.interval - self._clock()
+            if due > 0:
+                self._wake.wait(due)
+                self._wake.clear()
+                continue  # stopped, a new interval, or time to check again
+            self._latest = self._sample()
+            self._sampled_at = self._clock()
+            self.sampled.set()
+
+    def _sample(self):
+        try:
+            return {
+                "cpu_percent": psutil.cpu_percent(interval=None),
+                "memory_usage_mb": self._process.memory_info().rss / (1024 * 1024),
+                "memory_percent": self._process.memory_percent(),
+                "disk_usage_percent": psutil.disk_usage("/").percent,
+            }
+        except Exception as e:
+            return {"metrics_error": str(e)}
+
+
+_shared_sampler = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_sampler(interval: float = 5.0) -> SystemMetricsSampler:
+    """
+    Process-wide sampler shared by every logger.
+
+    If a logger asks for a shorter refresh period than the running sampler
+    uses, the sampler switches to the shorter one right away.
+    """
+    global _shared_sampler
+    with _shared_lock:
+        if _shared_sampler is None:
+            _shared_sampler = SystemMetricsSampler(interval)
+        elif interval < _shared_sampler.interval:
+            _shared_sampler.set_interval(interval)
+        return _shared_sampler.start()
+
+
+def _reinit_after_fork():
+    global _shared_lock
+    _shared_lock = threading.Lock()
+    if _shared_sampler is not None:
+        _shared_sampler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
@@ -0,0 +1,397 @@
+import atexit
+import base64
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+try:
+    from .encoder import BodyCompressor, EnvelopeEncoder
+    from .http_client import connect
+    from .stats import ClientStats
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from encoder import BodyCompressor, EnvelopeEncoder
+    from http_client import connect
+    from stats import ClientStats
+
+_log = logging.getLogger("universal_logger")
+
+# Optional dependency for the Fluentd forward protocol, imported by ForwardTransport
+msgpack = None
+
+
+class _FlushMarker:
+    """Queue item asking the flusher to send everything queued before it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_CLOSE = object()
+
+
+class Transport:
+    """
+    Interface UniversalLogger uses to hand off enriched events.
+
+    ``submit()`` must not block the caller for long; ``flush()`` and
+    ``close()`` return True once everything submitted has been handled.
+    """
+
+    def submit(self, event) -> bool:
+        raise NotImplementedError
+
+    def send_batch(self, records) -> bool:
+        """Deliver a list of events right away (used to replay spilled events)"""
+        return all(self.submit(record) for record in records)
+
+    def flush(self, timeout: float = None) -> bool:
+        return True
+
+    def close(self, timeout: float = None) -> bool:
+        return True
+
+    def queue_depth(self) -> int:
+        """Events accepted but not yet handed to the network"""
+        return 0
+
+    def _after_fork(self):
+        """Called in a forked child: rebuild threads, locks and connections"""
+
+
+class BatchingTransport(Transport):
+    """
+    Base for transports that send from a background flusher thread.
+
+    Events go into a bounded in-memory queue and a daemon flusher thread hands
+    them to ``_send_batch()`` in batches of up to ``batch_size`` events, or
+    whatever has arrived after ``flush_interval`` seconds. ``submit()`` never
+    blocks: when the queue is full the event is dropped and counted in
+    ``dropped``. If set, ``on_batch_result(records, ok)`` is called from the
+    flusher thread after every send attempt. Send outcomes, batch sizes and
+    latencies go to ``stats`` (a ClientStats; the logger installs its own).
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.on_batch_result = None
+        self.stats = ClientStats()
+
+        self._max_queue_size = max_queue_size
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self._max_queue_size)
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="universal-logger-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def _after_fork(self):
+        # The flusher thread did not survive the fork and the parent's queued
+        # events are the parent's to send: start over with an empty queue.
+        self.stats = ClientStats()
+        if not self._closed:
+            self._start()
+
+    def submit(self, event) -> bool:
+        """Queue one event for sending; returns False if it was dropped"""
+        if not self._closed:
+            try:
+                self._queue.put_nowait(self._wrap(event))
+                return True
+            except queue.Full:
+                pass
+        self.dropped += 1
+        self.stats.record_dropped()
+        return False
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every event queued so far has been sent (or failed)"""
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = None) -> bool:
+        """Drain the queue, stop the flusher thread and release connections"""
+        if self._closed:
+            return True
+        self._closed = True
+        atexit.unregister(self.close)
+        drained = True
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_CLOSE, timeout=timeout)
+            except queue.Full:
+                drained = False
+            self._thread.join(timeout)
+            drained = drained and not self._thread.is_alive()
+        self._release()
+        return drained
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            if batch:
+                wait = max(0.0, deadline - time.monotonic())
+            else:
+                wait = None
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                # flush_interval elapsed with a partial batch
+                self._deliver(batch)
+                batch = []
+                continue
+
+            if item is _CLOSE:
+                self._deliver(batch)
+                return
+
+            if isinstance(item, _FlushMarker):
+                self._deliver(batch)
+                batch = []
+                item.done.set()
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._deliver(batch)
+                batch = []
+
+    def _deliver(self, batch):
+        if not batch:
+            return
+        try:
+            ok = self._timed_send(batch)
+        except Exception as e:
+            # e.g. an event that can't be encoded: drop the batch, keep the thread
+            _log.error(f"Logging batch dropped ({len(batch)} events): {e!r}")
+            self.dropped += len(batch)
+            self.stats.record_dropped(len(batch))
+            ok = False
+        if self.on_batch_result is not None:
+            try:
+                self.on_batch_result([self._unwrap(item) for item in batch], ok)
+            except Exception as e:
+                _log.error(f"Logging batch callback error: {e}")
+
+    def send_batch(self, records) -> bool:
+        return self._timed_send([self._wrap(record) for record in records])
+
+    def _timed_send(self, batch) -> bool:
+        with self._send_lock:
+            started = time.perf_counter()
+            ok = self._send_batch(batch)
+            self.stats.record_send(len(batch), ok, time.perf_counter() - started)
+        return ok
+
+    def _wrap(self, event):
+        """Turn a submitted event into the queued item (see ForwardTransport)"""
+        return event
+
+    def _unwrap(self, item):
+        return item
+
+    def _send_batch(self, batch) -> bool:
+        raise NotImplementedError
+
+    def _release(self):
+        """Close sockets/sessions once the flusher has stopped"""
+
+
+class HttpBatchTransport(BatchingTransport):
+    """
+    Ships batches to Fluentd's in_http as JSON arrays over a keep-alive
+    connection: a ``requests`` session, or plain ``http.client`` with
+    ``http_client="stdlib"`` (the default when requests isn't installed)
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict = None,
+        encoder: EnvelopeEncoder = None,
+        compressor: BodyCompressor = None,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        timeout: float = 5,
+        http_client: str = None,
+    ):
+        self.url = url
+        self.headers = {"Content-Type": "application/json"}
+        if headers:
+            self.headers.update(headers)
+        self.timeout = timeout
+        self.encoder = encoder or EnvelopeEncoder()
+        self.compressor = compressor
+        self.http_client = http_client
+        self._http = connect(url, http_client, timeout)
+        super().__init__(batch_size, flush_interval, max_queue_size)
+
+    def _release(self):
+        self._http.close()
+
+    def _after_fork(self):
+        # Never reuse the parent's pooled connections in the child
+        self._http = connect(self.url, self.http_client, self.timeout)
+        super()._after_fork()
+
+    def _send_batch(self, batch):
+        if not batch:
+            return False
+        body = self.encoder.encode_batch(batch)
+        headers = self.headers
+        if self.compressor is not None:
+            body, encoding = self.compressor.compress(body)
+            if encoding:
+                headers = dict(headers, **{"Content-Encoding": encoding})
+        try:
+            status, text = self._http.post(body, headers)
+        except Exception as e:
+            _log.error(f"Logging batch send error ({len(batch)} events): {e}")
+            return False
+        if not 200 <= status < 300:
+            _log.error(f"Logging batch rejected ({len(batch)} events): {status} - {text}")
+            return False
+        return True
+
+
+class ForwardTransport(BatchingTransport):
+    """
+    Fluentd forward protocol (msgpack over TCP, port 24224).
+
+    Each batch is one ``PackedForward`` message over a persistent connection.
+    With ``ack=True`` every message carries a ``chunk`` id and is resent
+    (after reconnecting) until Fluentd acknowledges it or ``max_retries`` is
+    exhausted, giving at-least-once delivery.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 24224,
+        tag: str = "app.logs",
+        ack: bool = False,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        timeout: float = 5,
+        max_retries: int = 3,
+    ):
+        global msgpack
+        if msgpack is None:
+            try:
+                import msgpack
+            except ImportError:
+                raise ImportError("msgpack package is required for ForwardTransport") from None
+        self.host = host
+        self.port = port
+        self.tag = tag
+        self.ack = ack
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._sock = None
+        self._unpacker = None
+        super().__init__(batch_size, flush_interval, max_queue_size)
+
+    def _wrap(self, event):
+        # Stamp the event time on the caller's thread, not at send time
+        return (time.time(), event)
+
+    def _unwrap(self, item):
+        return item[1]
+
+    @staticmethod
+    def _event_time(ts):
+        """Fluentd EventTime ext type (seconds + nanoseconds)"""
+        sec = int(ts)
+        return msgpack.ExtType(0, struct.pack(">II", sec, int((ts - sec) * 1e9)))
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._unpacker = msgpack.Unpacker(raw=False)
+        return self._sock
+
+    def _release(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._unpacker = None
+
+    def _after_fork(self):
+        # Closing the inherited fd only affects this process
+        self._release()
+        super()._after_fork()
+
+    def _read_ack(self, sock):
+        while True:
+            for response in self._unpacker:
+                return response
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("connection closed while waiting for ack")
+            self._unpacker.feed(data)
+
+    def _send_batch(self, batch):
+        if not batch:
+            return False
+        # str() what msgpack can't pack, like json.dumps(..., default=str) on the HTTP path
+        packer = msgpack.Packer(use_bin_type=True, default=str)
+        entries = b"".join(packer.pack([self._event_time(ts), record]) for ts, record in batch)
+        option = {"size": len(batch)}
+        chunk_id = None
+        if self.ack:
+            chunk_id = base64.b64encode(os.urandom(16)).decode("ascii")
+            option["chunk"] = chunk_id
+        message = packer.pack([self.tag, entries, option])
+
+        last_error = None
+        for _ in range(self.max_retries + 1 if self.ack else 2):
+            try:
+                sock = self._connect()
+                sock.sendall(message)
+                if chunk_id is not None:
+                    response = self._read_ack(sock)
+                    if not isinstance(response, dict) or response.get("ack") != chunk_id:
+                        raise ConnectionError(f"unexpected ack response: {response!r}")
+                return True
+            except (OSError, ValueError) as e:
+                # Broken or stale connection: reconnect and resend the same chunk
+                last_error = e
+                self._release()
+        _log.error(f"Logging forward send error ({len(batch)} events): {last_error}")
+        return False
@@ -1,35 +1,66 @@
 import logging
-import requests
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 import socket
 import os
-import uuid
+import time
+import weakref
 
-import psutil
+# Where the library reports its own failures; UniversalLogHandler doesn't ship
+# these records, so a broken endpoint can't feed its errors back to itself
+_log = logging.getLogger("universal_logger")
 
-try:
-    from pytz import UTC
-except ImportError:
-    from datetime import timezone
-    UTC = timezone.utc
+UTC = timezone.utc
 
-# Optional rate limiter dependency
 try:
-    from ratelimiter import RateLimiter
-except Exception:
-    RateLimiter = None
+    from .coalescer import Coalescer
+    from .encoder import BodyCompressor, EnvelopeEncoder, MonotonicIds, UtcTimestamps, uuid4_string
+    from .http_client import connect
+    from .rate_limit import LevelRateLimiter
+    from .spill_queue import CircuitBreaker, SpillQueue, SpillReplayer
+    from .stats import ClientStats
+    from .system_metrics import get_shared_sampler
+    from .transports import HttpBatchTransport
+except ImportError:  # loaded as a top-level module (sys.path includes this dir)
+    from coalescer import Coalescer
+    from encoder import BodyCompressor, EnvelopeEncoder, MonotonicIds, UtcTimestamps, uuid4_string
+    from http_client import connect
+    from rate_limit import LevelRateLimiter
+    from spill_queue import CircuitBreaker, SpillQueue, SpillReplayer
+    from stats import ClientStats
+    from system_metrics import get_shared_sampler
+    from transports import HttpBatchTransport
 
 
-class UniversalLogger:
-    """Universal Logger with Metrics, Correlation, and optional rate limiting"""
+_live_loggers = weakref.WeakSet()
+
+
+def _reinit_loggers_after_fork():
+    for logger in list(_live_loggers):
+        try:
+            logger._after_fork()
+        except Exception as e:
+            _log.error(f"Logger re-init after fork failed: {e}")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_loggers_after_fork)
+
+
+class BaseUniversalLogger:
+    """Correlation fields and payload enrichment shared by the sync and async loggers"""
 
     def __init__(
         self,
         fluentd_url: str = "http://localhost:9880",
         auth_token: str = None,
         service_name: str = None,
-        rate_limit_calls: int = None,
-        rate_limit_period: int = None,
+        include_metrics: bool = True,
+        metrics_levels=None,
+        metrics_interval: float = 5.0,
+        compression: str = None,
+        compression_level: int = None,
+        compression_threshold: int = 1024,
     ):
         self.fluentd_url = fluentd_url
         self.auth_token = auth_token
@@ -37,7 +68,7 @@ class UniversalLogger:
         self.process_id = os.getpid()
 
         # Generate unique session ID for correlation
-        self.session_id = str(uuid.uuid4())
+        self.session_id = uuid4_string()
 
         # Store service name
         self.service_name = service_name or "unknown-service"
@@ -45,27 +76,78 @@ class UniversalLogger:
         # Track log sequence for this session
         self.log_sequence = 0
 
-        # Rate limiting (optional)
-        self._rate_limit_calls = rate_limit_calls
-        self._rate_limit_period = rate_limit_period
-        self._limiter = None
-        if (
-            rate_limit_calls is not None
-            and rate_limit_period is not None
-            and RateLimiter is not None
-        ):
-            try:
-                self._limiter = RateLimiter(max_calls=rate_limit_calls, period=rate_limit_period)
-            except Exception as e:
-                logging.warning(f"RateLimiter init failed: {e}; continuing without limiter")
-                self._limiter = None
-        elif (rate_limit_calls is not None or rate_limit_period is not None) and RateLimiter is None:
-            logging.warning("ratelimiter package not installed; running without rate limiting")
+        # Hot-path helpers: counter-based request ids, cached timestamp prefix,
+        # and an encoder with the constant fields pre-serialized
+        self._ids = MonotonicIds()
+        self._timestamps = UtcTimestamps()
+        self._encoder = self._make_encoder()
+
+        # Batch body compression (optional): "gzip", or "zstd" if zstandard is installed
+        self._compressor = (
+            BodyCompressor(compression, compression_level, compression_threshold)
+            if compression else None
+        )
+
+        # System metrics come from a shared background sampler; None disables them.
+        # metrics_levels optionally restricts enrichment to e.g. {"ERROR", "WARN"}.
+        self._metrics_levels = (
+            {lvl.upper() for lvl in metrics_levels} if metrics_levels is not None else None
+        )
+        # The sampler (and psutil) start on the first log call that needs metrics.
+        self._include_metrics = include_metrics
+        self._metrics_interval = metrics_interval
+        self._sampler = None
+
+        # Send outcomes, drops and latencies, see stats()
+        self._stats = ClientStats()
+
+        # Forked workers (gunicorn, uwsgi, multiprocessing) get their own
+        # identity and background machinery, see _after_fork()
+        _live_loggers.add(self)
+
+    def _make_encoder(self):
+        return EnvelopeEncoder({
+            "session_id": self.session_id,
+            "hostname": self.hostname,
+            "process_id": self.process_id,
+            "service_name": self.service_name,
+        })
+
+    def _after_fork(self):
+        """Runs in a forked child: new process id, session and counters"""
+        self.process_id = os.getpid()
+        self.session_id = uuid4_string()
+        self.log_sequence = 0
+        self._ids = MonotonicIds()
+        self._encoder = self._make_encoder()
+        self._stats = ClientStats()
+
+    def stats(self) -> dict:
+        """
+        Counters since start: events sent/failed/dropped/rate-limited, send
+        attempts (``batches``) with mean/max size, and send latency p50/p99
+        """
+        return self._stats.snapshot()
+
+    def _auth_headers(self):
+        if self.auth_token:
+            return {"Authorization": f"Bearer {self.auth_token}"}
+        return {}
+
+    def _encode_batch(self, events):
+        """``(body, headers)`` for a JSON-array batch, compressed if configured"""
+        headers = {"Content-Type": "application/json"}
+        body = self._encoder.encode_batch(events)
+        if self._compressor is not None:
+            body, encoding = self._compressor.compress(body)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+        return body, headers
 
     def _ensure_utc_timestamp(self, timestamp=None):
         """Ensure timestamp is in UTC ISO format"""
         if timestamp is None:
-            return datetime.now(UTC).isoformat()
+            return self._timestamps.now()
 
         if isinstance(timestamp, str):
             try:
@@ -84,48 +166,23 @@ class UniversalLogger:
 
         return datetime.now(UTC).isoformat()
 
-    def _get_system_metrics(self):
-        """Collect system metrics"""
-        try:
-            process = psutil.Process(self.process_id)
-            return {
-                "cpu_percent": psutil.cpu_percent(interval=0.1),
-                "memory_usage_mb": process.memory_info().rss / (1024 * 1024),
-                "memory_percent": process.memory_percent(),
-                "disk_usage_percent": psutil.disk_usage("/").percent,
-            }
-        except Exception as e:
-            return {"metrics_error": str(e)}
-
-    def _send_request(self, payload):
-        headers = {"Content-Type": "application/json"}
-        if self.auth_token:
-            headers["Authorization"] = f"Bearer {self.auth_token}"
-
-        if self._limiter:
-            try:
-                with self._limiter:
-                    return requests.post(self.fluentd_url, json=payload, headers=headers, timeout=5)
-            except Exception as e:
-                logging.error(f"Logging send error under limiter: {e}")
-                return None
-        else:
+    def _get_system_metrics(self, level=None):
+        """Latest cached system metrics, or None if disabled for this logger/level"""
+        if not self._include_metrics:
+            return None
+        if self._metrics_levels is not None and level not in self._metrics_levels:
+            return None
+        if self._sampler is None:
             try:
-                return requests.post(self.fluentd_url, json=payload, headers=headers, timeout=5)
-            except Exception as e:
-                logging.error(f"Logging send error: {e}")
+                self._sampler = get_shared_sampler(self._metrics_interval)
+            except ImportError:
+                _log.warning("psutil package not installed; sending logs without system metrics")
+                self._include_metrics = False
                 return None
+        return self._sampler.snapshot()
 
-    def log(self, level, message, source, metadata=None, request_id=None):
-        """
-        Send enriched log to Fluentd
-        Args:
-            level: Log level (INFO, ERROR, etc.)
-            message: Log message
-            source: Source of log (app name)
-            metadata: Additional metadata dict
-            request_id: Optional request ID for correlation
-        """
+    def _build_payload(self, level, message, source, metadata=None, request_id=None):
+        """Enriched event dict for one log call"""
         if metadata is None:
             metadata = {}
 
@@ -134,45 +191,332 @@ class UniversalLogger:
 
         # Generate request ID if not provided
         if request_id is None:
-            request_id = str(uuid.uuid4())
+            request_id = self._ids.next()
 
         # Ensure UTC timestamp
         timestamp = self._ensure_utc_timestamp(metadata.get("timestamp"))
 
-        # Get system metrics
-        metrics = self._get_system_metrics()
+        level = level.upper()
+
+        # Get system metrics (cached snapshot, never sampled inline)
+        metrics = self._get_system_metrics(level)
 
         # Build enriched payload
         payload = {
             "timestamp": timestamp,
-            "level": level.upper(),
+            "level": level,
             "message": message,
             "source": source,
             # Correlation fields
-            "session_id": self.session_id,
             "request_id": request_id,
             "sequence": self.log_sequence,
-            # System info
-            "hostname": self.hostname,
-            "process_id": self.process_id,
-            "service_name": self.service_name,
-            # Metrics
-            "metrics": metrics,
             # User metadata
             "metadata": metadata,
         }
+        if metrics is not None:
+            payload["metrics"] = metrics
+        # Per-logger fields last, where the encoder splices them in pre-serialized
+        payload["session_id"] = self.session_id
+        payload["hostname"] = self.hostname
+        payload["process_id"] = self.process_id
+        payload["service_name"] = self.service_name
+        return payload
+
+    @staticmethod
+    def _with_trace(metadata, trace_data):
+        if metadata is None:
+            metadata = {}
+        if trace_data:
+            metadata["trace"] = trace_data
+        return metadata
+
+
+class UniversalLogger(BaseUniversalLogger):
+    """Universal Logger with Metrics, Correlation, and optional rate limiting"""
+
+    def __init__(
+        self,
+        fluentd_url: str = "http://localhost:9880",
+        auth_token: str = None,
+        service_name: str = None,
+        rate_limit_calls: int = None,
+        rate_limit_period: int = None,
+        rate_limits: dict = None,
+        rate_limit_report_interval: float = 60.0,
+        background: bool = False,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        include_metrics: bool = True,
+        metrics_levels=None,
+        metrics_interval: float = 5.0,
+        compression: str = None,
+        compression_level: int = None,
+        compression_threshold: int = 1024,
+        transport=None,
+        spill_dir: str = None,
+        spill_max_bytes: int = 256 * 1024 * 1024,
+        spill_segment_bytes: int = 16 * 1024 * 1024,
+        breaker_failures: int = 3,
+        breaker_reset_timeout: float = 30.0,
+        replay_batch_size: int = 100,
+        replay_interval: float = 1.0,
+        coalesce_window: float = None,
+        coalesce_max_keys: int = 1024,
+        coalesce_max_samples: int = 5,
+        stats_interval: float = None,
+        verbose: bool = False,
+        http_client: str = None,
+    ):
+        super().__init__(
+            fluentd_url, auth_token, service_name, include_metrics, metrics_levels, metrics_interval,
+            compression, compression_level, compression_threshold,
+        )
+
+        # Rate limiting / sampling (optional): per-level policies, see LevelRateLimiter.
+        # rate_limit_calls/rate_limit_period keep their old meaning: every level
+        # waits for a slot, up to one period.
+        self._rate_limit_calls = rate_limit_calls
+        self._rate_limit_period = rate_limit_period
+        policies = dict(rate_limits or {})
+        if rate_limit_calls is not None and rate_limit_period is not None:
+            policies.setdefault("*", {
+                "mode": "block",
+                "rate": rate_limit_calls / rate_limit_period,
+                "burst": rate_limit_calls,
+                "max_wait": rate_limit_period,
+            })
+        elif rate_limit_calls is not None or rate_limit_period is not None:
+            _log.warning("rate_limit_calls and rate_limit_period must be set together; ignoring")
+        self._limiter = LevelRateLimiter(policies) if policies else None
+        self._limit_report_interval = rate_limit_report_interval
+        self._next_limit_report = time.monotonic() + rate_limit_report_interval
+
+        # Pluggable transport (e.g. ForwardTransport); background=True picks the
+        # JSON-over-HTTP batching transport. Without either, log() posts inline.
+        # http_client: "requests", "stdlib" (http.client only, fastest to
+        # import), or None for requests when installed. Inline sends open a
+        # keep-alive connection on first use.
+        self.http_client = http_client
+        self._http = None
+        self._http_lock = threading.Lock()
+        self._transport = transport
+        if transport is None and background:
+            self._transport = HttpBatchTransport(
+                self.fluentd_url,
+                headers=self._auth_headers(),
+                encoder=self._encoder,
+                compressor=self._compressor,
+                batch_size=batch_size,
+                flush_interval=flush_interval,
+                max_queue_size=max_queue_size,
+                http_client=http_client,
+            )
+        if hasattr(self._transport, "stats"):
+            self._transport.stats = self._stats
+
+        # Disk spill (optional): undeliverable events are written to spill_dir,
+        # a circuit breaker stops callers waiting on a dead endpoint, and a
+        # replayer sends the spilled events in order once it is back.
+        self._spill_dir = spill_dir
+        self._spill_options = (
+            spill_max_bytes, spill_segment_bytes, breaker_failures, breaker_reset_timeout,
+            replay_batch_size, replay_interval,
+        )
+        self._spill = None
+        self._breaker = None
+        self._replayer = None
+        if spill_dir:
+            self._start_spill(spill_dir)
+
+        # Self-metrics (optional): every stats_interval seconds stats() goes out
+        # as an INFO event from source "universal-logger". verbose=True brings
+        # back the per-event console lines.
+        self._stats_interval = stats_interval
+        self._next_stats_report = time.monotonic() + stats_interval if stats_interval else None
+        self.verbose = verbose
+
+        # Repeated-message coalescing (optional): identical (level, source,
+        # message template) events within coalesce_window seconds become one
+        self._coalescer = None
+        if coalesce_window:
+            self._coalescer = Coalescer(
+                self._send, coalesce_window, coalesce_max_keys, coalesce_max_samples
+            )
+
+    def _start_spill(self, directory):
+        max_bytes, segment_bytes, failures, reset_timeout, batch_size, interval = self._spill_options
+        self._spill = SpillQueue(directory, segment_bytes, max_bytes)
+        self._breaker = CircuitBreaker(failures, reset_timeout)
+        if self._transport is not None:
+            self._transport.on_batch_result = self._on_batch_result
+            send_batch = self._transport.send_batch
+        else:
+            send_batch = self._send_batch_request
+        self._replayer = SpillReplayer(self._spill, self._breaker, send_batch, batch_size, interval)
+
+    def _after_fork(self):
+        """
+        Runs in a forked child. Threads, locks, sockets and mmaps inherited
+        from the parent are unusable or shared, so everything is rebuilt; the
+        parent keeps sending whatever it had queued.
+        """
+        old_encoder = self._encoder
+        super()._after_fork()
+        self._http = None
+        self._http_lock = threading.Lock()
+        if self._limiter is not None:
+            self._limiter._after_fork()
+        if self._transport is not None:
+            if getattr(self._transport, "encoder", None) is old_encoder:
+                self._transport.encoder = self._encoder
+            self._transport._after_fork()
+            if hasattr(self._transport, "stats"):
+                self._transport.stats = self._stats
+        if self._spill_dir:
+            # The parent's segments are mapped MAP_SHARED: each worker spills
+            # to its own subdirectory instead
+            self._start_spill(os.path.join(self._spill_dir, f"worker-{self.process_id}"))
+        if self._coalescer is not None:
+            self._coalescer._after_fork()
+
+    def _connection(self):
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    self._http = connect(self.fluentd_url, self.http_client, timeout=5)
+        return self._http
+
+    def _post(self, body, headers):
+        """``(status, text)`` of one POST, or None if it could not be sent"""
+        try:
+            return self._connection().post(body, headers)
+        except Exception as e:
+            _log.error(f"Logging send error: {e}")
+            return None
+
+    def _send_request(self, payload):
+        headers = {"Content-Type": "application/json"}
+        headers.update(self._auth_headers())
+        started = time.perf_counter()
+        response = self._post(self._encoder.encode(payload), headers)
+        ok = response is not None and 200 <= response[0] < 300
+        self._stats.record_send(1, ok, time.perf_counter() - started)
+        return response
+
+    def _send_batch_request(self, events):
+        """POST a JSON array of events (used to replay spilled events)"""
+        body, headers = self._encode_batch(events)
+        headers.update(self._auth_headers())
+        started = time.perf_counter()
+        response = self._post(body, headers)
+        ok = response is not None and 200 <= response[0] < 300
+        self._stats.record_send(len(events), ok, time.perf_counter() - started)
+        return ok
+
+    def _on_batch_result(self, events, ok):
+        if ok:
+            self._breaker.record_success()
+            return
+        self._breaker.record_failure()
+        for event in events:
+            self._spill.append(event)
+
+    def _report_rate_limits(self):
+        """Emit one summary event with the dropped/sampled counts since the last one"""
+        self._next_limit_report = time.monotonic() + self._limit_report_interval
+        dropped, sampled = self._limiter.drain_counts()
+        if not dropped and not sampled:
+            return
+        # the summary itself bypasses the limiter
+        self._send(self._build_payload(
+            "WARN",
+            f"Rate limiting dropped {sum(dropped.values())} and sampled out "
+            f"{sum(sampled.values())} log events",
+            "universal-logger",
+            {"dropped": dropped, "sampled": sampled, "interval_seconds": self._limit_report_interval},
+        ))
+
+    def stats(self) -> dict:
+        """Counters (see BaseUniversalLogger.stats) plus queue, coalescing and spill state"""
+        stats = super().stats()
+        if self._transport is not None:
+            stats["queue_depth"] = self._transport.queue_depth()
+        if self._coalescer is not None:
+            stats["coalesced"] = self._coalescer.coalesced
+        if self._spill is not None:
+            stats["spill_pending"] = len(self._spill)
+            stats["spill_dropped"] = self._spill.dropped
+        return stats
+
+    def _report_stats(self):
+        """Emit stats() as one INFO event"""
+        self._next_stats_report = time.monotonic() + self._stats_interval
+        self._send(self._build_payload("INFO", "Logger stats", "universal-logger", self.stats()))
+
+    def log(self, level, message, source, metadata=None, request_id=None):
+        """
+        Send enriched log to Fluentd
+        Args:
+            level: Log level (INFO, ERROR, etc.)
+            message: Log message
+            source: Source of log (app name)
+            metadata: Additional metadata dict
+            request_id: Optional request ID for correlation
+        """
+        if self._next_stats_report is not None and time.monotonic() >= self._next_stats_report:
+            self._report_stats()
+
+        if self._limiter is not None:
+            if time.monotonic() >= self._next_limit_report:
+                self._report_rate_limits()
+            if not self._limiter.admit(level.upper()):
+                self._stats.record_rate_limited()
+                return False
+
+        if self._coalescer is not None:
+            return self._coalescer.offer(
+                level.upper(), source, message, metadata,
+                lambda: self._build_payload(level, message, source, metadata, request_id),
+            )
+
+        return self._send(self._build_payload(level, message, source, metadata, request_id))
+
+    def _send(self, payload):
+        """Hand one enriched payload to the transport, spill, or post it inline"""
+        level = payload["level"]
+        message = payload["message"]
+
+        if self._spill is not None and (len(self._spill) or not self._breaker.allow()):
+            # Endpoint down or backlog pending: keep order and skip the timeout
+            self._spill.append(payload)
+            return False
+
+        if self._transport is not None:
+            return self._transport.submit(payload)
 
         response = self._send_request(payload)
+        if self._breaker is not None:
+            if response is None or response[0] >= 500:
+                self._breaker.record_failure()
+                self._spill.append(payload)
+            else:
+                self._breaker.record_success()
+
         if response is None:
-            print(f"✗ Error: failed to send log to {self.fluentd_url}")
-            print(f"[FALLBACK] {level}: {message}")
+            if self.verbose:
+                print(f"✗ Error: failed to send log to {self.fluentd_url}")
+                print(f"[FALLBACK] {level}: {message}")
             return False
 
-        if 200 <= response.status_code < 300:
-            print(f"✓ Log sent: {level} - {message} [Session: {self.session_id[:8]}...]")
+        status, text = response
+        if 200 <= status < 300:
+            if self.verbose:
+                print(f"✓ Log sent: {level} - {message} [Session: {self.session_id[:8]}...]")
             return True
         else:
-            print(f"✗ Failed: {response.status_code} - {response.text if response is not None else ''}")
+            if self.verbose:
+                print(f"✗ Failed: {status} - {text}")
             return False
 
     def log_with_trace(self, level, message, source, trace_data=None, metadata=None):
@@ -181,8 +525,28 @@ class UniversalLogger:
         Args:
             trace_data: Dict with 'trace_id', 'span_id', 'parent_span_id'
         """
-        if metadata is None:
-            metadata = {}
-        if trace_data:
-            metadata["trace"] = trace_data
-        return self.log(level, message, source, metadata)
\ No newline at end of file
+        return self.log(level, message, source, self._with_trace(metadata, trace_data))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until queued logs have been sent (no-op without a transport)"""
+        if self._coalescer is not None:
+            self._coalescer.flush()
+        if self._transport is None:
+            return True
+        return self._transport.flush(timeout)
+
+    def close(self, timeout: float = None) -> bool:
+        """Flush queued logs and shut the transport down"""
+        if self._coalescer is not None:
+            self._coalescer.close()
+        if self._limiter is not None:
+            self._report_rate_limits()
+        closed = True
+        if self._transport is not None:
+            closed = self._transport.close(timeout)
+        if self._replayer is not None:
+            self._replayer.stop()
+            self._spill.close()
+        if self._http is not None:
+            self._http.close()
+        return closed
@@ -0,0 +1,74 @@
+"""
+Per-event cost of the sidecar's event_id de-duplication: one contains()
+and one add() per event, as /forward does for a new ID, for the in-process
+filter at a few false-positive rates, with the measured false-positive rate
+next to the target. With --redis (REDIS_URL, or fakeredis with --fake) it
+also times the Redis-backed filter per batch of 100 IDs.
+
+    python tests/benchmarks/bench_dedupe.py [events] [--redis] [--fake]
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+# add sidecar to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(project_root, "sidecar"))
+
+from dedupe import RedisBloomFilter, RotatingBloomFilter
+
+ERROR_RATES = [1e-3, 1e-6, 1e-9]
+
+
+def bench_memory(events, error_rate):
+    ids = [str(uuid.uuid4()) for _ in range(events)]
+    bloom = RotatingBloomFilter(capacity=events, error_rate=error_rate, ttl=3600)
+    start = time.perf_counter()
+    for event_id in ids:
+        if not bloom.contains(event_id):
+            bloom.add(event_id)
+    per_event = (time.perf_counter() - start) / events * 1e6
+
+    probes = min(events, 200000)
+    false_positives = sum(bloom.contains(str(uuid.uuid4())) for _ in range(probes))
+    return per_event, false_positives / probes, bloom.bits // 8 // 1024
+
+
+async def bench_redis(client, events, batch=100):
+    bloom = RedisBloomFilter(client, "bench:dedupe", capacity=events, error_rate=1e-6, ttl=3600)
+    ids = [str(uuid.uuid4()) for _ in range(events)]
+    start = time.perf_counter()
+    for offset in range(0, events, batch):
+        chunk = ids[offset:offset + batch]
+        seen = await bloom.contains_many(chunk)
+        await bloom.add_many([event_id for event_id, dup in zip(chunk, seen) if not dup])
+    elapsed = time.perf_counter() - start
+    await client.delete(*[key async for key in client.scan_iter("bench:dedupe:*")])
+    return elapsed / events * 1e6
+
+
+def main(events, redis, fake):
+    print(f"in-process filter, {events} new event_ids (contains + add)")
+    print(f"{'error rate':>10} {'µs/event':>9} {'measured FP':>12} {'KiB/gen':>8}")
+    for error_rate in ERROR_RATES:
+        per_event, measured, kib = bench_memory(events, error_rate)
+        print(f"{error_rate:>10g} {per_event:>9.2f} {measured:>12.2e} {kib:>8}")
+
+    if redis:
+        if fake:
+            import fakeredis
+
+            client = fakeredis.aioredis.FakeRedis()
+        else:
+            import redis.asyncio as aioredis
+
+            client = aioredis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+        per_event = asyncio.run(bench_redis(client, min(events, 20000)))
+        print(f"\nRedis bitmaps ({'fakeredis' if fake else 'REDIS_URL'}), batches of 100: {per_event:.2f} µs/event")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    main(int(args[0]) if args else 200000, "--redis" in sys.argv, "--fake" in sys.argv)
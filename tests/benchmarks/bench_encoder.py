@@ -0,0 +1,73 @@
+"""
+Events/s per core for building and serializing one log payload: the original
+hot path (uuid4 + datetime.isoformat + dict + stdlib json) vs the envelope
+encoder, with and without orjson.
+
+    python tests/benchmarks/bench_encoder.py [events]
+"""
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+# add python client lib to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+python_dir = os.path.join(project_root, "src", "integration", "client_libs", "python")
+sys.path.insert(0, python_dir)
+
+import encoder
+from transports import Transport
+from universal_logger import UniversalLogger
+
+
+class NullTransport(Transport):
+    def submit(self, event):
+        return True
+
+
+def before(events):
+    hostname, pid, session_id = socket.gethostname(), os.getpid(), str(uuid.uuid4())
+    start = time.perf_counter()
+    for i in range(events):
+        payload = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "level": "INFO",
+            "message": "Order placed",
+            "source": "checkout-api",
+            "session_id": session_id,
+            "request_id": str(uuid.uuid4()),
+            "sequence": i,
+            "hostname": hostname,
+            "process_id": pid,
+            "service_name": "checkout",
+            "metadata": {"order_id": i},
+        }
+        # what requests.post(json=...) does
+        json.dumps(payload, allow_nan=False).encode("utf-8")
+    return events / (time.perf_counter() - start)
+
+
+def after(events):
+    logger = UniversalLogger(transport=NullTransport(), service_name="checkout", include_metrics=False)
+    start = time.perf_counter()
+    for i in range(events):
+        payload = logger._build_payload("INFO", "Order placed", "checkout-api", {"order_id": i})
+        logger._encoder.encode(payload)
+    return events / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    baseline = before(events)
+    print(f"before (uuid4 + isoformat + json):  {baseline:>10,.0f} events/s")
+    encoder.EnvelopeEncoder()  # resolves the lazy orjson import
+    if encoder.orjson is not None:
+        fast = after(events)
+        print(f"after  (envelope encoder, orjson): {fast:>10,.0f} events/s  ({fast / baseline:.1f}x)")
+    saved, encoder.orjson = encoder.orjson, None
+    stdlib = after(events)
+    encoder.orjson = saved
+    print(f"after  (envelope encoder, stdlib): {stdlib:>10,.0f} events/s  ({stdlib / baseline:.1f}x)")
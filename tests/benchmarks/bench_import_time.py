@@ -0,0 +1,59 @@
+"""
+Cold import cost of the Python client, from ``python -X importtime``: total
+time for each entry point and the slowest modules it pulls in.
+
+    python tests/benchmarks/bench_import_time.py [runs]
+"""
+import os
+import subprocess
+import sys
+
+# add python client lib to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+python_dir = os.path.join(project_root, "src", "integration", "client_libs", "python")
+
+CASES = {
+    "import universal_logger": "import universal_logger",
+    "first log (stdlib http)": (
+        "import universal_logger\n"
+        "universal_logger.UniversalLogger('http://127.0.0.1:9', include_metrics=False, http_client='stdlib')"
+        ".log('INFO', 'x', 'bench')"
+    ),
+    "first log (requests + metrics)": (
+        "import universal_logger\n"
+        "universal_logger.UniversalLogger('http://127.0.0.1:9', http_client='requests').log('INFO', 'x', 'bench')"
+    ),
+    "import requests, psutil (old eager set)": "import requests, psutil, uuid",
+}
+
+
+def importtime(code):
+    """Total µs of top-level imports made by code (after interpreter startup) and its slowest modules"""
+    env = dict(os.environ, PYTHONPATH=python_dir)
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True
+    ).stderr
+    total, modules, started = 0, [], False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line.split("|")
+        name = raw_name.strip()
+        top_level = raw_name.startswith(" ") and not raw_name.startswith("  ")
+        if not started:
+            # everything up to and including site is interpreter startup
+            started = top_level and name == "site"
+            continue
+        modules.append((int(cumulative), name))
+        if top_level:
+            total += int(cumulative)
+    return total, sorted(modules, reverse=True)
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for label, code in CASES.items():
+        results = [importtime(code) for _ in range(runs)]
+        best_total, best_modules = min(results)
+        slowest = ", ".join(f"{name} {us / 1000:.1f}" for us, name in best_modules[:4])
+        print(f"{label:<40} {best_total / 1000:>7.1f} ms   slowest: {slowest}")
@@ -0,0 +1,59 @@
+"""
+Per-record cost of UniversalLogHandler vs a plain StreamHandler, measured on
+the emitting thread.
+
+    python tests/benchmarks/bench_logging_handler.py [records]
+"""
+import io
+import logging
+import os
+import sys
+import time
+
+# add python client lib to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+python_dir = os.path.join(project_root, "src", "integration", "client_libs", "python")
+sys.path.insert(0, python_dir)
+
+from logging_handler import UniversalLogHandler
+from transports import Transport
+from universal_logger import UniversalLogger
+
+
+class NullTransport(Transport):
+    """Discards events so the benchmark measures the handler, not the network"""
+
+    def submit(self, event):
+        return True
+
+
+def time_handler(handler, records):
+    log = logging.getLogger(f"bench.{type(handler).__name__}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(records):
+        log.info("order %s placed", i, extra={"request_id": "req", "cart": i})
+    elapsed = time.perf_counter() - start
+    log.removeHandler(handler)
+    return elapsed / records * 1e6
+
+
+if __name__ == "__main__":
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    stream = logging.StreamHandler(io.StringIO())
+    stream.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    stream_us = time_handler(stream, records)
+
+    universal = UniversalLogHandler(
+        UniversalLogger(transport=NullTransport(), include_metrics=False),
+        max_queue_size=records,
+    )
+    universal_us = time_handler(universal, records)
+    universal.close()
+
+    print(f"records:             {records}")
+    print(f"StreamHandler:       {stream_us:.2f} us/record")
+    print(f"UniversalLogHandler: {universal_us:.2f} us/record (emitting thread)")
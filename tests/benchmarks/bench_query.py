@@ -0,0 +1,101 @@
+"""
+Latency of an indexed level+source query (StreamIndex.query, what GET /query
+runs) against scanning the stream with XRANGE and filtering, as the stream
+grows while the number of matches stays the same. Half the stream is ERROR,
+so the level index grows with it; the query walks the source index, which
+does not. (Intersecting two indexes that both grow costs in proportion to
+the smaller one.) Uses REDIS_URL; --fake runs it on fakeredis as a smoke
+test only, since fakeredis formats the whole stream on every XRANGE and
+both columns then grow with it.
+
+    python tests/benchmarks/bench_query.py [matches] [--fake]
+"""
+import asyncio
+import os
+import sys
+import time
+
+# add sidecar to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(project_root, "sidecar"))
+
+from stream_index import StreamIndex
+
+STREAM_KEY = "bench:query"
+SIZES = [5000, 20000, 80000]
+FILTERS = {"level": "ERROR", "source": "juice-proxy"}
+
+
+def event(n, every):
+    """Indexed fields of entry ``n``: every ``every``-th one matches FILTERS; half the rest are ERRORs"""
+    if n % every == 0:
+        return "ERROR", "juice-proxy"
+    return ("INFO", "ERROR")[n % 2], ("checkout", "auth")[n % 3 == 0]
+
+
+async def fill(client, index, size, matches):
+    """``size`` entries, ``matches`` of them ERROR from juice-proxy"""
+    await client.delete(STREAM_KEY, *[key async for key in client.scan_iter(f"{STREAM_KEY}:idx:*")])
+    every = size // matches
+    for offset in range(0, size, 1000):
+        chunk = [event(n, every) for n in range(offset, min(offset + 1000, size))]
+        pipe = client.pipeline(transaction=False)
+        for level, source in chunk:
+            pipe.xadd(STREAM_KEY, {"level": level, "source": source, "payload": "{}"})
+        ids = await pipe.execute()
+        await index.add_many([
+            (STREAM_KEY, entry_id, {"level": level, "source": source}) for entry_id, (level, source) in zip(ids, chunk)
+        ])
+
+
+async def scan(client):
+    found, start = 0, "-"
+    while True:
+        entries = await client.xrange(STREAM_KEY, min=start, count=1000)
+        for entry_id, fields in entries:
+            found += fields[b"level"] == b"ERROR" and fields[b"source"] == b"juice-proxy"
+        if len(entries) < 1000:
+            return found
+        start = b"(" + entries[-1][0]
+
+
+async def timed(coro_fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await coro_fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+async def main(matches, fake):
+    if fake:
+        import fakeredis
+
+        client = fakeredis.aioredis.FakeRedis()
+    else:
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    index = StreamIndex(client, retention=3600)
+    now_ms = int(time.time() * 1000)
+
+    async def indexed():
+        entries, _ = await index.query([STREAM_KEY], FILTERS, now_ms - 3600 * 1000, now_ms + 60000, limit=matches + 1)
+        return len(entries)
+
+    print(f"{matches} matching entries (ERROR from juice-proxy), best of 5, ms")
+    print(f"{'stream length':>13} {'indexed':>9} {'scan':>9} {'matches':>8}")
+    for size in SIZES:
+        await fill(client, index, size, matches)
+        indexed_ms, found = await timed(indexed)
+        scan_ms, scanned = await timed(lambda: scan(client), repeat=2)
+        print(f"{size:>13} {indexed_ms:>9.2f} {scan_ms:>9.1f} {found:>8}")
+        assert found == scanned
+    await client.delete(STREAM_KEY, *[key async for key in client.scan_iter(f"{STREAM_KEY}:idx:*")])
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    asyncio.run(main(int(args[0]) if args else 100, "--fake" in sys.argv))
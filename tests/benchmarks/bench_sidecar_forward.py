@@ -0,0 +1,94 @@
+"""
+CPU per /forward request for building the stream entry: the old
+parse-and-re-serialize path (json.loads, then json.dumps of the same record
+as payload) against passthrough (orjson or json parse, body bytes stored as
+is). Measured with time.process_time on the entry-building step alone, then
+end to end through the ASGI app on fakeredis.
+
+    python tests/benchmarks/bench_sidecar_forward.py [iterations]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+# add sidecar to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(project_root, "sidecar"))
+
+import redis_forwarder
+
+SIZES = [("small (~200 B)", 1), ("medium (~2 KB)", 12), ("large (~20 KB)", 120)]
+
+
+def make_body(fanout):
+    record = {
+        "event_id": "3f0c1e9a-8d7b-4c1e-9a55-1234567890ab",
+        "timestamp": "2024-05-01T12:00:00.123456+00:00",
+        "session_id": "b7e2c0d4-1111-2222-3333-444455556666",
+        "source": "checkout-api",
+        "level": "INFO",
+        "message": "Order placed",
+        "context": {f"field_{i}": {"value": i * 1.5, "label": "é" * 8, "tags": ["a", "b"]} for i in range(fanout)},
+    }
+    return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+
+def old_path(body):
+    redis_forwarder.PAYLOAD_PASSTHROUGH = False
+    return redis_forwarder.stream_entry(json.loads(body))
+
+
+def passthrough(body):
+    redis_forwarder.PAYLOAD_PASSTHROUGH = True
+    return redis_forwarder.stream_entry(redis_forwarder.parse_json(body), body)
+
+
+def cpu_per_call(fn, body, iterations):
+    fn(body)
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(body)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+async def asgi_cpu_per_request(body, iterations):
+    import fakeredis
+    import httpx
+
+    redis_forwarder.connect_redis = lambda **kwargs: fakeredis.aioredis.FakeRedis(**kwargs)
+    await redis_forwarder.startup()
+    transport = httpx.ASGITransport(app=redis_forwarder.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://sidecar") as client:
+        start = time.process_time()
+        for _ in range(iterations):
+            (await client.post("/forward", content=body)).raise_for_status()
+        elapsed = time.process_time() - start
+    await redis_forwarder.shutdown()
+    return elapsed / iterations * 1e6
+
+
+def main(iterations):
+    parser = "orjson" if redis_forwarder.orjson is not None else "json"
+    print(f"entry building, CPU µs/request (passthrough parser: {parser})")
+    for label, fanout in SIZES:
+        body = make_body(fanout)
+        old = cpu_per_call(old_path, body, iterations)
+        new = cpu_per_call(passthrough, body, iterations)
+        print(f"{label:<16} old {old:>8.2f}   passthrough {new:>8.2f}   saved {old - new:>8.2f} ({1 - new / old:.0%})")
+
+    # keep the sidecar's startup lines out of the table
+    redis_forwarder.print = lambda *args, **kwargs: None
+    print("\nwhole /forward via ASGI on fakeredis, CPU µs/request")
+    for label, fanout in SIZES:
+        body = make_body(fanout)
+        results = {}
+        for mode in (False, True):
+            redis_forwarder.PAYLOAD_PASSTHROUGH = mode
+            results[mode] = asyncio.run(asgi_cpu_per_request(body, max(200, iterations // 20)))
+        print(f"{label:<16} old {results[False]:>8.1f}   passthrough {results[True]:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
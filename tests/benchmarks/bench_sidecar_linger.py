@@ -0,0 +1,72 @@
+"""
+/forward requests/s against a local Redis for different XADD batcher linger
+times. max_batch=1 is the old behaviour (one XADD round trip per request).
+Requests go through the ASGI app in-process, so HTTP parsing is excluded and
+the numbers isolate the Redis side.
+
+    REDIS_URL=redis://localhost:6379 python tests/benchmarks/bench_sidecar_linger.py [requests] [concurrency]
+    python tests/benchmarks/bench_sidecar_linger.py --fake   # smoke run on fakeredis (no network cost)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+# add sidecar to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(project_root, "sidecar"))
+
+import httpx
+import redis_forwarder
+
+# (label, linger ms, max batch)
+SETTINGS = [
+    ("no batching", 0, 1),
+    ("linger 0 ms (same loop turn)", 0, 500),
+    ("linger 1 ms", 1, 500),
+    ("linger 2 ms", 2, 500),
+    ("linger 5 ms", 5, 500),
+]
+
+
+async def run(client, total, concurrency):
+    body = json.dumps({"level": "INFO", "source": "bench", "message": "x" * 200}).encode()
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.post("/forward", content=body)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(total, concurrency, fake):
+    if fake:
+        import fakeredis
+        redis_forwarder.connect_redis = lambda **kwargs: fakeredis.aioredis.FakeRedis(**kwargs)
+    redis_forwarder.STREAM_KEY = "bench:stream"
+    transport = httpx.ASGITransport(app=redis_forwarder.app)
+    for label, linger, max_batch in SETTINGS:
+        redis_forwarder.XADD_LINGER_MS = linger
+        redis_forwarder.XADD_MAX_BATCH = max_batch
+        await redis_forwarder.startup()
+        await redis_forwarder.redis_client.delete(redis_forwarder.STREAM_KEY)
+        async with httpx.AsyncClient(transport=transport, base_url="http://sidecar") as client:
+            rate = await run(client, total, concurrency)
+        await redis_forwarder.redis_client.delete(redis_forwarder.STREAM_KEY)
+        await redis_forwarder.shutdown()
+        print(f"{label:<30} {rate:>10,.0f} requests/s")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--fake"]
+    total = int(args[0]) if args else 20000
+    concurrency = int(args[1]) if len(args) > 1 else 64
+    redis_forwarder.REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+    # keep the sidecar's startup lines out of the table
+    redis_forwarder.print = lambda *args, **kwargs: None
+    asyncio.run(main(total, concurrency, "--fake" in sys.argv))
@@ -0,0 +1,107 @@
+"""
+/forward requests/s of a real sidecar (python sidecar/redis_forwarder.py,
+over HTTP on localhost) for several SIDECAR_WORKERS counts against the Redis
+at REDIS_URL. The load comes from separate client processes, each with
+``connections`` keep-alive connections, so the client is not what runs out
+of CPU first; give it cores to spare or the numbers flatten early.
+
+    REDIS_URL=redis://localhost:6379 python tests/benchmarks/bench_sidecar_workers.py [seconds] [workers ...]
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SIDECAR = os.path.join(project_root, "sidecar", "redis_forwarder.py")
+PORT = 8297
+STREAM_KEY = "bench:workers"
+CLIENT_PROCESSES = max(2, (os.cpu_count() or 2) // 2)
+CONNECTIONS = 32
+
+
+async def load(seconds, connections) -> int:
+    body = json.dumps({"level": "INFO", "source": "bench", "message": "x" * 200}).encode()
+    deadline = time.monotonic() + seconds
+    done = 0
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+
+        async def worker():
+            nonlocal done
+            while time.monotonic() < deadline:
+                (await client.post("/forward", content=body)).raise_for_status()
+                done += 1
+
+        await asyncio.gather(*(worker() for _ in range(connections)))
+    return done
+
+
+def client_process(seconds, connections, results):
+    results.put(asyncio.run(load(seconds, connections)))
+
+
+def wait_healthy(timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{PORT}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("sidecar did not become healthy (is REDIS_URL reachable?)")
+
+
+def run(workers, seconds) -> float:
+    with tempfile.TemporaryDirectory() as wal_dir:
+        env = dict(
+            os.environ, SIDECAR_WORKERS=str(workers), SIDECAR_PORT=str(PORT), SIDECAR_HOST="127.0.0.1",
+            STREAM_KEY=STREAM_KEY, WAL_DIR=wal_dir, DEDUPE="off",
+        )
+        server = subprocess.Popen([sys.executable, SIDECAR], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_healthy()
+            results = multiprocessing.Queue()
+            clients = [
+                multiprocessing.Process(target=client_process, args=(seconds, CONNECTIONS, results))
+                for _ in range(CLIENT_PROCESSES)
+            ]
+            start = time.perf_counter()
+            for client in clients:
+                client.start()
+            total = sum(results.get() for _ in clients)
+            elapsed = time.perf_counter() - start
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return total / elapsed
+
+
+def main(seconds, worker_counts):
+    import redis
+
+    redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379")
+    cleanup = redis.Redis.from_url(redis_url)
+    print(f"{CLIENT_PROCESSES} client processes x {CONNECTIONS} connections, {seconds:g}s per run, Redis {redis_url}")
+    print(f"{'workers':>7} {'req/s':>9} {'vs 1':>6}")
+    baseline = None
+    for workers in worker_counts:
+        rate = run(workers, seconds)
+        baseline = baseline or rate
+        print(f"{workers:>7} {rate:>9.0f} {rate / baseline:>5.2f}x")
+        cleanup.delete(STREAM_KEY, *cleanup.scan_iter(f"{STREAM_KEY}:*"))
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    main(seconds, counts)
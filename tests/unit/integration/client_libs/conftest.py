@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# add python client lib to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+python_dir = os.path.join(project_root, "src", "integration", "client_libs", "python")
+sys.path.insert(0, python_dir)
+
+
+class FluentdStub:
+    """Minimal stand-in for Fluentd in_http that records every POST body"""
+
+    def __init__(self):
+        self.requests = []
+        self.status = 200
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append({"headers": dict(self.headers), "body": body})
+                self.send_response(stub.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/app.logs"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def events(self):
+        """All events received so far, with JSON-array batches flattened"""
+        events = []
+        for req in self.requests:
+            body = req["body"]
+            if req["headers"].get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            data = json.loads(body)
+            events.extend(data if isinstance(data, list) else [data])
+        return events
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def client_lib_dir():
+    """Directory of the Python client library, e.g. for PYTHONPATH in subprocesses"""
+    return python_dir
+
+
+@pytest.fixture
+def fluentd():
+    stub = FluentdStub()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def list_transport():
+    """Transport that just collects submitted events (no network)"""
+    from transports import Transport
+
+    class ListTransport(Transport):
+        def __init__(self):
+            self.events = []
+
+        def submit(self, event):
+            self.events.append(event)
+            return True
+
+    return ListTransport()
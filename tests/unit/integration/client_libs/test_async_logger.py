@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from async_logger import AsyncUniversalLogger
+
+
+def test_async_logger_batches_enriched_events(fluentd):
+    async def main():
+        async with AsyncUniversalLogger(fluentd.url, service_name="api", batch_size=3, flush_interval=5) as logger:
+            for i in range(7):
+                await logger.log("info", f"event {i}", "fastapi")
+            await logger.log_with_trace("error", "traced", "fastapi", {"trace_id": "t1", "span_id": "s1"})
+            assert await logger.flush(timeout=5)
+        return logger
+
+    logger = asyncio.run(main())
+    events = fluentd.events()
+    # batches may complete out of order (concurrent sends), events within one never do
+    assert sorted(e["sequence"] for e in events) == list(range(1, 9))
+    assert {e["session_id"] for e in events} == {logger.session_id}
+    assert events[0]["hostname"] == logger.hostname and events[0]["service_name"] == "api"
+    traced = next(e for e in events if e["message"] == "traced")
+    assert traced["level"] == "ERROR" and traced["metadata"]["trace"]["trace_id"] == "t1"
+    assert len(fluentd.requests) == 3
+
+
+def test_log_nowait_drops_when_queue_full(fluentd):
+    async def main():
+        logger = AsyncUniversalLogger(fluentd.url, max_queue_size=2, flush_interval=5)
+        # no await between calls, so the flusher task never gets to run
+        results = [logger.log_nowait("INFO", f"n{i}", "tests") for i in range(4)]
+        await logger.close(timeout=5)
+        return logger, results
+
+    logger, results = asyncio.run(main())
+    assert results == [True, True, False, False]
+    assert logger.dropped == 2
+    assert [e["message"] for e in fluentd.events()] == ["n0", "n1"]
@@ -0,0 +1,52 @@
+import time
+
+from coalescer import Coalescer, message_template
+from universal_logger import UniversalLogger
+
+
+def test_message_template_ignores_variable_parts():
+    a = message_template("timeout after=30s order_id=1234 req 9f8e7d6c5b4a3f2e trace 0x7f3a")
+    b = message_template("timeout after=45.5s order_id=99 req 0123456789abcdef trace 0x1")
+    assert a == b
+    assert message_template("user 3fa85f64-5717-4562-b3fc-2c963f66afa6 gone") == message_template(
+        "user 00000000-0000-0000-0000-000000000000 gone"
+    )
+    assert message_template("disk full") != message_template("disk ok")
+
+
+def test_message_template_keeps_meaningful_numbers():
+    assert message_template("upstream returned HTTP 500") != message_template("upstream returned HTTP 404")
+    assert message_template("db timeout on shard 1") != message_template("db timeout on shard 2")
+    assert message_template("retry 3 of 5") != message_template("retry 4 of 5")
+
+
+def test_repeats_fold_into_one_event(list_transport):
+    logger = UniversalLogger(transport=list_transport, include_metrics=False, coalesce_window=60)
+    for i in range(1000):
+        logger.log("ERROR", f"db timeout shard={i % 3}", "api", {"shard": i % 3})
+    logger.log("ERROR", "something else", "api")
+    logger.close()
+
+    folded, other = list_transport.events
+    assert folded["repeat_count"] == 1000
+    assert folded["first_timestamp"] <= folded["last_timestamp"]
+    assert folded["metadata_samples"] == [{"shard": 0}, {"shard": 1}, {"shard": 2}]
+    assert "repeat_count" not in other
+    # only the first event of the window was enriched
+    assert [folded["sequence"], other["sequence"]] == [1, 2]
+
+
+def test_window_expiry_and_lru_bound():
+    emitted = []
+    coalescer = Coalescer(emitted.append, window=0.05, max_keys=2)
+    build = lambda n: (lambda: {"timestamp": "t", "metadata": {}, "n": n})
+    for n in range(3):
+        coalescer.offer("INFO", "src", f"distinct message {'abc'[n]}", None, build(n))
+    # the table holds two keys, so the oldest was emitted straight away
+    assert [e["n"] for e in emitted] == [0]
+
+    deadline = time.monotonic() + 5
+    while len(emitted) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    coalescer.close()
+    assert sorted(e["n"] for e in emitted) == [0, 1, 2]
@@ -0,0 +1,61 @@
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+import encoder
+from encoder import EnvelopeEncoder, MonotonicIds, UtcTimestamps
+
+
+STATIC = {"session_id": "s-1", "hostname": "host", "process_id": 7, "service_name": "svc"}
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+def test_spliced_static_fields_round_trip_without_orjson(monkeypatch):
+    monkeypatch.setattr(encoder, "orjson", None)
+    enc = EnvelopeEncoder(STATIC)
+    event = {"level": "INFO", "message": "héllo", "metadata": {1: "int key"}, **STATIC}
+    assert json.loads(enc.encode(event)) == json.loads(json.dumps(event))
+
+    # events that do not carry the logger's own values are encoded as-is
+    other = dict(event, session_id="someone-else")
+    assert json.loads(enc.encode(other))["session_id"] == "someone-else"
+    assert json.loads(enc.encode_batch([event, other]))[1]["session_id"] == "someone-else"
+
+
+def test_orjson_and_stdlib_paths_give_the_same_bytes(monkeypatch):
+    event = {
+        "level": "ERROR", "sequence": 3, "message": "ünïcode \u2028 \x1f", "ratio": 0.1, "big": 2 ** 70,
+        "metadata": {
+            "naive": datetime(2025, 1, 1), "aware": datetime(2025, 1, 1, 12, 30, 5, 120, tzinfo=timezone.utc),
+            "day": date(2025, 1, 2), "id": uuid.UUID(int=7), "point": Point(1, 2), 1: "int key", None: [True, None],
+        },
+        **STATIC,
+    }
+    fast = EnvelopeEncoder(STATIC)
+    fast_bytes = fast.encode(event), fast.encode(dict(event, session_id="other")), fast.encode_batch([event, event])
+    monkeypatch.setattr(encoder, "orjson", None)
+    slow = EnvelopeEncoder(STATIC)
+    slow_bytes = slow.encode(event), slow.encode(dict(event, session_id="other")), slow.encode_batch([event, event])
+    assert fast_bytes == slow_bytes
+    assert json.loads(slow_bytes[0])["metadata"]["aware"] == "2025-01-01 12:30:05.000120+00:00"
+
+
+def test_monotonic_ids_are_unique_and_ordered():
+    ids = MonotonicIds()
+    generated = [ids.next() for _ in range(1000)]
+    assert len(set(generated)) == 1000
+    assert generated == sorted(generated)
+    assert MonotonicIds().next() != MonotonicIds().next()
+
+
+def test_cached_timestamps_are_utc_iso():
+    stamp = UtcTimestamps().now()
+    parsed = datetime.fromisoformat(stamp)
+    assert parsed.utcoffset().total_seconds() == 0
+    assert abs((datetime.now(parsed.tzinfo) - parsed).total_seconds()) < 1
@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+
+import pytest
+
+from shm_ring import RingBufferTransport, RingShipper, SharedRingBuffer
+from universal_logger import UniversalLogger
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+# file a forked child records its pid in, while a test sets it
+fork_marker = None
+
+
+def _record_fork():
+    if fork_marker is not None:
+        with open(fork_marker, "a") as marker:
+            marker.write(f"{os.getpid()}\n")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_record_fork)
+
+
+def _in_child(fn):
+    """Run fn() in a forked child; returns its exit code"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if fn() else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_forked_child_gets_new_identity_and_working_transport(fluentd, tmp_path):
+    logger = UniversalLogger(
+        fluentd.url, service_name="svc", background=True, flush_interval=0.05,
+        include_metrics=False, spill_dir=str(tmp_path),
+    )
+    logger.log("INFO", "parent", "test")
+    parent_session = logger.session_id
+
+    def child():
+        ok = logger.session_id != parent_session and logger.log_sequence == 0
+        ok = ok and logger._transport._thread.is_alive()
+        logger.log("INFO", "child", "test")
+        return ok and logger.close(timeout=5)
+
+    assert _in_child(child) == 0
+    assert logger.flush(timeout=5)
+
+    events = {e["message"]: e for e in fluentd.events()}
+    assert events["parent"]["process_id"] == os.getpid()
+    assert events["child"]["process_id"] != os.getpid()
+    assert events["child"]["session_id"] != parent_session
+    assert events["child"]["sequence"] == 1
+    assert events["parent"]["request_id"].split("-")[0] != events["child"]["request_id"].split("-")[0]
+    assert any(p.name.startswith("worker-") for p in tmp_path.iterdir())
+    logger.close()
+
+
+def test_ring_buffer_wraps_and_drops_when_full():
+    ring = SharedRingBuffer(size=64)
+    try:
+        assert ring.put(b"x" * 20)
+        assert ring.put(b"y" * 20)
+        assert not ring.put(b"z" * 20)  # only 16 bytes left
+        assert ring.dropped == 1
+
+        records, token = ring.read_batch(1)
+        assert records == [b"x" * 20]
+        assert not ring.put(b"z" * 20)  # space is only freed by commit()
+        ring.commit(token)
+        assert ring.put(b"z" * 20)  # skips the 16-byte tail, lands at the start
+
+        records, token = ring.read_batch(10)
+        ring.commit(token)
+        assert records == [b"y" * 20, b"z" * 20]
+        assert ring.pending_bytes() == 0
+    finally:
+        ring.close()
+
+
+def test_workers_write_to_ring_and_shipper_posts_batches(fluentd):
+    ring = SharedRingBuffer(size=1024 * 1024)
+    shipper = RingShipper(ring, fluentd.url, batch_size=50, flush_interval=0.05).start()
+    logger = UniversalLogger(service_name="svc", include_metrics=False, transport=RingBufferTransport(ring))
+    try:
+        def worker():
+            for i in range(100):
+                logger.log("INFO", f"event {i}", "worker")
+            return True
+
+        assert _in_child(worker) == 0
+        assert _in_child(worker) == 0
+        assert logger.flush(timeout=5)
+    finally:
+        assert shipper.stop()
+        ring.close()
+
+    events = fluentd.events()
+    assert len(events) == 200
+    assert len({e["process_id"] for e in events}) == 2
+    assert all(len(json.loads(r["body"])) <= 50 for r in fluentd.requests)
+
+
+def test_a_writer_dying_with_the_lock_does_not_block_the_others():
+    ring = SharedRingBuffer(size=1024)
+
+    def die_holding_the_lock():
+        ring._lock.__enter__()
+        os._exit(0)
+
+    try:
+        _in_child(die_holding_the_lock)
+        done = []
+        writer = threading.Thread(target=lambda: done.append(ring.put(b"after")), daemon=True)
+        writer.start()
+        writer.join(timeout=5)
+        assert done == [True]
+        assert ring.read_batch(10)[0] == [b"after"]
+    finally:
+        ring.close()
+
+
+def test_shipper_process_is_not_a_fork_of_the_master(fluentd, tmp_path):
+    global fork_marker
+    fork_marker = str(tmp_path / "forked")
+    ring = SharedRingBuffer(size=1024 * 1024)
+    try:
+        shipper = RingShipper(ring, fluentd.url, flush_interval=0.05).start()
+        RingBufferTransport(ring).submit({"n": 1})
+        assert shipper.stop()
+    finally:
+        fork_marker = None
+        ring.close()
+    assert fluentd.events() == [{"n": 1}]
+    # no register_at_fork hook ran in the shipper
+    assert not os.path.exists(tmp_path / "forked")
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+# Imported on first use only; none of them may load with the module
+LAZY = ("requests", "psutil", "pytz", "uuid", "orjson", "msgpack", "httpx", "zstandard", "http.client")
+
+
+def importtime(code, path):
+    """``{module: cumulative_us}`` reported by ``python -X importtime`` for code, with ``path`` on PYTHONPATH"""
+    env = dict(os.environ, PYTHONPATH=path)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_import_does_not_load_optional_or_heavy_dependencies(client_lib_dir):
+    modules = importtime("import universal_logger", client_lib_dir)
+    assert "universal_logger" in modules
+    assert not [name for name in LAZY if name in modules]
+
+
+def test_stdlib_logger_never_imports_requests_or_psutil(fluentd, client_lib_dir):
+    code = (
+        "import sys, universal_logger\n"
+        f"logger = universal_logger.UniversalLogger({fluentd.url!r}, include_metrics=False, http_client='stdlib')\n"
+        "assert logger.log('INFO', 'hello', 'cli')\n"
+        "assert 'requests' not in sys.modules and 'psutil' not in sys.modules\n"
+    )
+    importtime(code, client_lib_dir)
+    assert [e["message"] for e in fluentd.events()] == ["hello"]
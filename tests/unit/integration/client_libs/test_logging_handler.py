@@ -0,0 +1,76 @@
+import logging
+
+from logging_handler import UniversalLogHandler
+from universal_logger import UniversalLogger
+
+
+def make_handler(transport, **kwargs):
+    handler = UniversalLogHandler(UniversalLogger(transport=transport, include_metrics=False), **kwargs)
+    log = logging.getLogger(f"test.handler.{id(handler)}")
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    log.addHandler(handler)
+    return log, handler, transport
+
+
+def test_records_become_universal_payloads_off_thread(list_transport):
+    log, handler, transport = make_handler(list_transport, source="checkout")
+    args = ["original"]
+    log.warning("user %s", args, extra={"request_id": "req-1", "trace_id": "t1", "span_id": "s1", "cart": 3})
+    args.append("mutated after emit")
+    handler.flush()
+
+    event = transport.events[0]
+    assert event["level"] == "WARN"
+    assert event["message"] == "user ['original']"
+    assert event["source"] == "checkout"
+    assert event["request_id"] == "req-1"
+    assert event["metadata"]["trace"] == {"trace_id": "t1", "span_id": "s1"}
+    assert event["metadata"]["cart"] == 3
+    assert event["metadata"]["logger"] == log.name
+    handler.close()
+
+
+def test_exc_info_is_kept(list_transport):
+    log, handler, transport = make_handler(list_transport)
+    try:
+        raise ValueError("bad input")
+    except ValueError:
+        log.exception("failed")
+    handler.close()
+
+    exception = transport.events[0]["metadata"]["exception"]
+    assert exception["type"] == "ValueError"
+    assert exception["message"] == "bad input"
+    assert "raise ValueError" in exception["traceback"]
+    assert transport.events[0]["level"] == "ERROR"
+
+
+def test_full_queue_drops_instead_of_blocking(list_transport):
+    log, handler, transport = make_handler(list_transport, max_queue_size=1)
+    handler.listener.stop()  # nothing drains the queue now
+    for i in range(5):
+        log.info("n%d", i)
+    assert handler.dropped == 4
+    handler.listener.start()
+    handler.close()
+    assert [e["message"] for e in transport.events] == ["n0"]
+
+
+def test_root_handler_does_not_ship_the_librarys_own_errors():
+    handler = UniversalLogHandler(fluentd_url="http://127.0.0.1:1", include_metrics=False, flush_interval=0.01)
+    shipped = []
+    enqueue = handler.enqueue
+    handler.enqueue = lambda record: (shipped.append(record.name), enqueue(record))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        logging.getLogger("test.handler.root").error("first")
+        for _ in range(3):
+            handler.flush(timeout=1)
+        assert shipped == ["test.handler.root"]
+        assert handler.queue.qsize() == 0
+        assert handler.logger._transport._queue.qsize() == 0
+    finally:
+        root.removeHandler(handler)
+        handler.close()
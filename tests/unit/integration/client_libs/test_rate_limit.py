@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from rate_limit import LevelRateLimiter, RatePolicy, TokenBucket
+from universal_logger import UniversalLogger
+
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+def test_level_policies_keep_errors_sample_debug_and_shed_info():
+    limiter = LevelRateLimiter({
+        "DEBUG": {"mode": "sample", "sample_rate": 0.0},
+        "INFO": {"mode": "drop", "rate": 1, "burst": 5},
+    })
+    assert all(limiter.admit("ERROR") for _ in range(100))
+    assert not any(limiter.admit("DEBUG") for _ in range(10))
+    assert sum(limiter.admit("INFO") for _ in range(10)) == 5
+
+    dropped, sampled = limiter.drain_counts()
+    assert dropped == {"INFO": 5}
+    assert sampled == {"DEBUG": 10}
+    assert limiter.drain_counts() == ({}, {})
+
+
+def test_block_mode_waits_for_a_token_but_not_forever():
+    limiter = LevelRateLimiter({"*": RatePolicy("block", rate=50, burst=1, max_wait=0.2)})
+    assert limiter.admit("INFO")
+    start = time.monotonic()
+    assert limiter.admit("INFO")          # waited ~20 ms for the next token
+    assert time.monotonic() - start >= 0.01
+
+    slow = LevelRateLimiter({"*": RatePolicy("block", rate=0.1, burst=1, max_wait=0.01)})
+    assert slow.admit("INFO")
+    assert not slow.admit("INFO")         # next token is 10 s away: give up
+
+
+def test_invalid_policy_is_rejected():
+    with pytest.raises(ValueError):
+        RatePolicy("drop")
+    with pytest.raises(ValueError):
+        RatePolicy("shed", rate=1)
+
+
+def test_logger_reports_dropped_and_sampled_counts(list_transport):
+    transport = list_transport
+    logger = UniversalLogger(
+        transport=transport,
+        include_metrics=False,
+        rate_limits={"INFO": {"mode": "drop", "rate": 1, "burst": 2}},
+    )
+    results = [logger.log("INFO", f"n{i}", "tests") for i in range(5)]
+    assert results == [True, True, False, False, False]
+    logger.close()
+
+    summary = transport.events[-1]
+    assert summary["source"] == "universal-logger"
+    assert summary["metadata"]["dropped"] == {"INFO": 3}
+    # dropped events never consumed a sequence number
+    assert [e["sequence"] for e in transport.events] == [1, 2, 3]
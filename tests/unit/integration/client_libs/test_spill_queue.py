@@ -0,0 +1,71 @@
+import time
+
+from spill_queue import CircuitBreaker, SpillQueue
+from universal_logger import UniversalLogger
+
+
+def test_spilled_events_replay_in_order_and_survive_restart(tmp_path):
+    spill = SpillQueue(str(tmp_path), segment_bytes=256, max_bytes=4096)
+    for i in range(20):
+        assert spill.append({"n": i})
+    assert len(list(tmp_path.iterdir())) > 1  # rolled over several segments
+
+    events, token = spill.read_batch(3)
+    spill.commit(token)
+    spill.close()
+
+    reopened = SpillQueue(str(tmp_path), segment_bytes=256, max_bytes=4096)
+    assert len(reopened) == 17
+    seen = [e["n"] for e in events]
+    while True:
+        events, token = reopened.read_batch(5)
+        if not events:
+            break
+        seen.extend(e["n"] for e in events)
+        reopened.commit(token)
+    assert seen == list(range(20))
+    assert len(reopened) == 0
+    assert len(list(tmp_path.iterdir())) == 1  # consumed segments are deleted
+
+
+def test_size_cap_drops_new_events(tmp_path):
+    spill = SpillQueue(str(tmp_path), segment_bytes=64, max_bytes=128)
+    results = [spill.append({"n": i}) for i in range(50)]
+    assert not all(results)
+    assert spill.dropped == results.count(False)
+
+
+def test_circuit_breaker_opens_and_probes_after_timeout():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()       # single half-open probe
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_logger_spills_while_down_and_replays_after_recovery(fluentd, tmp_path):
+    fluentd.status = 503
+    logger = UniversalLogger(
+        fluentd.url,
+        spill_dir=str(tmp_path),
+        breaker_failures=1,
+        breaker_reset_timeout=0,
+        replay_interval=60,
+    )
+    for i in range(5):
+        assert logger.log("ERROR", f"down {i}", "tests") is False
+    # only the first call waited on the endpoint; the rest went straight to disk
+    assert len(fluentd.requests) == 1
+    assert len(logger._spill) == 5
+
+    fluentd.status = 200
+    assert logger._replayer.replay() == 5
+    logger.close()
+
+    replayed = [e["message"] for e in fluentd.events()[1:]]
+    assert replayed == [f"down {i}" for i in range(5)]
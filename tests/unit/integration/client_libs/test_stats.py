@@ -0,0 +1,60 @@
+import time
+
+from stats import LatencyHistogram
+from universal_logger import UniversalLogger
+
+
+def test_histogram_percentiles_come_from_bucket_bounds():
+    hist = LatencyHistogram()
+    for _ in range(98):
+        hist.record(1.0)
+    hist.record(50.0)
+    hist.record(200.0)
+    assert 1.0 <= hist.percentile(50) < 1.2
+    assert 50.0 <= hist.percentile(99) < 60.0
+    assert hist.percentile(100) == 200.0
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_inline_logger_is_quiet_and_counts_outcomes(fluentd, capsys):
+    logger = UniversalLogger(fluentd.url, include_metrics=False)
+    assert logger.log("INFO", "ok", "test")
+    fluentd.status = 500
+    assert not logger.log("ERROR", "rejected", "test")
+
+    assert capsys.readouterr().out == ""
+    stats = logger.stats()
+    assert stats["sent"] == 1
+    assert stats["failed"] == 1
+    assert stats["batches"] == 2
+    assert stats["latency_ms"]["count"] == 2
+    assert stats["latency_ms"]["p50"] is not None
+
+
+def test_background_stats_track_batches_drops_and_rate_limits(fluentd):
+    logger = UniversalLogger(
+        fluentd.url, include_metrics=False, background=True, batch_size=10, flush_interval=5,
+        rate_limits={"DEBUG": {"mode": "drop", "rate": 1, "burst": 1}},
+    )
+    for i in range(25):
+        logger.log("INFO", f"event {i}", "test")
+    logger.log("DEBUG", "kept", "test")
+    logger.log("DEBUG", "limited", "test")
+    assert logger.flush(timeout=5)
+
+    stats = logger.stats()
+    assert stats["sent"] == 26
+    assert stats["rate_limited"] == 1
+    assert stats["batch_size"]["max"] == 10
+    assert stats["queue_depth"] == 0
+    logger.close()
+
+
+def test_periodic_stats_event(list_transport):
+    logger = UniversalLogger(include_metrics=False, transport=list_transport, stats_interval=0.01)
+    logger.log("INFO", "first", "test")
+    time.sleep(0.02)
+    logger.log("INFO", "second", "test")
+    reports = [e for e in list_transport.events if e["source"] == "universal-logger"]
+    assert reports and reports[0]["message"] == "Logger stats"
+    assert "latency_ms" in reports[0]["metadata"]
@@ -0,0 +1,72 @@
+import threading
+
+import system_metrics
+from system_metrics import SystemMetricsSampler, get_shared_sampler
+from universal_logger import UniversalLogger
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sampler_refreshes_in_background():
+    clock = FakeClock()
+    sampler = SystemMetricsSampler(interval=5, clock=clock).start()
+    first = sampler.snapshot()
+    assert set(first) == {"cpu_percent", "memory_usage_mb", "memory_percent", "disk_usage_percent"}
+
+    before = sampler._latest
+    clock.now += 5
+    sampler._wake.set()  # instead of waiting out the real interval
+    assert sampler.sampled.wait(10)
+    sampler.stop()
+    assert sampler._latest is not before
+
+
+def test_shorter_interval_applies_without_waiting_out_the_current_one():
+    clock = FakeClock()
+    sampler = SystemMetricsSampler(interval=3600, clock=clock).start()
+    clock.now += 10
+    assert not sampler.sampled.is_set()
+    sampler.set_interval(5)  # already overdue under the new interval
+    assert sampler.sampled.wait(10)
+    sampler.stop()
+
+
+def test_shared_sampler_is_reused_and_takes_shortest_interval():
+    a = get_shared_sampler(10.0)
+    b = get_shared_sampler(2.0)
+    assert a is b
+    assert b.interval <= 2.0
+
+
+def test_log_attaches_cached_snapshot_without_sampling(fluentd, monkeypatch):
+    logger = UniversalLogger(fluentd.url)
+    calls = []
+    cpu_percent = system_metrics.psutil.cpu_percent
+
+    def recording_cpu_percent(*args, **kwargs):
+        calls.append(threading.current_thread())
+        return cpu_percent(*args, **kwargs)
+
+    monkeypatch.setattr(system_metrics.psutil, "cpu_percent", recording_cpu_percent)
+    logger.log("INFO", "hello", "tests")
+    assert fluentd.events()[0]["metrics"]["memory_usage_mb"] > 0
+    # no psutil call (or 100 ms cpu_percent() interval) on the calling thread
+    assert threading.current_thread() not in calls
+
+
+def test_metrics_can_be_disabled_per_logger_and_per_level(fluentd):
+    UniversalLogger(fluentd.url, include_metrics=False).log("ERROR", "boom", "tests")
+    only_errors = UniversalLogger(fluentd.url, metrics_levels=["error"])
+    only_errors.log("INFO", "quiet", "tests")
+    only_errors.log("ERROR", "loud", "tests")
+
+    events = fluentd.events()
+    assert "metrics" not in events[0]
+    assert "metrics" not in events[1]
+    assert "metrics" in events[2]
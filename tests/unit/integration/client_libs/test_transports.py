@@ -0,0 +1,200 @@
+import io
+import socket
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from encoder import BodyCompressor
+from transports import BatchingTransport, ForwardTransport, HttpBatchTransport
+from universal_logger import UniversalLogger
+
+
+@pytest.mark.parametrize("http_client", ["requests", "stdlib"])
+def test_batches_are_sent_as_json_arrays(fluentd, http_client):
+    transport = HttpBatchTransport(fluentd.url, batch_size=10, flush_interval=5, http_client=http_client)
+    for i in range(25):
+        assert transport.submit({"n": i})
+    assert transport.flush(timeout=5)
+    transport.close()
+
+    assert [e["n"] for e in fluentd.events()] == list(range(25))
+    # two full batches, then the remainder pushed out by flush()
+    assert len(fluentd.requests) == 3
+
+
+def test_flush_interval_sends_partial_batch(fluentd):
+    transport = HttpBatchTransport(fluentd.url, batch_size=1000, flush_interval=0.05)
+    transport.submit({"n": 1})
+    deadline = time.monotonic() + 5
+    while not fluentd.requests and time.monotonic() < deadline:
+        time.sleep(0.01)
+    transport.close()
+    assert fluentd.events() == [{"n": 1}]
+
+
+def test_large_batches_are_compressed(fluentd):
+    transport = HttpBatchTransport(fluentd.url, compressor=BodyCompressor("gzip", threshold=1024), flush_interval=5)
+    transport.submit({"n": 0})
+    transport.flush(timeout=5)
+    for i in range(50):
+        transport.submit({"n": i, "hostname": "same-host-every-time", "service_name": "checkout"})
+    transport.close()
+
+    small, large = fluentd.requests
+    assert "Content-Encoding" not in small["headers"]   # under the threshold
+    assert large["headers"]["Content-Encoding"] == "gzip"
+    assert len(large["body"]) < 1024
+    assert len(fluentd.events()) == 51
+
+
+def test_submit_after_close_is_dropped(fluentd):
+    transport = HttpBatchTransport(fluentd.url, max_queue_size=1, flush_interval=5)
+    transport.close()
+    assert not transport.submit({"n": 1})
+    assert transport.dropped == 1
+
+
+def test_background_logger_returns_immediately_and_drains_on_close(fluentd):
+    logger = UniversalLogger(fluentd.url, service_name="svc", background=True, flush_interval=5)
+    for i in range(5):
+        assert logger.log("info", f"message {i}", "tests") is True
+    assert logger.close(timeout=5)
+
+    events = fluentd.events()
+    assert [e["sequence"] for e in events] == [1, 2, 3, 4, 5]
+    assert all(e["level"] == "INFO" and e["service_name"] == "svc" for e in events)
+
+
+class ForwardStub:
+    """Fake Fluentd forward input: decodes PackedForward messages and acks chunks"""
+
+    def __init__(self, ack=True, drop_first_ack=False):
+        self.messages = []
+        self.connections = 0
+        self.ack = ack
+        self.drop_first_ack = drop_first_ack
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        import msgpack
+
+        unpacker = msgpack.Unpacker(raw=False, ext_hook=lambda code, data: data)
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                unpacker.feed(data)
+                for tag, entries, option in unpacker:
+                    records = [record for _, record in msgpack.Unpacker(io.BytesIO(entries), raw=False)]
+                    self.messages.append({"tag": tag, "records": records, "option": option})
+                    if self.drop_first_ack:
+                        # simulate a lost ack: hang up without replying
+                        self.drop_first_ack = False
+                        return
+                    if self.ack and "chunk" in option:
+                        conn.sendall(msgpack.packb({"ack": option["chunk"]}))
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.records()) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def records(self):
+        return [r for m in self.messages for r in m["records"]]
+
+    def stop(self):
+        self.server.close()
+
+
+@pytest.fixture
+def forward_stub():
+    """ForwardStub, for the forward-protocol tests only: they need msgpack, the HTTP ones don't"""
+    pytest.importorskip("msgpack")
+    return ForwardStub
+
+
+def test_forward_transport_sends_packed_forward_over_one_connection(forward_stub):
+    stub = forward_stub()
+    transport = ForwardTransport(port=stub.port, tag="app.logs", batch_size=2, flush_interval=5)
+    for i in range(5):
+        transport.submit({"n": i})
+    assert transport.flush(timeout=5)
+    transport.close()
+    stub.wait_for(5)
+    stub.stop()
+
+    assert [r["n"] for r in stub.records()] == list(range(5))
+    assert {m["tag"] for m in stub.messages} == {"app.logs"}
+    assert [m["option"]["size"] for m in stub.messages] == [2, 2, 1]
+    assert stub.connections == 1
+
+
+def test_forward_transport_resends_chunk_until_acked(forward_stub):
+    stub = forward_stub(drop_first_ack=True)
+    transport = ForwardTransport(port=stub.port, ack=True, timeout=2, flush_interval=5)
+    transport.submit({"n": 1})
+    assert transport.flush(timeout=10)
+    transport.close()
+    stub.stop()
+
+    # first delivery lost its ack, the same chunk was resent on a new connection
+    assert len(stub.messages) == 2
+    assert stub.messages[0]["option"]["chunk"] == stub.messages[1]["option"]["chunk"]
+    assert stub.connections == 2
+
+
+def test_forward_transport_packs_unknown_types_as_str(forward_stub):
+    stub = forward_stub()
+    transport = ForwardTransport(port=stub.port, flush_interval=5)
+    transport.submit({"n": 1, "metadata": {"at": datetime(2025, 1, 1)}})
+    transport.submit({"n": 2})
+    assert transport.flush(timeout=5)
+    transport.close()
+    stub.wait_for(2)
+    stub.stop()
+    assert stub.records()[0]["metadata"]["at"] == "2025-01-01 00:00:00"
+
+
+def test_a_batch_that_raises_is_dropped_without_ending_the_flusher():
+    class Flaky(BatchingTransport):
+        def __init__(self):
+            self.sent = []
+            super().__init__(batch_size=1, flush_interval=5)
+
+        def _send_batch(self, batch):
+            if batch[0].get("bad"):
+                raise TypeError("can not serialize")
+            self.sent.extend(batch)
+            return True
+
+    transport = Flaky()
+    assert transport.submit({"bad": True})
+    assert transport.submit({"n": 1})
+    assert transport.flush(timeout=5)
+    transport.close()
+    assert transport.sent == [{"n": 1}]
+    assert transport.dropped == 1 and transport.stats.snapshot()["dropped"] == 1
+
+
+def test_logger_accepts_pluggable_transport(forward_stub):
+    stub = forward_stub()
+    logger = UniversalLogger(transport=ForwardTransport(port=stub.port, flush_interval=5), service_name="svc")
+    assert logger.log("warn", "via forward", "tests")
+    assert logger.close(timeout=5)
+    stub.wait_for(1)
+    stub.stop()
+    assert stub.records()[0]["message"] == "via forward"
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# add sidecar to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.join(project_root, "sidecar"))
+
+pytest.importorskip("fastapi")
+fakeredis = pytest.importorskip("fakeredis")
+
+import redis_forwarder  # noqa: E402
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def client(monkeypatch, redis_server, tmp_path):
+    """TestClient for the sidecar, backed by an in-memory fake Redis"""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(redis_forwarder, "WAL_DIR", str(tmp_path / "wal"))
+    monkeypatch.setattr(
+        redis_forwarder,
+        "connect_redis",
+        lambda **kwargs: fakeredis.aioredis.FakeRedis(server=redis_server, **kwargs),
+    )
+    with TestClient(redis_forwarder.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def stream(redis_server):
+    """Synchronous view of the fake Redis for assertions"""
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+import pytest
+
+import redis_forwarder
+from wal import SegmentedWal, adopt_orphans, claim_directory, decode_records, encode_record
+
+
+@pytest.fixture
+def fast_drain(monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "WAL_DRAIN_INTERVAL_SECONDS", 0.02)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_wal_records_round_trip_and_stop_at_a_torn_tail(tmp_path):
+    records = [("logs:stream", {"event_id": f"e{i}", "payload": b"\x00\xff binary"}) for i in range(3)]
+    data = b"".join(encode_record(key, fields) for key, fields in records)
+    torn = data + encode_record("logs:stream", {"event_id": "cut"})[:-2]
+
+    decoded = [(key, fields) for _, key, fields in decode_records(torn)]
+    assert decoded == [(key, {k.encode(): v if isinstance(v, bytes) else v.encode() for k, v in fields.items()})
+                       for key, fields in records]
+
+    wal = SegmentedWal(str(tmp_path), segment_bytes=len(data))
+    wal.append(records)  # reaches segment_bytes: sealed
+    wal.append(records[:1])
+    assert len(wal.sealed()) == 1 and wal.pending_bytes > len(data)
+    wal.close()
+    reopened = SegmentedWal(str(tmp_path))
+    assert reopened.active and len(reopened.sealed()) == 2
+
+
+def test_redis_outage_spills_to_wal_and_drains_in_order(fast_drain, client, redis_server, stream):
+    assert client.post("/forward", json={"event_id": "before"}).json() == {"status": "accepted", "event_id": "before"}
+
+    redis_server.connected = False
+    response = client.post("/forward", json={"event_id": "down-1"})
+    assert response.status_code == 200 and response.json()["spooled"] is True
+    batch = client.post("/forward/batch", json=[{"event_id": "down-2"}, {"event_id": "down-3"}]).json()
+    assert batch["accepted"] == 2 and batch["spooled"] == 2
+    assert client.get("/stats/ingest").json()["wal_active"] is True
+
+    redis_server.connected = True
+    # the WAL still holds older entries, so this one queues up behind them
+    assert client.post("/forward", json={"event_id": "after"}).json()["spooled"] is True
+
+    wait_for(lambda: not client.get("/stats/ingest").json()["wal_active"])
+    assert client.post("/forward", json={"event_id": "direct"}).json() == {"status": "accepted", "event_id": "direct"}
+    entries = stream.xrange(redis_forwarder.STREAM_KEY)
+    assert [fields["event_id"] for _, fields in entries] == ["before", "down-1", "down-2", "down-3", "after", "direct"]
+    assert json.loads(entries[1][1]["payload"]) == {"event_id": "down-1"}
+    stats = client.get("/stats/ingest").json()
+    assert stats["wal_drained"] == 4 and stats["wal_pending_bytes"] == 0
+
+
+def test_outage_without_room_to_spill_is_503_with_retry_after(client, redis_server, monkeypatch):
+    monkeypatch.setattr(redis_forwarder.wal, "max_bytes", 0)
+    redis_server.connected = False
+    for response in (client.post("/forward", json={"event_id": "x"}),
+                     client.post("/forward/batch", json=[{"event_id": "y"}])):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(redis_forwarder.RETRY_AFTER_SECONDS)
+
+
+def test_queue_past_high_water_is_429(client, monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "INGEST_HIGH_WATER", 100)
+    monkeypatch.setattr(redis_forwarder.xadd_batcher, "depth", 100)
+    response = client.post("/forward/batch", json=[{"event_id": "z"}])
+    assert response.status_code == 429 and "Retry-After" in response.headers
+    monkeypatch.setattr(redis_forwarder.xadd_batcher, "depth", 99)
+    assert client.post("/forward", json={"event_id": "z"}).status_code == 200
+
+
+def test_each_worker_claims_its_own_wal_directory(tmp_path):
+    base = str(tmp_path / "wal")
+    first, first_lock = claim_directory(base, 2)
+    second, _ = claim_directory(base, 2)
+    assert first == base and second == os.path.join(base, "worker-1")
+    with pytest.raises(OSError):
+        claim_directory(base, 2)
+    # a restarted worker takes over the directory of the one that exited
+    first_lock.close()
+    assert claim_directory(base, 2)[0] == base
+
+
+def test_a_worker_adopts_the_wal_directories_of_exited_workers(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    base = str(tmp_path / "wal")
+    # ran with four workers; 1 and 3 left segments behind, 2 is still shutting down
+    SegmentedWal(base).append([("s", {"n": "0"})])
+    for worker in (1, 2, 3):
+        SegmentedWal(os.path.join(base, f"worker-{worker}")).append([("s", {"n": str(worker)})])
+    with open(os.path.join(base, "worker-2.lock"), "a") as live:
+        fcntl.flock(live, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        directory, lock = claim_directory(base, 1)
+        assert adopt_orphans(base, directory) == 2
+
+    wal = SegmentedWal(directory)
+    replayed = [fields[b"n"] for path in wal.sealed() for _, _, fields in decode_records(wal.read(path))]
+    assert replayed == [b"0", b"1", b"3"]
+    assert not os.path.exists(os.path.join(base, "worker-1")) and not os.path.exists(os.path.join(base, "worker-3"))
+    assert os.listdir(os.path.join(base, "worker-2"))
+    lock.close()
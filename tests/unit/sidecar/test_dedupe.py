@@ -0,0 +1,110 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import redis_forwarder
+from dedupe import RedisBloomFilter, RotatingBloomFilter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = RotatingBloomFilter(capacity=20000, error_rate=1e-3, ttl=3600)
+    for i in range(20000):
+        bloom.add(f"seen-{i}")
+    assert all(bloom.contains(f"seen-{i}") for i in range(20000))
+
+    false_positives = sum(bloom.contains(f"new-{i}") for i in range(50000))
+    assert false_positives / 50000 < 3e-3
+
+
+def test_measured_false_positive_rate_meets_the_target():
+    # tight enough that blocking matters: sized like a plain Bloom filter, this gives ~3e-5
+    bloom = RotatingBloomFilter(capacity=20000, error_rate=2e-5, ttl=3600)
+    for i in range(20000):
+        bloom.add(f"seen-{i}")
+    probes = 1_000_000
+    false_positives = sum(bloom.contains(f"new-{i}") for i in range(probes))
+    assert false_positives / probes <= 2e-5
+
+
+def test_bloom_filter_forgets_ids_after_two_ttl_windows():
+    clock = FakeClock()
+    bloom = RotatingBloomFilter(capacity=1000, error_rate=1e-6, ttl=10, clock=clock)
+    bloom.add("a")
+    clock.now += 10  # rotated: "a" is in the previous generation
+    assert bloom.contains("a")
+    clock.now += 10
+    assert not bloom.contains("a")
+    assert bloom.rotations == 2
+
+
+def test_bloom_filter_rotates_early_at_capacity():
+    bloom = RotatingBloomFilter(capacity=100, error_rate=1e-6, ttl=3600)
+    for i in range(250):
+        bloom.add(f"id-{i}")
+    assert bloom.rotations == 2
+    assert bloom.contains("id-249") and bloom.contains("id-150")
+
+
+def test_redis_bloom_filter_shares_ids_between_replicas():
+    server = fakeredis.FakeServer()
+    clock = FakeClock()
+
+    async def scenario():
+        one = RedisBloomFilter(fakeredis.aioredis.FakeRedis(server=server), "logs:stream:dedupe", 1000, 1e-6, 10, clock)
+        two = RedisBloomFilter(fakeredis.aioredis.FakeRedis(server=server), "logs:stream:dedupe", 1000, 1e-6, 10, clock)
+        await one.add_many(["a", "b"])
+        first = await two.contains_many(["a", "b", "c"])
+        clock.now += 10
+        second = await two.contains_many(["a"])
+        clock.now += 10
+        third = await two.contains_many(["a"])
+        return first, second, third
+
+    assert asyncio.run(scenario()) == ([True, True, False], [True], [False])
+    assert 0 < fakeredis.FakeRedis(server=server).ttl("logs:stream:dedupe:100") <= 21
+
+
+def test_repeated_event_id_is_skipped(client, stream):
+    assert client.post("/forward", json={"event_id": "e1"}).json() == {"status": "accepted", "event_id": "e1"}
+    assert client.post("/forward", json={"event_id": "e1"}).json() == {"status": "duplicate", "event_id": "e1"}
+    # records without their own event_id are never duplicates
+    client.post("/forward", json={"message": "x"})
+    client.post("/forward", json={"message": "x"})
+    assert stream.xlen(redis_forwarder.STREAM_KEY) == 3
+
+
+def test_batch_skips_duplicates_and_reports_them(client, stream):
+    # metrics are per process, so other tests' duplicates are in there too
+    before = client.get("/stats/ingest").json()["dedupe"]["duplicates"]
+    client.post("/forward", json={"event_id": "e1"})
+    body = client.post("/forward/batch", json=[{"event_id": "e1"}, {"event_id": "e2"}, {"event_id": "e2"}]).json()
+    assert body["accepted"] == 3 and body["duplicates"] == 2
+    assert body["event_ids"] == ["e1", "e2", "e2"]
+    assert [fields["event_id"] for _, fields in stream.xrange(redis_forwarder.STREAM_KEY)] == ["e1", "e2"]
+
+    dedupe = client.get("/stats/ingest").json()["dedupe"]
+    assert dedupe["mode"] == "memory" and dedupe["duplicates"] == before + 2
+    assert 'sidecar_records_total{endpoint="/forward/batch",outcome="duplicate"}' in client.get("/metrics").text
+
+
+@pytest.fixture
+def redis_dedupe(monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "DEDUPE", "redis")
+
+
+def test_redis_dedupe_fails_open_when_redis_is_down(redis_dedupe, client, redis_server):
+    client.post("/forward", json={"event_id": "e1"})
+    assert client.post("/forward", json={"event_id": "e1"}).json()["status"] == "duplicate"
+
+    redis_server.connected = False
+    response = client.post("/forward", json={"event_id": "e2"})
+    assert response.status_code == 200 and response.json()["spooled"] is True
@@ -0,0 +1,70 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import entry_codec
+import redis_forwarder
+from entry_size_report import size_report
+
+pytest.importorskip("msgpack")
+
+RECORD = {
+    "event_id": "e-1",
+    "timestamp": "2024-01-01T00:00:00",
+    "session_id": "s-1",
+    "source": "api",
+    "level": "ERROR",
+    "message": "boom " * 20,
+    "context": {"user": 7, "tags": ["a", "b"]},
+}
+
+
+@pytest.mark.parametrize("compression", entry_codec.COMPRESSIONS)
+def test_compact_entries_round_trip_and_are_smaller(compression):
+    _, fields = redis_forwarder.stream_entry(RECORD)
+    legacy = entry_codec.encode_json(fields, RECORD)
+    compact = entry_codec.encode_compact({k: v for k, v in fields.items() if k != "payload"}, RECORD, compression)
+
+    assert compact["v"] == "2" and isinstance(compact["payload"], bytes)
+    assert entry_codec.decode_entry(compact) == RECORD
+    assert entry_codec.decode_entry(legacy) == RECORD
+    assert entry_codec.entry_size(compact) < entry_codec.entry_size(legacy)
+
+
+def test_fields_that_differ_from_the_record_are_kept_in_the_payload():
+    record = {"request_id": "r-9", "message": "no event_id, session from request_id"}
+    _, fields = redis_forwarder.stream_entry(record)
+    compact = entry_codec.encode_compact({k: v for k, v in fields.items() if k != "payload"}, record)
+    assert compact["m"] == "0"
+    # as read back by a client without decode_responses
+    raw = {key.encode(): value if isinstance(value, bytes) else value.encode() for key, value in compact.items()}
+    assert entry_codec.decode_entry(raw) == record
+
+
+@pytest.fixture
+def compact_zlib(monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "ENTRY_FORMAT", "compact")
+    monkeypatch.setattr(redis_forwarder, "ENTRY_COMPRESSION", "zlib")
+
+
+def test_forward_writes_compact_entries(compact_zlib, client, redis_server):
+    assert client.post("/forward", json=RECORD).status_code == 200
+    assert client.post("/forward/batch", json=[{"message": "second"}]).json()["accepted"] == 1
+
+    raw = fakeredis.FakeRedis(server=redis_server)
+    entries = raw.xrange(redis_forwarder.STREAM_KEY)
+    assert [fields[b"enc"] for _, fields in entries] == [b"msgpack+zlib"] * 2
+    assert entry_codec.decode_entry(entries[0][1]) == RECORD
+    assert entry_codec.decode_entry(entries[1][1])["message"] == "second"
+    assert client.get("/stats/stream").json()["length"] == 2
+
+
+def test_size_report_compares_formats(client, redis_server):
+    assert client.post("/forward/batch", json=[dict(RECORD, event_id=f"e-{i}") for i in range(20)]).status_code == 200
+
+    report = asyncio.run(size_report(fakeredis.aioredis.FakeRedis(server=redis_server), [redis_forwarder.STREAM_KEY], 10))
+    assert report["sampled"] == 10 and report["length"] == 20
+    sizes = report["bytes_per_event"]
+    assert sizes["stored"] == sizes["json"]
+    assert sizes["msgpack"] < sizes["json"]
@@ -0,0 +1,114 @@
+import asyncio
+import re
+import socket
+import time
+
+import fakeredis
+
+from metrics import Registry, serve_metrics
+import redis_forwarder
+from redis_forwarder import StreamRetention
+
+
+def sample(text, series):
+    """Value of one exposition line, e.g. ``sidecar_requests_total{endpoint="/forward",status="200"}``"""
+    match = re.search(rf"^{re.escape(series)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_histogram_buckets_are_cumulative_and_labels_escaped():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", (0.1, 1), ("path",))
+    counter = registry.counter("hits_total", "Hits", ("path",))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, path="/a")
+    counter.inc(path='say "hi"\n')
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="1.0"}') == 2
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="+Inf"}') == 3
+    assert sample(text, 'latency_seconds_sum{path="/a"}') == 5.55
+    assert sample(text, 'hits_total{path="say \\"hi\\"\\n"}') == 1
+
+
+def test_registry_labels_reach_every_series():
+    registry = Registry()
+    registry.counter("hits_total", "Hits", ("path",)).inc(path="/a")
+    registry.histogram("latency_seconds", "Latency", (1,)).observe(0.5)
+    registry.labels = {"worker": "2"}
+
+    text = registry.render()
+    assert sample(text, 'hits_total{path="/a",worker="2"}') == 1
+    assert sample(text, 'latency_seconds_bucket{worker="2",le="1.0"}') == 1
+    assert sample(text, 'latency_seconds_count{worker="2"}') == 1
+
+
+def test_serve_metrics_takes_the_first_free_port():
+    async def render():
+        return "up 1\n"
+
+    async def scenario():
+        taken = socket.socket()
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        with taken:
+            server, slot = await serve_metrics(render, "127.0.0.1", [taken.getsockname()[1], 0])
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+                writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+                response = await reader.read()
+                writer.close()
+        return slot, response
+
+    slot, response = asyncio.run(scenario())
+    assert slot == 1
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n") and response.endswith(b"\r\n\r\nup 1\n")
+
+
+def test_metrics_endpoint_reports_requests_pipelines_and_group_lag(client, stream):
+    before = redis_forwarder.requests_total.value(endpoint="/forward/batch", status="200")
+    records_before = redis_forwarder.records_total.value(endpoint="/forward/batch", outcome="accepted")
+    client.post("/forward/batch", json=[{"event_id": f"m{i}"} for i in range(5)])
+    client.post("/forward", content=b"{bad")
+    client.get("/no/such/path")
+    stream.xgroup_create(redis_forwarder.STREAM_KEY, "replayers", id="0")
+    stream.xreadgroup("replayers", "c1", {redis_forwarder.STREAM_KEY: ">"}, count=2)
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert sample(text, 'sidecar_requests_total{endpoint="/forward/batch",status="200"}') == before + 1
+    assert sample(text, 'sidecar_requests_total{endpoint="/forward",status="400"}') >= 1
+    assert sample(text, 'sidecar_requests_total{endpoint="other",status="404"}') >= 1
+    assert sample(text, 'sidecar_records_total{endpoint="/forward/batch",outcome="accepted"}') == records_before + 5
+    assert sample(text, "sidecar_xadd_pipeline_entries_count") >= 1
+    assert sample(text, 'sidecar_request_body_bytes_count{endpoint="/forward/batch"}') >= 1
+    key = redis_forwarder.STREAM_KEY
+    assert sample(text, f'sidecar_stream_length{{stream="{key}"}}') == 5
+    assert sample(text, f'sidecar_stream_group_lag{{stream="{key}",group="replayers"}}') == 3
+    assert sample(text, f'sidecar_stream_group_pending{{stream="{key}",group="replayers"}}') == 2
+    assert sample(text, "sidecar_redis_up") == 1
+
+
+def test_metrics_report_stream_memory_and_retention_trims(redis_server, client, stream, monkeypatch):
+    key = redis_forwarder.STREAM_KEY
+    old = int((time.time() - 2 * redis_forwarder.STREAM_RETENTION_SECONDS) * 1000)
+    for i in range(3):
+        stream.xadd(key, {"n": str(i)}, id=f"{old + i}-0")
+    client.post("/forward", json={"event_id": "fresh"})
+    before = redis_forwarder.trimmed_total.value(stream=key)
+
+    async def memory_usage(stream_key):  # fakeredis has no MEMORY command
+        return 1000 * await redis_forwarder.redis_client.xlen(stream_key)
+
+    monkeypatch.setattr(redis_forwarder.redis_client, "memory_usage", memory_usage)
+    trim_client = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+    retention = StreamRetention(trim_client, [key], redis_forwarder.STREAM_RETENTION_SECONDS, approximate=False)
+    asyncio.run(retention.trim_once())
+
+    text = client.get("/metrics").text
+    assert sample(text, f'sidecar_stream_trimmed_total{{stream="{key}"}}') == before + 3
+    assert sample(text, f'sidecar_stream_length{{stream="{key}"}}') == 1
+    assert sample(text, f'sidecar_stream_memory_bytes{{stream="{key}"}}') == 1000
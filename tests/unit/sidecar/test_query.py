@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+import redis_forwarder
+from redis_forwarder import StreamRetention
+from stream_index import StreamIndex, buckets_key, index_key, pad_id, unpad_id
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def post_events(client, events):
+    assert client.post("/forward/batch", json=events).json()["accepted"] == len(events)
+    # indexing follows the XADD pipeline, after the response
+    wait_for(lambda: not redis_forwarder.xadd_batcher._flushes)
+
+
+def query(client, **params):
+    response = client.get("/query", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_pad_id_keeps_stream_order():
+    ids = ["99-0", "100-2", "100-10", "1714564800000-0"]
+    assert sorted(ids, key=pad_id) == ids
+    assert sorted(pad_id(entry_id) for entry_id in ids) == [pad_id(entry_id) for entry_id in ids]
+
+
+def test_query_intersects_level_and_source(client, stream):
+    events = [
+        {"n": n, "level": ("ERROR", "INFO")[n % 2], "source": ("juice-proxy", "checkout")[n % 3 == 0]}
+        for n in range(30)
+    ]
+    post_events(client, events)
+
+    body = query(client, level="ERROR", source="juice-proxy")
+    expected = [e["n"] for e in events if e["level"] == "ERROR" and e["source"] == "juice-proxy"]
+    assert [entry["record"]["n"] for entry in body["entries"]] == expected
+    assert body["next_cursor"] is None
+    assert len(query(client, level="INFO")["entries"]) == 15
+    assert query(client, source="nobody")["entries"] == []
+
+
+def test_query_pages_with_a_cursor(client, stream):
+    post_events(client, [{"n": n, "level": "WARN"} for n in range(7)])
+    seen, cursor = [], None
+    while True:
+        body = query(client, level="WARN", limit=3, **({"cursor": cursor} if cursor else {}))
+        seen += [entry["record"]["n"] for entry in body["entries"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(7))
+
+    unfiltered = query(client, limit=5)
+    assert len(unfiltered["entries"]) == 5 and unfiltered["next_cursor"]
+    rest = query(client, limit=5, cursor=unfiltered["next_cursor"])
+    assert [entry["record"]["n"] for entry in rest["entries"]] == [5, 6] and rest["next_cursor"] is None
+
+
+def test_query_time_bounds_use_stream_ids(client, stream):
+    post_events(client, [{"n": 1, "level": "ERROR"}])
+    now = time.time()
+    assert query(client, level="ERROR", start=str(now - 60))["entries"]
+    assert query(client, level="ERROR", end=str(now - 60))["entries"] == []
+    iso = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + 60))
+    assert query(client, level="ERROR", start=iso)["entries"] == []
+
+
+@pytest.fixture
+def three_shards(monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "STREAM_SHARDS", 3)
+
+
+def test_query_merges_shards_in_id_order(three_shards, client, stream):
+    post_events(client, [{"n": n, "session_id": f"s{n}", "level": "ERROR"} for n in range(12)])
+    seen, cursor = [], None
+    while True:
+        body = query(client, level="ERROR", limit=5, **({"cursor": cursor} if cursor else {}))
+        seen += [(entry["id"], entry["stream"]) for entry in body["entries"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 12 and len({stream_key for _, stream_key in seen}) > 1
+    assert seen == sorted(seen, key=lambda item: pad_id(item[0]))
+
+
+def test_query_rejects_bad_parameters(client):
+    assert client.get("/query", params={"cursor": "nope"}).status_code == 400
+    assert client.get("/query", params={"start": "yesterday"}).status_code == 400
+    assert client.get("/query", params={"limit": 0}).status_code == 400
+
+
+def test_index_buckets_expire_after_retention_and_skip_trimmed_entries():
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server)
+    index = StreamIndex(client, retention=3600, page_size=2)
+    hour = int(time.time()) // 3600
+
+    async def scenario():
+        entries = []
+        for n in range(5):
+            fields = {"level": "ERROR", "source": "a" if n % 2 else "b"}
+            entry_id = await client.xadd("s", fields, id=f"{hour * 3600000 + n}-0")
+            entries.append(("s", entry_id.decode(), fields))
+        await index.add_many(entries)
+        await client.xdel("s", f"{hour * 3600000 + 1}-0")
+        return await index.query(["s"], {"level": "ERROR", "source": "a"}, 0, 10 ** 13)
+
+    found, cursor = asyncio.run(scenario())
+    assert [entry_id for _, entry_id, _ in found] == [f"{hour * 3600000 + 3}-0"] and cursor is None
+    # one bucket, kept for the retention past the end of its hour
+    expire_at = fakeredis.FakeRedis(server=server).expiretime(index_key("s", "level", "ERROR", hour))
+    assert expire_at == (hour + 1) * 3600 + 3600
+
+
+def test_trimmer_drops_index_members_of_trimmed_entries():
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    index = StreamIndex(client, retention=24 * 3600)
+    hour = int(time.time()) // 3600
+    ids = [f"{(hour - 1) * 3600000 + n}-0" for n in range(3)] + [f"{hour * 3600000 + n}-0" for n in range(3)]
+
+    async def scenario():
+        for entry_id in ids:
+            await client.xadd("s", {"level": "ERROR"}, id=entry_id)
+        await index.add_many([("s", entry_id, {"level": "ERROR"}) for entry_id in ids])
+        # MAXLEN, not retention, trimmed these: the trimmer still follows the stream's first entry
+        await client.xtrim("s", maxlen=2, approximate=False)
+        await StreamRetention(client, ["s"], retention=0, index=index).trim_once()
+
+    asyncio.run(scenario())
+    view = fakeredis.FakeRedis(server=server, decode_responses=True)
+    assert not view.exists(index_key("s", "level", "ERROR", hour - 1))
+    assert [unpad_id(member) for member in view.zrange(index_key("s", "level", "ERROR", hour), 0, -1)] == ids[-2:]
+    assert view.zrange(buckets_key("s"), 0, -1) == [index_key("s", "level", "ERROR", hour)]
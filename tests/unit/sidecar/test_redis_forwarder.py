@@ -0,0 +1,125 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+import redis_forwarder
+
+
+def test_forward_adds_one_stream_entry(client, stream):
+    response = client.post("/forward", json={"event_id": "e1", "level": "ERROR", "source": "api", "session_id": "s1"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "accepted", "event_id": "e1"}
+
+    (_, fields), = stream.xrange(redis_forwarder.STREAM_KEY)
+    assert fields["event_id"] == "e1"
+    assert fields["level"] == "ERROR"
+    assert json.loads(fields["payload"])["source"] == "api"
+
+
+def test_invalid_json_is_rejected(client):
+    response = client.post("/forward", content=b"{not json", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert client.post("/forward", content=b"[1, 2]").status_code == 400
+    assert client.post("/forward", content='{"m": "caf\u00e9"}'.encode("latin-1")).status_code == 400
+
+
+@pytest.mark.parametrize("passthrough", [True, False])
+def test_payload_is_the_request_body_in_passthrough_mode(client, stream, monkeypatch, passthrough):
+    monkeypatch.setattr(redis_forwarder, "PAYLOAD_PASSTHROUGH", passthrough)
+    body = '{ "event_id": "p1",  "source": "api", "message": "caf\u00e9" }'.encode()
+    assert client.post("/forward", content=body).status_code == 200
+
+    (_, fields), = stream.xrange(redis_forwarder.STREAM_KEY)
+    assert fields["source"] == "api"
+    assert (fields["payload"] == body.decode()) is passthrough
+    assert json.loads(fields["payload"]) == json.loads(body)
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", lambda body: gzip.compress(body)),
+    ("deflate", zlib.compress),
+])
+def test_compressed_bodies_are_decoded(client, stream, encoding, compress):
+    body = json.dumps({"event_id": "z1", "message": "x" * 5000}).encode()
+    response = client.post("/forward", content=compress(body), headers={"Content-Encoding": encoding})
+    assert response.status_code == 200
+    assert stream.xlen(redis_forwarder.STREAM_KEY) == 1
+
+
+def test_zstd_body_is_decoded(client, stream):
+    zstandard = pytest.importorskip("zstandard")
+    body = json.dumps({"event_id": "z2"}).encode()
+    response = client.post("/forward", content=zstandard.ZstdCompressor().compress(body), headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 200
+
+
+def test_unknown_or_oversized_encoding_is_rejected(client, monkeypatch):
+    assert client.post("/forward", content=b"{}", headers={"Content-Encoding": "br"}).status_code == 415
+    monkeypatch.setattr(redis_forwarder, "MAX_BODY_BYTES", 100)
+    bomb = gzip.compress(json.dumps({"pad": "x" * 10000}).encode())
+    assert client.post("/forward", content=bomb, headers={"Content-Encoding": "gzip"}).status_code == 413
+
+
+def test_batch_accepts_json_array_in_one_pipeline(client, stream):
+    records = [{"event_id": f"b{i}", "level": "INFO", "source": "api"} for i in range(3)]
+    response = client.post("/forward/batch", json=records)
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": "accepted", "accepted": 3, "failed": 0, "event_ids": ["b0", "b1", "b2"], "errors": [],
+    }
+    entries = stream.xrange(redis_forwarder.STREAM_KEY)
+    assert [fields["event_id"] for _, fields in entries] == ["b0", "b1", "b2"]
+
+
+def test_batch_accepts_ndjson_and_reports_bad_records(client, stream):
+    body = b'{"event_id": "n0"}\n{broken\n\n[1, 2]\n{"source": "worker"}\n'
+    response = client.post("/forward/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["status"] == "partial"
+    assert result["accepted"] == 2 and result["failed"] == 2
+    assert result["event_ids"][0] == "n0"
+    assert result["event_ids"][1] is None and result["event_ids"][2] is None
+    assert result["event_ids"][3]  # generated
+    assert [error["index"] for error in result["errors"]] == [1, 2]
+    assert stream.xlen(redis_forwarder.STREAM_KEY) == 2
+
+
+def test_batch_rejects_bodies_that_are_not_utf8(client, stream):
+    response = client.post("/forward/batch", content=b'[{"message": "caf\xe9"}]')
+    assert response.status_code == 400
+
+    body = b'{"event_id": "u0"}\n{"message": "caf\xe9"}\n'
+    result = client.post("/forward/batch", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    assert result["accepted"] == 1 and result["failed"] == 1
+    assert [error["index"] for error in result["errors"]] == [1]
+    assert result["errors"][0]["error"].startswith("Invalid JSON")
+
+
+def test_batch_takes_event_ids_that_are_not_strings(client, stream):
+    records = [{"event_id": [1]}, {"event_id": {"k": "v"}}, {"event_id": [1]}, {"event_id": 7}]
+    result = client.post("/forward/batch", json=records).json()
+    assert result["event_ids"] == ["[1]", "{'k': 'v'}", "[1]", "7"]
+    assert result["accepted"] == 4 and result["failed"] == 0
+    assert [fields["event_id"] for _, fields in stream.xrange(redis_forwarder.STREAM_KEY)] == ["[1]", "{'k': 'v'}", "7"]
+
+
+def test_null_indexed_fields_get_their_defaults(client, stream):
+    records = [{"event_id": "a"}, {"event_id": "b", "source": None, "level": None, "session_id": None}, {"event_id": "c"}]
+    body = client.post("/forward/batch", json=records).json()
+    assert body["accepted"] == 3 and body["failed"] == 0
+    assert client.post("/forward", json={"event_id": "d", "level": None, "timestamp": None}).status_code == 200
+
+    entries = {fields["event_id"]: fields for _, fields in stream.xrange(redis_forwarder.STREAM_KEY)}
+    assert sorted(entries) == ["a", "b", "c", "d"]
+    assert entries["b"]["source"] == "unknown" and entries["b"]["level"] == "INFO" and entries["b"]["session_id"] == ""
+    assert entries["d"]["level"] == "INFO" and entries["d"]["timestamp"]
+
+
+def test_batch_with_no_usable_record_is_rejected(client, stream):
+    assert client.post("/forward/batch", content=b"[1, 2]").status_code == 400
+    assert client.post("/forward/batch", content=b"[not json").status_code == 400
+    assert client.post("/forward/batch", content=b"").json()["accepted"] == 0
+    assert stream.xlen(redis_forwarder.STREAM_KEY) == 0
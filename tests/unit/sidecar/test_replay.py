@@ -0,0 +1,101 @@
+import asyncio
+import random
+import time
+
+import fakeredis
+import pytest
+
+import redis_forwarder
+from replay import Replayer, http_request
+
+httpx = pytest.importorskip("httpx")
+
+KEY = "logs:stream"
+
+
+def nginx_record(session, n, **extra):
+    return dict({
+        "timestamp": f"2024-05-01T12:00:{n:02d}+00:00", "source": "juice-proxy", "level": "INFO",
+        "method": "POST" if n % 2 else "GET", "path": f"/api/{session}/{n}", "status": 200,
+        "user_agent": "curl/8", "ip": "10.0.0.1", "request_body": '{"n": %d}' % n if n % 2 else "",
+        "session_id": session,
+    }, **extra)
+
+
+def add(stream, record):
+    _, fields = redis_forwarder.stream_entry(record)
+    return stream.xadd(KEY, fields)
+
+
+def replayer(redis_server, handler, **kwargs):
+    client = fakeredis.aioredis.FakeRedis(server=redis_server)
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    kwargs.setdefault("block_ms", 20)
+    return Replayer(client, "http://target", [KEY], consumer="c1", http_client=http, **kwargs)
+
+
+def test_http_request_from_nginx_record():
+    method, path, headers, body = http_request(nginx_record("s", 1))
+    assert (method, path, body) == ("POST", "/api/s/1", b'{"n": 1}')
+    assert headers == {"User-Agent": "curl/8", "Content-Type": "application/json"}
+    assert http_request(nginx_record("s", 2))[3] is None
+    assert http_request({"level": "INFO", "message": "not a request"}) is None
+
+
+def test_max_mode_keeps_session_order_and_acks_everything(redis_server, stream):
+    for n in range(6):
+        for session in ("a", "b", "c"):
+            add(stream, nginx_record(session, n, status=404 if (session, n) == ("b", 3) else 200))
+    add(stream, {"level": "INFO", "message": "app log, not a request"})
+    seen = []
+
+    async def handler(request):
+        await asyncio.sleep(random.random() / 200)
+        seen.append(request.url.path)
+        assert request.headers["X-Replay-Event-Id"]
+        return httpx.Response(200)
+
+    stats = asyncio.run(replayer(redis_server, handler, concurrency=8).run(until_idle=True))
+    assert stats["replayed"] == 18 and stats["skipped"] == 1 and stats["failed"] == 0
+    assert stats["status_mismatch"] == 1
+    for session in ("a", "b", "c"):
+        assert [path for path in seen if path.startswith(f"/api/{session}/")] == [f"/api/{session}/{n}" for n in range(6)]
+    assert stream.xpending(KEY, "replay")["pending"] == 0
+
+
+def test_timed_mode_keeps_recorded_gaps_scaled_by_speed(redis_server, stream):
+    for n in (0, 1, 3):  # seconds apart in the recording
+        add(stream, nginx_record("s", n))
+    sent = []
+
+    async def handler(request):
+        sent.append(time.monotonic())
+        return httpx.Response(200)
+
+    stats = asyncio.run(replayer(redis_server, handler, mode="timed", speed=20).run(until_idle=True))
+    assert stats["replayed"] == 3
+    gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    assert gaps[0] == pytest.approx(0.05, abs=0.03) and gaps[1] == pytest.approx(0.1, abs=0.03)
+
+
+def test_stuck_entries_are_claimed_and_failures_retried_then_abandoned(redis_server, stream):
+    add(stream, nginx_record("s", 0))
+    add(stream, nginx_record("t", 0, path="/down"))
+    stream.xgroup_create(KEY, "replay", id="0")
+    stream.xreadgroup("replay", "dead-consumer", {KEY: ">"})  # delivered, never acknowledged
+    time.sleep(0.06)
+
+    async def handler(request):
+        if request.url.path == "/down":
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(200)
+
+    stats = asyncio.run(replayer(redis_server, handler, claim_idle_ms=50).run(until_idle=True))
+    assert stats["claimed"] == 2 and stats["replayed"] == 1 and stats["failed"] == 1
+    (pending,) = stream.xpending_range(KEY, "replay", "-", "+", 10)
+    assert pending["consumer"] == "c1"
+
+    # a restarted c1 retries its own pending entry first
+    stats = asyncio.run(replayer(redis_server, handler, claim_idle_ms=50, max_attempts=1).run(until_idle=True))
+    assert stats["failed"] == 1 and stats["abandoned"] == 1
+    assert stream.xpending(KEY, "replay")["pending"] == 0
@@ -0,0 +1,55 @@
+import asyncio
+import json
+from collections import defaultdict
+
+import fakeredis
+import pytest
+
+import redis_forwarder
+from stream_reader import discover_streams, merged_range
+
+
+@pytest.fixture
+def four_shards(monkeypatch):
+    monkeypatch.setattr(redis_forwarder, "STREAM_SHARDS", 4)
+
+
+def test_sessions_stay_on_one_shard_and_map_is_published(four_shards, client, stream):
+    records = [{"session_id": f"s{i % 10}", "sequence": i} for i in range(100)]
+    assert client.post("/forward/batch", json=records).json()["accepted"] == 100
+
+    shard_map = stream.hgetall(f"{redis_forwarder.STREAM_KEY}:shards")
+    keys = json.loads(shard_map["keys"])
+    assert shard_map["count"] == "4" and len(keys) == 4
+
+    sessions = defaultdict(set)
+    for key in keys:
+        for _, fields in stream.xrange(key):
+            payload = json.loads(fields["payload"])
+            sessions[payload["session_id"]].add(key)
+    assert len(sessions) == 10
+    assert all(len(shards) == 1 for shards in sessions.values())
+    assert len(set().union(*sessions.values())) > 1  # actually spread out
+    assert client.get("/stats/stream").json()["length"] == 100
+
+
+def test_merged_range_orders_entries_across_shards(redis_server, stream):
+    ids = {}
+    for n, key in enumerate(["a", "b", "c", "a", "c", "c", "b"]):
+        ids[n] = stream.xadd(key, {"n": str(n)}, id=f"{1000 + n}-0")
+    stream.hset("logs:stream:shards", mapping={"count": 3, "keys": json.dumps(["a", "b", "c"])})
+
+    async def run():
+        client = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+        keys = await discover_streams(client, "logs:stream")
+        return keys, [entry async for entry in merged_range(client, keys, page_size=1)]
+
+    keys, merged = asyncio.run(run())
+    assert keys == ["a", "b", "c"]
+    assert [fields["n"] for _, _, fields in merged] == [str(n) for n in range(7)]
+    assert [entry_id for _, entry_id, _ in merged] == [ids[n] for n in range(7)]
+
+
+def test_unsharded_stream_is_discovered_as_itself(redis_server):
+    client = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+    assert asyncio.run(discover_streams(client, "logs:stream")) == ["logs:stream"]
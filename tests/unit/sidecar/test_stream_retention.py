@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import fakeredis
+
+import redis_forwarder
+from redis_forwarder import StreamRetention, stream_id_at
+
+
+def test_stream_id_at_matches_generated_ids(stream):
+    before = stream_id_at(time.time())
+    entry_id = stream.xadd("s", {"a": "b"})
+    assert int(before.split("-")[0]) <= int(entry_id.split("-")[0])
+
+
+def test_trim_drops_entries_older_than_retention(redis_server, stream):
+    old = int((time.time() - 7200) * 1000)
+    for i in range(5):
+        stream.xadd("s", {"n": str(i)}, id=f"{old + i}-0")
+    stream.xadd("s", {"n": "fresh"})
+
+    async def run():
+        client = fakeredis.aioredis.FakeRedis(server=redis_server, decode_responses=True)
+        retention = StreamRetention(client, ["s"], retention=3600, approximate=False)
+        removed = await retention.trim_once()
+        return removed, await retention.stats()
+
+    removed, stats = asyncio.run(run())
+    assert removed == 5
+    assert stats["trimmed_by_retention"] == 5
+    assert stats["length"] == 1
+    assert stats["entries_removed"] == 5
+    assert [fields["n"] for _, fields in stream.xrange("s")] == ["fresh"]
+
+
+def test_stream_stats_endpoint(client):
+    assert client.get("/stats/stream").json()["length"] == 0
+    client.post("/forward", json={"event_id": "e1"})
+    stats = client.get("/stats/stream").json()
+    assert stats["stream"] == redis_forwarder.STREAM_KEY
+    assert stats["length"] == 1
+    assert "memory_bytes" in stats
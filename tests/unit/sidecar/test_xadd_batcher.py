@@ -0,0 +1,101 @@
+import asyncio
+
+import fakeredis
+import pytest
+import redis
+
+from redis_forwarder import XaddBatcher
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """Fake Redis that counts pipelines (one round trip each)"""
+
+    pipelines = 0
+
+    def pipeline(self, *args, **kwargs):
+        type(self).pipelines += 1
+        return super().pipeline(*args, **kwargs)
+
+
+@pytest.fixture
+def counting_client(redis_server):
+    CountingRedis.pipelines = 0
+    return CountingRedis(server=redis_server, decode_responses=True)
+
+
+def test_concurrent_adds_share_one_pipeline(counting_client, stream):
+    async def run():
+        batcher = XaddBatcher(counting_client, "s", linger=0.01, max_batch=100)
+        ids = await asyncio.gather(*(batcher.add({"n": str(i)}) for i in range(50)))
+        await batcher.close()
+        return ids
+
+    ids = asyncio.run(run())
+    assert CountingRedis.pipelines == 1
+    assert [entry_id for entry_id, _ in stream.xrange("s")] == ids
+    assert [fields["n"] for _, fields in stream.xrange("s")] == [str(i) for i in range(50)]
+
+
+def test_max_batch_flushes_without_waiting_for_linger(counting_client, stream):
+    async def run():
+        batcher = XaddBatcher(counting_client, "s", linger=60, max_batch=100)
+        await asyncio.wait_for(asyncio.gather(*(batcher.add({"n": "x"}) for i in range(200))), 5)
+        return batcher
+
+    asyncio.run(run())
+    assert CountingRedis.pipelines == 2
+    assert stream.xlen("s") == 200
+
+
+def test_pipeline_failure_reaches_every_waiting_request():
+    class DownPipeline:
+        def xadd(self, *args, **kwargs):
+            pass
+
+        async def execute(self, raise_on_error=True):
+            raise redis.ConnectionError("connection refused")
+
+    class DownRedis:
+        def pipeline(self, transaction=True):
+            return DownPipeline()
+
+    async def run():
+        batcher = XaddBatcher(DownRedis(), "s", linger=0)
+        return await asyncio.gather(batcher.add({}), batcher.add({}), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, redis.ConnectionError) for result in results)
+
+
+def test_entry_redis_py_cannot_encode_fails_alone(counting_client, stream):
+    async def run():
+        batcher = XaddBatcher(counting_client, "s", linger=0.01)
+        return await asyncio.gather(
+            batcher.add({"n": "1"}), batcher.add({"n": None}), batcher.add({"n": "3"}), return_exceptions=True
+        )
+
+    first, bad, last = asyncio.run(run())
+    assert isinstance(bad, redis.DataError)
+    assert [entry_id for entry_id, _ in stream.xrange("s")] == [first, last]
+
+
+def test_every_xadd_carries_approximate_maxlen():
+    calls = []
+
+    class RecordingPipeline:
+        def xadd(self, name, fields, **kwargs):
+            calls.append(kwargs)
+
+        async def execute(self, raise_on_error=True):
+            return ["1-0"] * len(calls)
+
+    class RecordingRedis:
+        def pipeline(self, transaction=True):
+            return RecordingPipeline()
+
+    async def run():
+        batcher = XaddBatcher(RecordingRedis(), "s", linger=0, maxlen=1000)
+        await batcher.add({})
+
+    asyncio.run(run())
+    assert calls == [{"maxlen": 1000, "approximate": True}]